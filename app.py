@@ -1,14 +1,318 @@
 #!/usr/bin/env python3
 from flask import Flask, render_template, request, jsonify, send_file, session
+from werkzeug.http import is_resource_modified
 import os
+import json
+import atexit
+import hashlib
+import queue
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from video_tracker import VideoTracker, find_videos
+from video_tracker import CONNECTION_HOOKS, MAX_PROGRESS_MS, SCAN_HOOKS, VideoTracker
+from events import EventBroker
+from library_watcher import create_watcher
+from media_probe import create_prober
+from path_status import PathStatusCache, PATH_CHECK_WAIT, PATH_MISSING, PATH_OK, PATH_UNREACHABLE
+from folder_browser import FolderBrowser, BROWSE_PAGE_SIZE
+from catalog import VideoCatalog
+from compression import EncodedResponseCache, gzip_stream, negotiate_encoding
+from metrics import (CONTENT_TYPE as METRICS_CONTENT_TYPE, DB_OPERATION_DURATION, HTTP_REQUEST_DURATION,
+                     METRICS_ENABLED, STREAM_BYTES, GaugeFunction, instrument_methods,
+                     render as render_metrics)
+from profiling import PROFILE_TOKEN, PROFILING_ENABLED, ProfileStore, RequestProfiler, SlowOpTracer
 import mimetypes
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'
 
+# Prometheus metrics (METRICS=on): every VideoTracker call is timed per method
+if METRICS_ENABLED:
+    instrument_methods(VideoTracker, DB_OPERATION_DURATION)
+
+# On-demand profiling (PROFILING=on): single requests under cProfile, and a
+# log of slow VideoTracker calls (with their query plans) and library walks
+if PROFILING_ENABLED:
+    profile_store = ProfileStore()
+    request_profiler = RequestProfiler(profile_store)
+    slow_ops = SlowOpTracer(profile_store, explain=lambda sql: tracker.explain_query_plan(sql))
+    slow_ops.instrument(VideoTracker, exclude=('explain_query_plan', 'close'))
+    CONNECTION_HOOKS.append(slow_ops.connection_hook)
+    SCAN_HOOKS.append(slow_ops.scan_hook)
+
 tracker = VideoTracker()
+atexit.register(tracker.close)
+
+# Server-sent events: progress saves are pushed to every open session, and
+# the library watcher (LIBRARY_WATCH) publishes index changes for the
+# folders in the history. With several worker processes (EVENT_RELAY=1, set
+# by serve.py) events are relayed through the database, and only one worker
+# runs the watcher.
+EVENT_RELAY = os.getenv('EVENT_RELAY', '0') == '1'
+
+events = EventBroker(store=tracker if EVENT_RELAY else None)
+watcher = create_watcher(
+    tracker, events,
+    root_source=lambda: [folder['path'] for folder in tracker.get_folder_history()],
+    lock_path=tracker.db_path + '.watcher.lock' if EVENT_RELAY else None
+)
+if watcher:
+    atexit.register(watcher.close)
+atexit.register(events.close)
+
+# Video streams (whole files and ranges) in progress in this process;
+# background probing slows down while any are active
+active_streams = 0
+active_streams_lock = threading.Lock()
+
+# Background probe of container headers, so unwatched videos have a duration
+prober = create_prober(
+    tracker, events,
+    is_streaming=lambda: active_streams > 0,
+    lock_path=tracker.db_path + '.probe.lock' if EVENT_RELAY else None
+)
+if prober:
+    atexit.register(prober.close)
+
+# Whether history folders still exist, checked in the background so a slow
+# or dead network mount can't stall the page
+path_status = PathStatusCache()
+atexit.register(path_status.close)
+path_status.refresh(folder['path'] for folder in tracker.get_folder_history(check_exists=False))
+
+# Cached directory listings for the folder picker
+browser = FolderBrowser()
+
+# Listing bodies (raw and compressed) by ETag, so unchanged listings are
+# served without touching the database
+response_cache = EncodedResponseCache()
+
+if METRICS_ENABLED:
+    GaugeFunction('watchmarker_active_streams', "Video streams in progress (whole files and ranges)", lambda: active_streams)
+    
+    @app.before_request
+    def start_request_timer():
+        request.environ['watchmarker.start'] = time.perf_counter()
+    
+    @app.after_request
+    def observe_request(response):
+        start = request.environ.get('watchmarker.start')
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else '<unmatched>'
+            HTTP_REQUEST_DURATION.labels(route, request.method, str(response.status_code)).observe(
+                time.perf_counter() - start)
+        return response
+    
+    @app.route('/metrics')
+    def get_metrics():
+        """Prometheus metrics for this process"""
+        return app.response_class(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+if PROFILING_ENABLED:
+    def profiling_authorized():
+        """Whether the request carries PROFILE_TOKEN (when one is set)"""
+        return not PROFILE_TOKEN or secrets.compare_digest(request.headers.get('X-Profile-Token', ''), PROFILE_TOKEN)
+    
+    @app.before_request
+    def start_request_profile():
+        # Profile requests sent with "X-Profile: 1", or armed through /api/profiles
+        if request.path.startswith('/api/profiles'):
+            return
+        requested = request.headers.get('X-Profile') == '1' and profiling_authorized()
+        profile = request_profiler.start(request.path, requested)
+        if profile is not None:
+            request.environ['watchmarker.profile'] = (profile, time.perf_counter())
+    
+    def finish_request_profile(status):
+        profile, start = request.environ.pop('watchmarker.profile')
+        return request_profiler.stop(profile, {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': status,
+            'ms': round((time.perf_counter() - start) * 1000, 3)
+        })
+    
+    @app.after_request
+    def store_request_profile(response):
+        if 'watchmarker.profile' in request.environ:
+            response.headers['X-Profile-Id'] = finish_request_profile(response.status_code)
+        return response
+    
+    @app.teardown_request
+    def abandon_request_profile(exc):
+        # after_request didn't run (the request failed outright)
+        if 'watchmarker.profile' in request.environ:
+            finish_request_profile(None)
+    
+    @app.route('/api/profiles', methods=['GET', 'POST'])
+    def handle_profiles():
+        """List stored profiles and recent slow operations, or arm profiling of the next requests"""
+        if not profiling_authorized():
+            return jsonify({'error': 'Invalid profile token'}), 403
+        
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            request_profiler.arm(int(data.get('requests', 1)), data.get('path', ''))
+        
+        return jsonify({
+            'armed': request_profiler.armed(),
+            'profiles': profile_store.list(),
+            'slow_ops': profile_store.slow_ops(request.args.get('slow_ops', 100, type=int))
+        })
+    
+    @app.route('/api/profiles/<profile_id>')
+    def download_profile(profile_id):
+        """Download a profile (pstats format), or its top functions with ?format=text"""
+        if not profiling_authorized():
+            return jsonify({'error': 'Invalid profile token'}), 403
+        
+        if request.args.get('format') == 'text':
+            text = profile_store.text(profile_id)
+            if text is None:
+                return jsonify({'error': 'Profile not found'}), 404
+            return app.response_class(text, mimetype='text/plain')
+        
+        path = profile_store.path(profile_id)
+        if path is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=profile_id + '.prof')
+
+def prepare_shutdown():
+    """End event streams and write buffered progress before the process stops"""
+    events.close()
+    tracker.flush_progress()
+
+# Largest page a client may request, the page size for a cursor sent
+# without a limit, and rows per batch in NDJSON streams
+MAX_PAGE_SIZE = 5000
+DEFAULT_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 500
+
+# Read size when streaming video byte ranges; bounds memory per stream
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Most updates accepted by one /api/progress/batch request
+MAX_PROGRESS_BATCH = 1000
+
+# Seconds between SSE keepalive comments, so proxies keep idle streams open
+SSE_KEEPALIVE_INTERVAL = 15
+
+def build_video_list(folder_path, videos, progress_map=None, metadata_map=None):
+    """Build the listing for a folder, fetching all progress and metadata in one query each"""
+    if progress_map is None:
+        progress_map = tracker.get_progress_for_folder(folder_path)
+    if metadata_map is None:
+        metadata_map = tracker.get_media_metadata_for_folder(folder_path)
+    
+    return VideoCatalog.build(folder_path, videos, progress_map, metadata_map)
+
+def json_body(payload, columns=False):
+    """Serialize a response like jsonify, but VideoCatalog values are written straight from their arrays
+    
+    With columns, catalogs use the compact columnar format instead of an
+    object per video.
+    """
+    members = []
+    for key, value in payload.items():
+        if isinstance(value, VideoCatalog):
+            value = value.to_columns_json() if columns else value.to_json()
+        else:
+            value = json.dumps(value)
+        members.append(f'{json.dumps(key)}:{value}')
+    return ('{' + ','.join(members) + '}').encode()
+
+def wants_columns(data=None):
+    """Whether the client asked for listings in the columnar format (?format=columns or a JSON body field)"""
+    source = request.args if data is None else data
+    return source.get('format') == 'columns'
+
+def parse_page_limit(value, cursor=None):
+    """Page size for a listing request (None = the whole folder); raises ValueError for a non-numeric limit
+    
+    A cursor without a limit gets DEFAULT_PAGE_SIZE, since a cursor only
+    makes sense for paged listings.
+    """
+    if value is None or value == '':
+        limit = 0
+    elif isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f'invalid limit: {value!r}')
+    else:
+        limit = int(value)
+    
+    if not limit:
+        return DEFAULT_PAGE_SIZE if cursor else None
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def list_folder(folder_path, cursor=None, limit=None):
+    """List a folder from the library index, optionally one page at a time
+    
+    Without a limit the whole folder is returned. With one (from
+    parse_page_limit), `next_cursor` is the value to pass as `cursor` for
+    the following page (or None).
+    """
+    if not limit:
+        video_list = build_video_list(folder_path, tracker.get_indexed_videos(folder_path))
+        return {'videos': video_list, 'count': len(video_list), 'next_cursor': None,
+                'stats': tracker.get_folder_stats(folder_path)}
+    
+    videos = tracker.get_indexed_videos(folder_path, after=cursor, limit=limit)
+    video_list = build_video_list(folder_path, videos, tracker.get_progress_many(videos),
+                                  tracker.get_media_metadata_many(videos))
+    
+    listing = {
+        'videos': video_list,
+        'count': tracker.count_indexed_videos(folder_path),
+        'next_cursor': videos[-1] if len(videos) == limit else None
+    }
+    # Folder totals only come with the first page
+    if not cursor:
+        listing['stats'] = tracker.get_folder_stats(folder_path)
+    return listing
+
+def listing_etag(folder_path, *params):
+    """Weak ETag for a listing: endpoint, folder, request parameters and change token
+    
+    The token moves whenever progress, remarks or the library index change,
+    and the index is refreshed (a stat per directory) before this is called.
+    """
+    key = repr((request.path, folder_path, params, tracker.get_change_token()))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def cached_json(etag, build_payload, columns=False):
+    """JSON response for a listing, compressed as the client accepts
+    
+    The body is kept, raw and per encoding, in response_cache under the
+    listing's ETag, so an unchanged listing is neither rebuilt nor
+    re-serialized nor re-compressed.
+    """
+    encoding = negotiate_encoding(request.accept_encodings)
+    body, encoding = response_cache.get(etag, encoding, lambda: json_body(build_payload(), columns))
+    
+    response = app.response_class(body, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def conditional_json(etag, build_payload, columns=False):
+    """304 if the client already has this ETag, otherwise cached_json()"""
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.vary.add('Accept-Encoding')
+    else:
+        response = cached_json(etag, build_payload, columns)
+    
+    response.set_etag(etag, weak=True)
+    return response
+
+def file_validators(stat_result):
+    """Strong ETag (inode, size, mtime) and Last-Modified for a file"""
+    etag = f'{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}'
+    last_modified = datetime.fromtimestamp(int(stat_result.st_mtime), timezone.utc)
+    return etag, last_modified
 
 @app.route('/')
 def index():
@@ -18,58 +322,55 @@ def index():
 @app.route('/api/last-folder')
 def get_last_folder():
     """Get the last opened folder"""
-    last_folder = tracker.get_last_folder()
+    last_folder = tracker.get_last_folder(check_exists=False)
+    if not last_folder:
+        return jsonify({'folder': None})
+    
+    # Wait briefly for a re-check of a stale folder, since listing it
+    # touches the filesystem; a folder whose check hasn't finished is
+    # listed from the index alone
+    state, stale = path_status.status(last_folder, wait=PATH_CHECK_WAIT)
+    if state is None:
+        return jsonify({'folder': None, 'stale': True})
     
-    if last_folder and os.path.exists(last_folder):
+    if state == PATH_OK:
+        try:
+            limit = parse_page_limit(request.args.get('limit'))
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
         session['selected_folder'] = last_folder
-        videos = find_videos(last_folder)
         
-        video_list = []
-        for video_path in videos:
-            progress_data = tracker.get_progress(video_path)
-            
-            rel_path = os.path.relpath(video_path, last_folder)
-            video_info = {
-                'path': video_path,
-                'display_name': rel_path,
-                'filename': os.path.basename(video_path)
-            }
-            
-            if progress_data:
-                position = progress_data[0]
-                duration = progress_data[1]
-                remarks = progress_data[2] if len(progress_data) > 2 else None
-                
-                if duration:
-                    percent = (position / duration) * 100
-                    video_info['progress'] = {
-                        'position': position,
-                        'duration': duration,
-                        'percent': round(percent, 1)
-                    }
-                else:
-                    video_info['progress'] = None
-                
-                video_info['remarks'] = remarks
-            else:
-                video_info['progress'] = None
-                video_info['remarks'] = None
-            
-            video_list.append(video_info)
+        if not stale:
+            tracker.refresh_library(last_folder)
+        if prober:
+            prober.probe_folder(last_folder)
+        columns = wants_columns()
+        etag = listing_etag(last_folder, limit, columns)
         
-        return jsonify({
+        return conditional_json(etag, lambda: {
             'folder': last_folder,
             'folder_name': os.path.basename(last_folder),
-            'videos': video_list,
-            'count': len(video_list)
-        })
+            **list_folder(last_folder, limit=limit)
+        }, columns)
     
     return jsonify({'folder': None})
 
 @app.route('/api/folder-history')
 def get_folder_history():
     """Get folder history"""
-    history = tracker.get_folder_history()
+    history = []
+    for folder in tracker.get_folder_history(check_exists=False):
+        # Last known state; folders not checked yet are shown as available
+        state, stale = path_status.status(folder['path'])
+        if state == PATH_MISSING:
+            continue
+        folder['available'] = state != PATH_UNREACHABLE
+        folder['stale'] = stale
+        history.append(folder)
+    
+    stats = tracker.get_folder_stats_many(folder['path'] for folder in history)
+    for folder in history:
+        folder['stats'] = stats[folder['path']]
     return jsonify({'folders': history})
 
 @app.route('/api/folder-history/<path:folder_path>', methods=['DELETE'])
@@ -77,6 +378,7 @@ def delete_folder_from_history(folder_path):
     """Remove folder from history"""
     folder_path = '/' + folder_path
     tracker.remove_folder_from_history(folder_path)
+    path_status.forget(folder_path)
     return jsonify({'success': True})
 
 @app.route('/api/select-folder', methods=['POST'])
@@ -91,53 +393,29 @@ def select_folder():
     if not os.path.isdir(folder_path):
         return jsonify({'error': 'Path is not a directory'}), 400
     
+    try:
+        limit = parse_page_limit(data.get('limit'))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
     # Save as last folder and add to history
     tracker.save_last_folder(folder_path)
     tracker.add_folder_to_history(folder_path)
     
     session['selected_folder'] = folder_path
-    videos = find_videos(folder_path)
+    tracker.refresh_library(folder_path)
+    if watcher:
+        watcher.watch(folder_path)
+    if prober:
+        prober.probe_folder(folder_path)
+    columns = wants_columns(data)
+    etag = listing_etag(folder_path, limit, columns)
     
-    # Get progress for each video
-    video_list = []
-    for video_path in videos:
-        progress_data = tracker.get_progress(video_path)
-        
-        rel_path = os.path.relpath(video_path, folder_path)
-        video_info = {
-            'path': video_path,
-            'display_name': rel_path,
-            'filename': os.path.basename(video_path)
-        }
-        
-        if progress_data:
-            position = progress_data[0]
-            duration = progress_data[1]
-            remarks = progress_data[2] if len(progress_data) > 2 else None
-            
-            if duration:
-                percent = (position / duration) * 100
-                video_info['progress'] = {
-                    'position': position,
-                    'duration': duration,
-                    'percent': round(percent, 1)
-                }
-            else:
-                video_info['progress'] = None
-            
-            video_info['remarks'] = remarks
-        else:
-            video_info['progress'] = None
-            video_info['remarks'] = None
-        
-        video_list.append(video_info)
-    
-    return jsonify({
+    return cached_json(etag, lambda: {
         'folder': folder_path,
         'folder_name': os.path.basename(folder_path),
-        'videos': video_list,
-        'count': len(video_list)
-    })
+        **list_folder(folder_path, limit=limit)
+    }, columns)
 
 @app.route('/api/videos')
 def get_videos():
@@ -147,33 +425,168 @@ def get_videos():
     if not folder_path:
         return jsonify({'error': 'No folder selected'}), 400
     
-    videos = find_videos(folder_path)
+    cursor = request.args.get('cursor')
+    try:
+        limit = parse_page_limit(request.args.get('limit'), cursor)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    # Only the first page refreshes the index; later pages read it as-is.
+    # Only changed directories are re-listed unless a rebuild is requested.
+    if not cursor:
+        tracker.refresh_library(folder_path, rebuild=request.args.get('rebuild') == '1')
+    
+    columns = wants_columns()
+    etag = listing_etag(folder_path, cursor, limit, columns)
+    return conditional_json(etag, lambda: list_folder(folder_path, cursor=cursor, limit=limit), columns)
+
+@app.route('/api/videos/stream')
+def stream_videos():
+    """Stream the selected folder's listing as NDJSON, one video per line"""
+    folder_path = session.get('selected_folder')
+    
+    if not folder_path:
+        return jsonify({'error': 'No folder selected'}), 400
+    
+    tracker.refresh_library(folder_path, rebuild=request.args.get('rebuild') == '1')
+    
+    etag = listing_etag(folder_path, 'ndjson')
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return response
     
-    video_list = []
-    for video_path in videos:
-        progress_data = tracker.get_progress(video_path)
+    def generate():
+        # Header line, then the videos in batches so memory stays bounded
+        yield (json.dumps({
+            'folder': folder_path,
+            'folder_name': os.path.basename(folder_path),
+            'count': tracker.count_indexed_videos(folder_path)
+        }) + '\n').encode()
         
-        rel_path = os.path.relpath(video_path, folder_path)
-        video_info = {
-            'path': video_path,
-            'display_name': rel_path,
-            'filename': os.path.basename(video_path)
-        }
+        cursor = None
+        while True:
+            videos = tracker.get_indexed_videos(folder_path, after=cursor, limit=STREAM_BATCH_SIZE)
+            if not videos:
+                break
+            
+            catalog = build_video_list(folder_path, videos, tracker.get_progress_many(videos),
+                                       tracker.get_media_metadata_many(videos))
+            yield ''.join(entry + '\n' for entry in catalog.json_entries()).encode()
+            cursor = videos[-1]
+    
+    # Gzip is flushed after every batch; the other codings have no
+    # incremental encoder in the standard library
+    if request.accept_encodings['gzip'] > 0:
+        response = app.response_class(gzip_stream(generate()), mimetype='application/x-ndjson')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = app.response_class(generate(), mimetype='application/x-ndjson')
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/api/events')
+def stream_events():
+    """Push server-side changes to the browser as server-sent events"""
+    subscription = events.subscribe()
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = subscription.get(timeout=SSE_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    return  # Server shutting down; the browser reconnects
+                event_type, data = event
+                yield f'event: {event_type}\ndata: {json.dumps(data)}\n\n'
+        finally:
+            events.unsubscribe(subscription)
+    
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def parse_range_header(range_header, file_size):
+    """Parse a Range header into a list of inclusive (start, end) byte ranges
+    
+    Handles suffix ranges ("bytes=-500") and clamps ends past EOF. Returns
+    None for a malformed header (the whole file should be served) and an
+    empty list when no range is satisfiable (416).
+    """
+    units, _, spec = range_header.partition('=')
+    if units.strip().lower() != 'bytes' or not spec.strip():
+        return None
+    
+    ranges = []
+    for part in spec.split(','):
+        start_text, dash, end_text = part.strip().partition('-')
+        if not dash or not (start_text.strip() + end_text.strip()).isdigit():
+            return None
         
-        if progress_data and progress_data[1]:
-            position, duration = progress_data
-            percent = (position / duration) * 100
-            video_info['progress'] = {
-                'position': position,
-                'duration': duration,
-                'percent': round(percent, 1)
-            }
-        else:
-            video_info['progress'] = None
+        if not start_text.strip():
+            # Suffix range: the last N bytes
+            suffix = int(end_text)
+            if suffix == 0 or file_size == 0:
+                continue
+            ranges.append((max(0, file_size - suffix), file_size - 1))
+            continue
         
-        video_list.append(video_info)
+        start = int(start_text)
+        end = int(end_text) if end_text.strip() else file_size - 1
+        if end_text.strip() and end < start:
+            return None
+        if start >= file_size:
+            continue
+        ranges.append((start, min(end, file_size - 1)))
+    
+    # Merge overlapping or adjacent ranges so clients can't amplify reads
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
     
-    return jsonify({'videos': video_list})
+    return merged
+
+def iter_file_range(path, start, length):
+    """Yield `length` bytes of a file from `start`, one bounded chunk at a time"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            STREAM_BYTES.inc(len(chunk))
+            yield chunk
+
+def track_stream(chunks):
+    """Count a video response body in active_streams while it is being sent"""
+    global active_streams
+    
+    with active_streams_lock:
+        active_streams += 1
+    try:
+        yield from chunks
+    finally:
+        with active_streams_lock:
+            active_streams -= 1
+
+def iter_multipart_ranges(path, ranges, parts):
+    """Yield a multipart/byteranges body from pre-rendered part headers"""
+    for (start, end), part_header in zip(ranges, parts[:-1]):
+        yield part_header
+        yield from iter_file_range(path, start, end - start + 1)
+    yield parts[-1]
 
 @app.route('/api/video/<path:video_path>')
 def stream_video(video_path):
@@ -183,48 +596,126 @@ def stream_video(video_path):
     if not os.path.exists(video_path):
         return jsonify({'error': 'Video not found'}), 404
     
-    # Get file size
-    file_size = os.path.getsize(video_path)
+    # Get file size and validators
+    stat_result = os.stat(video_path)
+    file_size = stat_result.st_size
+    etag, last_modified = file_validators(stat_result)
     
-    # Parse range header
-    range_header = request.headers.get('Range', None)
+    # If-None-Match / If-Modified-Since: the client's copy is current
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        return response
     
-    if not range_header:
-        return send_file(video_path, mimetype='video/mp4')
-    
-    # Parse range
-    byte_start = 0
-    byte_end = file_size - 1
+    # Same type with or without a Range header
+    mime_type = mimetypes.guess_type(video_path)[0] or 'video/mp4'
     
-    match = range_header.replace('bytes=', '').split('-')
-    if match[0]:
-        byte_start = int(match[0])
-    if match[1]:
-        byte_end = int(match[1])
+    # Parse range header
+    range_header = request.headers.get('Range', None)
+    ranges = parse_range_header(range_header, file_size) if range_header else None
     
-    length = byte_end - byte_start + 1
+    # If-Range: only honour the range if the client's copy is still current
+    if ranges is not None and 'If-Range' in request.headers:
+        if_range = request.if_range
+        if if_range.etag:
+            # Strong comparison (RFC 9110): a weak tag never matches, since
+            # werkzeug drops the W/ prefix the raw header has to be checked
+            weak = request.headers['If-Range'].lstrip().startswith('W/')
+            current = not weak and if_range.etag == etag
+        else:
+            current = if_range.date is not None and if_range.date == last_modified
+        if not current:
+            ranges = None
     
-    # Read the chunk
-    with open(video_path, 'rb') as f:
-        f.seek(byte_start)
-        chunk = f.read(length)
+    if ranges is None:
+        # Whole file (a malformed Range header is ignored), streamed in
+        # bounded chunks like a range so bytes are counted as they are sent
+        response = app.response_class(
+            track_stream(iter_file_range(video_path, 0, file_size)),
+            mimetype=mime_type,
+            direct_passthrough=True
+        )
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Content-Length'] = str(file_size)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        return response
     
-    # Get mime type
-    mime_type = mimetypes.guess_type(video_path)[0] or 'video/mp4'
+    if not ranges:
+        response = app.response_class(status=416)
+        response.headers.add('Content-Range', f'bytes */{file_size}')
+        response.headers.add('Accept-Ranges', 'bytes')
+        return response
     
-    response = app.response_class(
-        chunk,
-        206,
-        mimetype=mime_type,
-        direct_passthrough=True
-    )
+    if len(ranges) == 1:
+        byte_start, byte_end = ranges[0]
+        length = byte_end - byte_start + 1
+        
+        response = app.response_class(
+            track_stream(iter_file_range(video_path, byte_start, length)),
+            206,
+            mimetype=mime_type,
+            direct_passthrough=True
+        )
+        
+        response.headers.add('Content-Range', f'bytes {byte_start}-{byte_end}/{file_size}')
+    else:
+        # Multi-range: multipart/byteranges, with the length known up front
+        boundary = secrets.token_hex(16)
+        parts = [
+            (f'--{boundary}\r\nContent-Type: {mime_type}\r\n'
+             f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n').encode()
+            for start, end in ranges
+        ]
+        # Each part's data is followed by CRLF, which opens the next delimiter
+        parts = [parts[0]] + [b'\r\n' + part for part in parts[1:]]
+        parts.append(f'\r\n--{boundary}--\r\n'.encode())
+        length = sum(len(part) for part in parts) + sum(end - start + 1 for start, end in ranges)
+        
+        response = app.response_class(
+            track_stream(iter_multipart_ranges(video_path, ranges, parts)),
+            206,
+            mimetype=f'multipart/byteranges; boundary={boundary}',
+            direct_passthrough=True
+        )
     
-    response.headers.add('Content-Range', f'bytes {byte_start}-{byte_end}/{file_size}')
     response.headers.add('Accept-Ranges', 'bytes')
     response.headers.add('Content-Length', str(length))
+    response.set_etag(etag)
+    response.last_modified = last_modified
     
     return response
 
+def progress_event(video_path, position, duration, client=None):
+    """Data of a 'progress' event; client lets the sender skip its own echo"""
+    return {
+        'path': video_path,
+        'position': position,
+        'duration': duration,
+        'percent': round((position / duration) * 100, 1) if duration else None,
+        'client': client
+    }
+
+def publish_progress(video_path, position, duration, client=None):
+    """Push a progress change to open sessions"""
+    events.publish('progress', progress_event(video_path, position, duration, client))
+
+def parse_progress_update(video_path, position, duration):
+    """(video_path, position, duration) from request values, or None if any is invalid"""
+    if not isinstance(video_path, str) or not video_path:
+        return None
+    try:
+        position = int(position)
+        duration = int(duration) if duration else None
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if not 0 <= position <= MAX_PROGRESS_MS:
+        return None
+    if duration is not None and not 0 <= duration <= MAX_PROGRESS_MS:
+        return None
+    return video_path, position, duration
+
 @app.route('/api/progress', methods=['GET', 'POST'])
 def handle_progress():
     """Get or save video progress"""
@@ -243,17 +734,62 @@ def handle_progress():
         return jsonify({'position': 0, 'duration': None, 'remarks': None})
     
     else:  # POST
-        data = request.get_json()
-        video_path = data.get('video_path')
-        position = data.get('position')
-        duration = data.get('duration')
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Invalid data'}), 400
         
-        if not video_path or position is None:
+        update = parse_progress_update(data.get('video_path'), data.get('position'), data.get('duration'))
+        if update is None:
             return jsonify({'error': 'Invalid data'}), 400
         
-        tracker.save_progress(video_path, int(position), int(duration) if duration else None)
+        video_path, position, duration = update
+        flush = bool(data.get('flush'))  # Sent on pause/stop/unload
+        tracker.save_progress(video_path, position, duration, flush=flush)
+        publish_progress(video_path, position, duration, data.get('client'))
         return jsonify({'success': True})
 
+@app.route('/api/progress/batch', methods=['POST'])
+def save_progress_batch():
+    """Save many queued progress updates at once, last writer wins by client_timestamp"""
+    # Beacons may arrive without a JSON content type
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('updates'), list):
+        return jsonify({'error': 'Invalid data'}), 400
+    
+    if len(data['updates']) > MAX_PROGRESS_BATCH:
+        return jsonify({'error': f'At most {MAX_PROGRESS_BATCH} updates per batch'}), 400
+    
+    # A client clock running ahead must not make its updates win forever
+    now = int(datetime.now(timezone.utc).timestamp() * 1000)
+    
+    # Every update is checked before any is saved
+    updates = []
+    for update in data['updates']:
+        if not isinstance(update, dict):
+            return jsonify({'error': 'Invalid update'}), 400
+        parsed = parse_progress_update(update.get('video_path'), update.get('position'), update.get('duration'))
+        try:
+            timestamp = update.get('client_timestamp')
+            timestamp = max(0, min(int(timestamp), now)) if timestamp is not None else now
+        except (TypeError, ValueError, OverflowError):
+            parsed = None
+        
+        if parsed is None:
+            return jsonify({'error': 'Invalid update'}), 400
+        updates.append(parsed + (timestamp,))
+    
+    # Batches are already coalesced by the client, so write them right away
+    # in one transaction instead of buffering
+    tracker.save_progress_many(updates, flush=True)
+    
+    # Push what actually won, so stale offline updates don't reach other
+    # sessions; the relay logs the whole batch in one write
+    paths = {update[0] for update in updates}
+    events.publish_many([('progress', progress_event(video_path, position, duration, data.get('client')))
+                         for video_path, (position, duration, _) in tracker.get_progress_many(paths).items()])
+    
+    return jsonify({'success': True, 'count': len(updates)})
+
 @app.route('/api/remarks', methods=['GET', 'POST'])
 def handle_remarks():
     """Get or save video remarks"""
@@ -280,54 +816,68 @@ def handle_remarks():
 def clear_completed():
     """Clear completed videos"""
     tracker.clear_completed_videos()
+    events.publish('resync', {})
     return jsonify({'success': True})
 
 @app.route('/api/browse')
 def browse_filesystem():
-    """Browse filesystem for folder selection"""
+    """Browse filesystem for folder selection
+    
+    Returns one page of subdirectories. Optional parameters: `prefix`
+    (filter), `cursor` and `limit` (pagination), and `counts=1` for the
+    number of indexed videos under each already indexed subdirectory.
+    """
     path = request.args.get('path', str(Path.home()))
+    prefix = request.args.get('prefix', '')
+    cursor = request.args.get('cursor') or None
+    limit = max(1, min(request.args.get('limit', BROWSE_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
     
-    if not os.path.exists(path):
+    if not os.path.isdir(path):
         path = str(Path.home())
     
     try:
-        items = []
-        
-        # Add parent directory option
-        parent = os.path.dirname(path)
-        if parent != path:  # Not at root
-            items.append({
-                'name': '..',
-                'path': parent,
-                'is_dir': True,
-                'is_parent': True
-            })
-        
-        # List directories
-        for item in sorted(os.listdir(path)):
-            item_path = os.path.join(path, item)
-            
-            # Skip hidden files/folders
-            if item.startswith('.'):
-                continue
-            
-            if os.path.isdir(item_path):
-                items.append({
-                    'name': item,
-                    'path': item_path,
-                    'is_dir': True,
-                    'is_parent': False
-                })
-        
-        return jsonify({
-            'current_path': path,
-            'items': items
-        })
-    
+        names, total, next_cursor, video_count = browser.page(path, prefix, cursor, limit)
     except PermissionError:
         return jsonify({'error': 'Permission denied'}), 403
-    except Exception as e:
+    except OSError as e:
         return jsonify({'error': str(e)}), 500
+    
+    items = []
+    
+    # Add parent directory option
+    parent = os.path.dirname(path)
+    if parent != path and not cursor:  # Not at root
+        items.append({
+            'name': '..',
+            'path': parent,
+            'is_dir': True,
+            'is_parent': True
+        })
+    
+    # Counts only for the directories on this page
+    counts = None
+    if request.args.get('counts') == '1':
+        counts = tracker.get_indexed_video_counts(os.path.join(path, name) for name in names)
+    
+    for name in names:
+        item_path = os.path.join(path, name)
+        item = {
+            'name': name,
+            'path': item_path,
+            'is_dir': True,
+            'is_parent': False
+        }
+        if counts is not None:
+            item['video_count'] = counts.get(os.path.normpath(item_path))
+        items.append(item)
+    
+    return jsonify({
+        'current_path': path,
+        'items': items,
+        'total': total,
+        'video_count': video_count,
+        'next_cursor': next_cursor
+    })
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Memory and JSON time of a folder listing: dict per video vs VideoCatalog (rows and columns)
+
+Usage: python benchmarks/bench_catalog.py [--videos N]
+"""
+import argparse
+import gc
+import gzip
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import VideoCatalog
+
+ROOT = '/media/library'
+
+def legacy_build(folder_path, videos, progress_map, metadata_map):
+    """The previous build_video_list: one dict (plus nested dicts) per video"""
+    video_list = []
+    for video_path in videos:
+        video_info = {
+            'path': video_path,
+            'display_name': os.path.relpath(video_path, folder_path),
+            'filename': os.path.basename(video_path)
+        }
+        
+        progress_data = progress_map.get(video_path)
+        if progress_data:
+            position, duration, remarks = progress_data
+            video_info['progress'] = {
+                'position': position,
+                'duration': duration,
+                'percent': round((position / duration) * 100, 1)
+            } if duration else None
+            video_info['remarks'] = remarks
+        else:
+            video_info['progress'] = None
+            video_info['remarks'] = None
+        
+        metadata = metadata_map.get(video_path)
+        if metadata:
+            _, _, duration, width, height, codec = metadata
+            video_info['media'] = {'duration': duration, 'width': width, 'height': height, 'codec': codec}
+        else:
+            video_info['media'] = None
+        
+        video_list.append(video_info)
+    return video_list
+
+def synthetic_library(count):
+    """Sorted paths in 100-episode season folders, with progress for a third and metadata for half"""
+    paths = [f"{ROOT}/Show {i // 1000:04d}/Season {i // 100 % 10 + 1}/Episode {i % 100:03d} - Title.mkv"
+             for i in range(count)]
+    progress_map = {path: (600000 + i, 1500000, None) for i, path in enumerate(paths) if i % 3 == 0}
+    metadata_map = {path: (10 ** 9, 0, 1500000, 1920, 1080, 'h264') for i, path in enumerate(paths) if i % 2 == 0}
+    return paths, progress_map, metadata_map
+
+def measure(label, build, serialize):
+    """Print the memory a listing holds and how long building and serializing it take"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    listing = build()
+    build_time = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    
+    start = time.perf_counter()
+    payload = serialize(listing)
+    json_time = time.perf_counter() - start
+    
+    print(f"{label:<24} {size / 2 ** 20:9.1f} MiB {build_time:8.2f} s build {json_time:8.2f} s JSON")
+    return size, payload
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', type=int, default=200000)
+    args = parser.parse_args()
+    
+    paths, progress_map, metadata_map = synthetic_library(args.videos)
+    print(f"{args.videos} videos (listing memory, excluding the input paths)")
+    
+    before, legacy_json = measure("dict per video",
+                                  lambda: legacy_build(ROOT, paths, progress_map, metadata_map),
+                                  json.dumps)
+    after, catalog_json = measure("VideoCatalog",
+                                  lambda: VideoCatalog.build(ROOT, paths, progress_map, metadata_map),
+                                  VideoCatalog.to_json)
+    
+    _, columns_json = measure("VideoCatalog columns",
+                              lambda: VideoCatalog.build(ROOT, paths, progress_map, metadata_map),
+                              VideoCatalog.to_columns_json)
+    
+    assert json.loads(legacy_json) == json.loads(catalog_json)
+    print(f"memory: {before / after:.1f}x smaller")
+    for label, payload in (("rows", catalog_json), ("columns", columns_json)):
+        data = payload.encode()
+        print(f"{label:<8} {len(data) / 2 ** 20:7.1f} MiB JSON {len(gzip.compress(data, 6)) / 2 ** 20:7.2f} MiB gzipped")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""Benchmark suite: scanner, listing latency, concurrent saves and range streaming
+
+Builds a synthetic library (sparse dummy video files) and progress database
+in a temporary directory, runs each benchmark and writes the results as
+JSON, so runs on different commits can be compared. The listing and
+streaming benchmarks each run in a fresh process, so their memory figures
+aren't skewed by the rest of the suite.
+
+Usage:
+    python benchmarks/bench_suite.py [--preset small|medium|large] [--output results.json]
+    python benchmarks/bench_suite.py --compare before.json after.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_tracker import SCAN_WORKERS, VideoTracker, find_videos
+
+RESULTS_VERSION = 1
+
+PRESETS = {
+    # depth/fanout/files: library shape (files in every directory);
+    # progress_rows: progress database size; requests: timed requests per listing case;
+    # writers/saves: concurrent save_progress callers and saves each; stream_mb: streamed file size
+    'small': dict(depth=2, fanout=4, files=20, progress_rows=10000, requests=100,
+                  writers=4, saves=500, stream_mb=256),
+    'medium': dict(depth=3, fanout=6, files=40, progress_rows=100000, requests=50,
+                   writers=8, saves=1000, stream_mb=1024),
+    'large': dict(depth=3, fanout=10, files=100, progress_rows=1000000, requests=20,
+                  writers=16, saves=2000, stream_mb=4096),
+}
+
+BENCHMARKS = ('find_videos', 'listing', 'save_progress', 'range_stream')
+
+EXTENSIONS = ('.mp4', '.mkv', '.avi', '.webm')
+
+# What a browser sends, so listings are measured as they are served
+ACCEPT_ENCODING = 'gzip, deflate, br, zstd'
+
+def log(message):
+    """Human-readable progress goes to stderr; stdout is kept for the JSON results"""
+    print(message, file=sys.stderr, flush=True)
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def summarize_ms(seconds):
+    """p50/p99/mean/max in milliseconds of a list of durations in seconds"""
+    ms = [value * 1000 for value in seconds]
+    return {'requests': len(ms), 'p50_ms': round(percentile(ms, 50), 3), 'p99_ms': round(percentile(ms, 99), 3),
+            'mean_ms': round(statistics.mean(ms), 3), 'max_ms': round(max(ms), 3)}
+
+def peak_rss_kib():
+    """Peak resident set size of this process in KiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # Bytes on macOS
+
+def use_app_env(db_path):
+    """Point the web app at the benchmark database, with background work off; call before importing app"""
+    os.environ['DB_PATH'] = db_path
+    os.environ['MEDIA_PROBE'] = 'off'
+    os.environ['LIBRARY_WATCH'] = 'off'
+
+def run_in_process(func, *args):
+    """Run func(*args) in a fresh interpreter and return its result"""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_call_and_report, args=(results, func) + args)
+    process.start()
+    result = results.get()
+    process.join()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+def _call_and_report(results, func, *args):
+    try:
+        results.put(func(*args))
+    except Exception as e:
+        results.put(e)
+
+def make_library(root, depth, fanout, files, file_size, seed):
+    """Create a library tree: `files` sparse videos (plus a non-video file) in every directory
+    
+    Directories go `depth` levels below root with `fanout` subdirectories
+    each. Returns the sorted video paths.
+    """
+    rng = random.Random(seed)
+    paths = []
+    pending = [(root, 0)]
+    
+    while pending:
+        directory, level = pending.pop()
+        os.makedirs(directory, exist_ok=True)
+        for i in range(files):
+            path = os.path.join(directory, f"Episode {i:04d}{rng.choice(EXTENSIONS)}")
+            with open(path, 'wb') as f:
+                f.truncate(file_size)
+            paths.append(path)
+        open(os.path.join(directory, 'notes.txt'), 'w').close()
+        
+        if level < depth:
+            for i in range(fanout):
+                pending.append((os.path.join(directory, f"Season {i:03d}"), level + 1))
+    
+    return sorted(paths)
+
+def make_progress_db(db_path, videos, rows, seed):
+    """Fill a progress database with `rows` saves: the library's videos first, then videos elsewhere"""
+    rng = random.Random(seed)
+    tracker = VideoTracker(db_path, flush_interval=3600, flush_size=rows + 1)
+    
+    def updates():
+        for i in range(rows):
+            path = videos[i] if i < len(videos) else f"/bench/archive/Show {i // 1000:05d}/Episode {i % 1000:04d}.mp4"
+            duration = rng.randrange(600000, 3600000)
+            yield path, rng.randrange(duration), duration, 1600000000000 + i
+    
+    start = time.perf_counter()
+    chunk = []
+    for update in updates():
+        chunk.append(update)
+        if len(chunk) == 50000:
+            tracker.save_progress_many(chunk)
+            tracker.flush_progress()
+            chunk = []
+    tracker.save_progress_many(chunk)
+    tracker.flush_progress()
+    elapsed = time.perf_counter() - start
+    tracker.close()
+    
+    return {'rows': rows, 'seconds': round(elapsed, 3), 'rows_per_sec': round(rows / elapsed),
+            'db_bytes': os.path.getsize(db_path)}
+
+def bench_find_videos(root, repeat):
+    """Time find_videos over the library"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = find_videos(root)
+        timings.append(time.perf_counter() - start)
+    
+    return {'files': len(found), 'workers': SCAN_WORKERS, 'runs': repeat,
+            'min_s': round(min(timings), 4), 'median_s': round(statistics.median(timings), 4),
+            'max_s': round(max(timings), 4)}
+
+def bench_listing(db_path, root, requests, page_size):
+    """Listing endpoint latency through the Flask test client (runs in its own process)"""
+    use_app_env(db_path)
+    import app as web
+    
+    client = web.app.test_client()
+    client.post('/api/select-folder', json={'folder_path': root})  # Indexes the library
+    cache = getattr(web, 'response_cache', None)
+    headers = {'Accept-Encoding': ACCEPT_ENCODING}
+    
+    cases = {
+        'first_page': f'/api/videos?limit={page_size}',
+        'first_page_columns': f'/api/videos?limit={page_size}&format=columns',
+        'full': '/api/videos',
+        'full_columns': '/api/videos?format=columns',
+        'last_folder': f'/api/last-folder?limit={page_size}',
+        'folder_history': '/api/folder-history',
+    }
+    
+    results = {}
+    for name, url in cases.items():
+        # Uncached: every request builds the listing; cached: an unchanged
+        # listing as served to a client without a matching ETag
+        for cached in (False, True):
+            timings = []
+            size = 0
+            for i in range(requests + 1):
+                if cache is not None and not cached:
+                    cache.clear()
+                start = time.perf_counter()
+                response = client.get(url, headers=headers)
+                elapsed = time.perf_counter() - start
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url}: HTTP {response.status_code}")
+                if i:  # The first request is a warm-up
+                    timings.append(elapsed)
+                size = len(response.data)
+            
+            results[name + ('_cached' if cached else '')] = dict(summarize_ms(timings), bytes=size)
+    
+    results['peak_rss_kib'] = peak_rss_kib()
+    return results
+
+def bench_save_threads(db_path, writers, saves, buffered):
+    """save_progress throughput with `writers` threads sharing one VideoTracker"""
+    tracker = VideoTracker(db_path, flush_interval=None if buffered else 0)
+    barrier = threading.Barrier(writers + 1)
+    
+    def writer(index):
+        barrier.wait()
+        for i in range(saves):
+            tracker.save_progress(f"/bench/threads/{index}/Episode {i % 500:04d}.mp4", i, 3600000)
+    
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    tracker.flush_progress()
+    elapsed = time.perf_counter() - start
+    tracker.close()
+    
+    return {'writers': writers, 'saves': writers * saves, 'seconds': round(elapsed, 3),
+            'saves_per_sec': round(writers * saves / elapsed)}
+
+def _save_process(db_path, index, saves, buffered, ready, go, results):
+    tracker = VideoTracker(db_path, flush_interval=None if buffered else 0)
+    ready.put(index)
+    go.wait()
+    start = time.monotonic()
+    for i in range(saves):
+        tracker.save_progress(f"/bench/processes/{index}/Episode {i % 500:04d}.mp4", i, 3600000)
+    tracker.flush_progress()
+    results.put((start, time.monotonic()))
+    tracker.close()
+
+def bench_save_processes(db_path, writers, saves, buffered):
+    """save_progress throughput with `writers` processes, each with its own VideoTracker"""
+    context = multiprocessing.get_context('spawn')
+    ready, go, results = context.Queue(), context.Event(), context.Queue()
+    processes = [context.Process(target=_save_process, args=(db_path, i, saves, buffered, ready, go, results))
+                 for i in range(writers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+    
+    go.set()
+    spans = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    
+    elapsed = max(end for _, end in spans) - min(start for start, _ in spans)
+    return {'writers': writers, 'saves': writers * saves, 'seconds': round(elapsed, 3),
+            'saves_per_sec': round(writers * saves / elapsed)}
+
+def bench_range_stream(db_path, video_path, seeks, seed):
+    """Range request throughput and memory through the Flask test client (runs in its own process)"""
+    use_app_env(db_path)
+    import app as web
+    
+    client = web.app.test_client()
+    url = '/api/video' + video_path
+    size = os.path.getsize(video_path)
+    baseline_rss = peak_rss_kib()
+    
+    def fetch(range_header):
+        response = client.get(url, headers={'Range': range_header}, buffered=False)
+        received = sum(len(chunk) for chunk in response.response)
+        response.close()
+        if response.status_code != 206:
+            raise RuntimeError(f"{range_header}: HTTP {response.status_code}")
+        return received
+    
+    # Playback from the start: one open-ended range read to the end
+    start = time.perf_counter()
+    received = fetch('bytes=0-')
+    elapsed = time.perf_counter() - start
+    
+    # Seeking: bounded 1 MiB ranges at random offsets
+    rng = random.Random(seed)
+    timings = []
+    for _ in range(seeks):
+        offset = rng.randrange(max(1, size - 2 ** 20))
+        start_seek = time.perf_counter()
+        fetch(f'bytes={offset}-{offset + 2 ** 20 - 1}')
+        timings.append(time.perf_counter() - start_seek)
+    
+    return {'bytes': received, 'seconds': round(elapsed, 3), 'mib_per_sec': round(received / 2 ** 20 / elapsed, 1),
+            'seek': summarize_ms(timings), 'baseline_rss_kib': baseline_rss, 'peak_rss_kib': peak_rss_kib()}
+
+def git_revision():
+    """(commit, dirty) of the checkout, or (None, None) outside a git repository"""
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+def run_suite(config, selected, workdir):
+    """Build the synthetic data under workdir and run the selected benchmarks"""
+    results = {}
+    root = os.path.join(workdir, 'library')
+    
+    log(f"library: depth {config['depth']}, fanout {config['fanout']}, {config['files']} files per directory")
+    start = time.perf_counter()
+    videos = make_library(root, config['depth'], config['fanout'], config['files'],
+                          config['file_size'], config['seed'])
+    results['library'] = {'videos': len(videos), 'seconds': round(time.perf_counter() - start, 3)}
+    
+    db_path = os.path.join(workdir, 'progress.db')
+    log(f"progress database: {config['progress_rows']} rows")
+    results['progress_db'] = make_progress_db(db_path, videos, config['progress_rows'], config['seed'])
+    
+    if 'find_videos' in selected:
+        results['find_videos'] = bench_find_videos(root, config['repeat'])
+        log(f"find_videos: {results['find_videos']['files']} files, median {results['find_videos']['median_s']} s")
+    
+    if 'listing' in selected:
+        results['listing'] = run_in_process(bench_listing, db_path, root, config['requests'], config['page_size'])
+        for name, stats in results['listing'].items():
+            if isinstance(stats, dict):
+                log(f"listing {name}: p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, {stats['bytes']} bytes")
+    
+    if 'save_progress' in selected:
+        results['save_progress'] = {}
+        for buffered in (False, True):
+            mode = 'buffered' if buffered else 'direct'
+            for kind, bench in (('threads', bench_save_threads), ('processes', bench_save_processes)):
+                save_db = os.path.join(workdir, f'saves-{kind}-{mode}.db')
+                VideoTracker(save_db).close()  # Create the schema before the writers start
+                stats = bench(save_db, config['writers'], config['saves'], buffered)
+                results['save_progress'][f'{kind}_{mode}'] = stats
+                log(f"save_progress {kind} {mode}: {stats['saves_per_sec']} saves/s")
+    
+    if 'range_stream' in selected:
+        video_path = os.path.join(workdir, 'stream.mkv')
+        with open(video_path, 'wb') as f:
+            f.truncate(config['stream_mb'] * 2 ** 20)
+        results['range_stream'] = run_in_process(bench_range_stream, db_path, video_path,
+                                                 config['requests'], config['seed'])
+        log(f"range_stream: {results['range_stream']['mib_per_sec']} MiB/s, "
+            f"peak RSS {results['range_stream']['peak_rss_kib']} KiB")
+    
+    return results
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, numeric leaves only"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+def compare(before_path, after_path):
+    """Print every metric of two result files side by side with the relative change"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    
+    print(f"before: {before['meta'].get('commit')} ({before['config'].get('preset')})")
+    print(f"after:  {after['meta'].get('commit')} ({after['config'].get('preset')})")
+    old, new = flatten(before['results']), flatten(after['results'])
+    for metric in sorted(old.keys() | new.keys()):
+        if metric in old and metric in new:
+            change = f"{(new[metric] - old[metric]) / old[metric] * 100:+.1f}%" if old[metric] else ''
+            print(f"{metric:<48} {old[metric]:>14} {new[metric]:>14} {change:>9}")
+        else:
+            print(f"{metric:<48} {old.get(metric, '-'):>14} {new.get(metric, '-'):>14}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    for option in ('depth', 'fanout', 'files', 'progress_rows', 'requests', 'writers', 'saves', 'stream_mb'):
+        parser.add_argument('--' + option.replace('_', '-'), type=int, help="Override the preset")
+    parser.add_argument('--file-size', type=int, default=2 ** 20, help="Size of each sparse video file")
+    parser.add_argument('--page-size', type=int, default=200, help="limit for the paged listing cases")
+    parser.add_argument('--repeat', type=int, default=5, help="find_videos runs")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', help="Comma-separated benchmarks: " + ','.join(BENCHMARKS))
+    parser.add_argument('--workdir', help="Build and keep the synthetic data in this (empty) directory instead of a temporary one")
+    parser.add_argument('--output', help="Write the JSON results here instead of stdout")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Compare two result files")
+    args = parser.parse_args()
+    
+    if args.compare:
+        compare(*args.compare)
+        return
+    
+    config = dict(PRESETS[args.preset], preset=args.preset, file_size=args.file_size,
+                  page_size=args.page_size, repeat=args.repeat, seed=args.seed)
+    for option in PRESETS[args.preset]:
+        if getattr(args, option) is not None:
+            config[option] = getattr(args, option)
+    
+    selected = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    
+    commit, dirty = git_revision()
+    meta = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+    
+    workdir = args.workdir or tempfile.mkdtemp(prefix='watch-marker-bench-')
+    try:
+        results = run_suite(config, selected, workdir)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    report = json.dumps({'version': RESULTS_VERSION, 'meta': meta, 'config': config, 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+        log(f"results written to {args.output}")
+    else:
+        print(report)
+
+if __name__ == '__main__':
+    main()
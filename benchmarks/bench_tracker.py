@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Per-call latency of VideoTracker: connection-per-call vs pooled connections
+
+Usage: python benchmarks/bench_tracker.py [--calls N]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_tracker import VideoTracker
+
+# The progress table as it was before folders were split out
+LEGACY_SCHEMA = """
+    CREATE TABLE video_progress (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT UNIQUE NOT NULL,
+        last_position INTEGER NOT NULL,
+        duration INTEGER,
+        last_watched TEXT DEFAULT CURRENT_TIMESTAMP,
+        watch_count INTEGER DEFAULT 1,
+        remarks TEXT
+    )
+"""
+
+SAVE_SQL = """
+    INSERT INTO video_progress (file_path, last_position, duration, watch_count)
+    VALUES (?, ?, ?, 1)
+    ON CONFLICT(file_path) DO UPDATE SET
+        last_position = ?,
+        duration = COALESCE(?, duration),
+        last_watched = CURRENT_TIMESTAMP,
+        watch_count = watch_count + 1
+"""
+
+GET_SQL = "SELECT last_position, duration, remarks FROM video_progress WHERE file_path = ?"
+
+def legacy_save(db_path, file_path, position, duration):
+    """The previous save_progress: connect, execute, commit, close"""
+    conn = sqlite3.connect(db_path)
+    conn.execute(SAVE_SQL, (file_path, position, duration, position, duration))
+    conn.commit()
+    conn.close()
+
+def legacy_get(db_path, file_path):
+    """The previous get_progress: connect, execute, close"""
+    conn = sqlite3.connect(db_path)
+    result = conn.execute(GET_SQL, (file_path,)).fetchone()
+    conn.close()
+    return result
+
+def measure(label, func, calls):
+    """Run func(i) `calls` times and print the mean latency per call"""
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed / calls * 1e6:10.1f} us/call")
+    return elapsed / calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+    
+    paths = [f"/videos/show/episode_{i:05d}.mp4" for i in range(100)]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        # Baseline: a rollback-journal database opened fresh for every call
+        legacy_db = os.path.join(tmp, 'legacy.db')
+        conn = sqlite3.connect(legacy_db)
+        conn.execute(LEGACY_SCHEMA)
+        conn.close()
+        
+        pooled = VideoTracker(os.path.join(tmp, 'pooled.db'), flush_interval=0)
+        buffered = VideoTracker(os.path.join(tmp, 'buffered.db'))
+        
+        print(f"{args.calls} calls each")
+        before_save = measure("save_progress (connect per call)",
+                              lambda i: legacy_save(legacy_db, paths[i % 100], i, 100000), args.calls)
+        after_save = measure("save_progress (pooled, WAL)",
+                             lambda i: pooled.save_progress(paths[i % 100], i, 100000), args.calls)
+        measure("save_progress (write-behind)",
+                lambda i: buffered.save_progress(paths[i % 100], i, 100000), args.calls)
+        before_get = measure("get_progress (connect per call)",
+                             lambda i: legacy_get(legacy_db, paths[i % 100]), args.calls)
+        after_get = measure("get_progress (pooled, WAL)",
+                            lambda i: pooled.get_progress(paths[i % 100]), args.calls)
+        
+        pooled.close()
+        buffered.close()
+    
+    print(f"save speedup: {before_save / after_save:.1f}x, get speedup: {before_get / after_get:.1f}x")
+
+if __name__ == '__main__':
+    main()
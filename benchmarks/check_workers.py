@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Check that progress saved through one serve.py worker is readable from another straight away
+
+Runs two app processes on a temporary database, configured the way serve.py
+configures its workers, saves through the first and reads each save back
+through the second. Exits with status 1 if a read misses a save.
+
+Usage: python benchmarks/check_workers.py [--saves N]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serve import worker_environment
+
+def run_worker(commands, replies):
+    """Serve ('save', path, position) and ('get', path) commands through the Flask test client"""
+    import app
+    client = app.app.test_client()
+    
+    for command in iter(commands.get, None):
+        if command[0] == 'save':
+            _, path, position = command
+            client.post('/api/progress', json={'video_path': path, 'position': position, 'duration': 3600000})
+            replies.put(None)
+        else:
+            replies.put(client.get('/api/progress', query_string={'video_path': command[1]}).get_json()['position'])
+    
+    app.prepare_shutdown()
+    app.tracker.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--saves', type=int, default=50)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        # Inherited by the spawned workers
+        os.environ['DB_PATH'] = os.path.join(workdir, 'check.db')
+        os.environ['MEDIA_PROBE'] = 'off'
+        os.environ['LIBRARY_WATCH'] = 'off'
+        worker_environment(2)
+        
+        context = multiprocessing.get_context('spawn')
+        workers = []
+        for _ in range(2):
+            commands, replies = context.Queue(), context.Queue()
+            process = context.Process(target=run_worker, args=(commands, replies))
+            process.start()
+            workers.append((process, commands, replies))
+        (_, saver, saved), (_, reader, read) = workers
+        
+        misses = 0
+        for i in range(args.saves):
+            path = f"/check/Episode {i % 5}.mp4"
+            position = (i + 1) * 1000
+            saver.put(('save', path, position))
+            saved.get()
+            reader.put(('get', path))
+            if read.get() != position:
+                misses += 1
+        
+        for process, commands, _ in workers:
+            commands.put(None)
+            process.join()
+    
+    print(f"{args.saves - misses}/{args.saves} saves readable from the other worker "
+          f"(PROGRESS_FLUSH_INTERVAL={os.environ['PROGRESS_FLUSH_INTERVAL']})")
+    sys.exit(1 if misses else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import bisect
+import json
+import os
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Stored in the integer arrays for "no value"
+MISSING = -1
+
+# Per-video flag bits
+HAS_MEDIA = 1  # The file was probed (its fields may still be unknown)
+
+class VideoCatalog:
+    """Compact listing of a folder's videos, for very large libraries
+    
+    Instead of a dict per video, each field lives in a parallel array:
+    the directory (an index into a table of relative directory names shared
+    by every video in it), the file name, the saved position and duration,
+    and the probed duration, resolution and codec (another shared table),
+    plus a byte of flags. Remarks are rare and kept in a dict by index.
+    
+    Behaves like a sequence of full paths (len, indexing, iteration, index())
+    and writes the web listing JSON straight from the arrays.
+    """
+    
+    __slots__ = ('root', '_prefix', '_dirs', '_dir_ids', '_dir_of', '_names',
+                 '_positions', '_durations', '_remarks', '_flags',
+                 '_media_durations', '_widths', '_heights', '_codecs', '_codec_names', '_codec_ids')
+    
+    def __init__(self, root: str):
+        self.root = root
+        self._prefix = os.path.join(root, '')
+        self._dirs: List[str] = []  # Relative directory names, '' or ending in a separator
+        self._dir_ids: Dict[str, int] = {}
+        self._dir_of = array('I')
+        self._names: List[str] = []
+        self._positions = array('q')
+        self._durations = array('q')
+        self._remarks: Dict[int, str] = {}
+        self._flags = array('B')
+        self._media_durations = array('q')
+        self._widths = array('i')
+        self._heights = array('i')
+        self._codecs = array('H')  # 0 = unknown, else index + 1 into _codec_names
+        self._codec_names: List[str] = []
+        self._codec_ids: Dict[str, int] = {}
+    
+    @classmethod
+    def build(cls, root: str, paths: Iterable[str],
+              progress_map: Dict[str, Tuple] = None, metadata_map: Dict[str, Tuple] = None) -> 'VideoCatalog':
+        """Catalog videos under root, with VideoTracker progress and metadata rows keyed by path"""
+        catalog = cls(root)
+        progress_map = progress_map or {}
+        metadata_map = metadata_map or {}
+        for path in paths:
+            catalog.append(path, progress_map.get(path), metadata_map.get(path))
+        return catalog
+    
+    def append(self, path: str, progress: Tuple = None, metadata: Tuple = None):
+        """Add a video with its (position, duration, remarks) and (size, mtime_ns, duration, width, height, codec)"""
+        relative = path[len(self._prefix):] if path.startswith(self._prefix) else os.path.relpath(path, self.root)
+        directory, _, name = relative.rpartition(os.sep)
+        if directory:
+            directory += os.sep
+        
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = self._dir_ids[directory] = len(self._dirs)
+            self._dirs.append(directory)
+        
+        index = len(self._names)
+        self._dir_of.append(dir_id)
+        self._names.append(name)
+        
+        if progress:
+            position, duration, remarks = progress
+            self._positions.append(int(position or 0))
+            self._durations.append(int(duration) if duration else MISSING)
+            if remarks is not None:
+                self._remarks[index] = remarks
+        else:
+            self._positions.append(MISSING)
+            self._durations.append(MISSING)
+        
+        if metadata:
+            _, _, duration, width, height, codec = metadata
+            self._flags.append(HAS_MEDIA)
+        else:
+            duration = width = height = codec = None
+            self._flags.append(0)
+        self._media_durations.append(_or_missing(duration))
+        self._widths.append(_or_missing(width))
+        self._heights.append(_or_missing(height))
+        self._codecs.append(self._codec_id(codec) if codec else 0)
+    
+    def _codec_id(self, codec: str) -> int:
+        codec_id = self._codec_ids.get(codec)
+        if codec_id is None:
+            self._codec_names.append(codec)
+            codec_id = self._codec_ids[codec] = len(self._codec_names)
+        return codec_id
+    
+    def __len__(self) -> int:
+        return len(self._names)
+    
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self._names)
+        return self._prefix + self.display_name(index)
+    
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self._names)):
+            yield self._prefix + self._dirs[self._dir_of[index]] + self._names[index]
+    
+    def index(self, path: str) -> int:
+        """Position of a video; raises ValueError if it isn't in the catalog"""
+        # Listings come sorted by path, so try a binary search first
+        index = bisect.bisect_left(self, path)
+        if index < len(self) and self[index] == path:
+            return index
+        for index, candidate in enumerate(self):
+            if candidate == path:
+                return index
+        raise ValueError(f"{path!r} is not in the catalog")
+    
+    def display_name(self, index: int) -> str:
+        """Path relative to the catalog root"""
+        return self._dirs[self._dir_of[index]] + self._names[index]
+    
+    def percent(self, index: int) -> Optional[float]:
+        """Watched percentage, or None without saved progress and a known duration"""
+        duration = self._durations[index]
+        if duration <= 0 or self._positions[index] == MISSING:
+            return None
+        return round(self._positions[index] / duration * 100, 1)
+    
+    def json_entries(self, start: int = 0, stop: int = None) -> Iterator[str]:
+        """The web listing entries as JSON objects, without building dicts"""
+        prefix = json.dumps(self._prefix)[:-1]
+        dirs = [json.dumps(directory)[1:-1] for directory in self._dirs]
+        codecs = ['null'] + [json.dumps(codec) for codec in self._codec_names]
+        names = self._names
+        dir_of = self._dir_of
+        positions, durations = self._positions, self._durations
+        media_durations, widths, heights, codec_of = self._media_durations, self._widths, self._heights, self._codecs
+        flags = self._flags
+        
+        for index in range(start, len(names) if stop is None else min(stop, len(names))):
+            name = json.dumps(names[index])[1:-1]
+            display_name = dirs[dir_of[index]] + name
+            
+            duration = durations[index]
+            if duration > 0:
+                position = positions[index]
+                progress = (f'{{"position":{position},"duration":{duration},'
+                            f'"percent":{round(position / duration * 100, 1)!r}}}')
+            else:
+                progress = 'null'
+            
+            remarks = self._remarks.get(index)
+            remarks = 'null' if remarks is None else json.dumps(remarks)
+            
+            if flags[index] & HAS_MEDIA:
+                media = (f'{{"duration":{_json_int(media_durations[index])},"width":{_json_int(widths[index])},'
+                         f'"height":{_json_int(heights[index])},"codec":{codecs[codec_of[index]]}}}')
+            else:
+                media = 'null'
+            
+            yield (f'{{"path":{prefix}{display_name}","display_name":"{display_name}",'
+                   f'"filename":"{name}","progress":{progress},"remarks":{remarks},"media":{media}}}')
+    
+    def to_json(self, start: int = 0, stop: int = None) -> str:
+        """The web listing entries as a JSON array"""
+        return '[' + ','.join(self.json_entries(start, stop)) + ']'
+    
+    def to_columns_json(self, start: int = 0, stop: int = None) -> str:
+        """The web listing in the compact columnar format
+        
+        One array per field instead of an object per video, with the root
+        prefix, directory names and codec names written once. Missing
+        values are null; `remarks` only holds the videos that have some,
+        keyed by their position in the arrays. static/app.js expands it
+        back into listing entries.
+        """
+        stop = len(self._names) if stop is None else min(stop, len(self._names))
+        dir_of = self._dir_of[start:stop]
+        dir_ids = sorted(set(dir_of))
+        renumbered = {dir_id: i for i, dir_id in enumerate(dir_ids)}
+        
+        columns = [
+            ('format', '"columns"'),
+            ('prefix', json.dumps(self._prefix)),
+            ('dirs', json.dumps([self._dirs[dir_id] for dir_id in dir_ids])),
+            ('dir', _json_ints(renumbered[dir_id] for dir_id in dir_of)),
+            ('name', json.dumps(self._names[start:stop])),
+            ('position', _json_ints(self._positions[start:stop])),
+            ('duration', _json_ints(self._durations[start:stop])),
+            ('remarks', json.dumps({str(index - start): remarks for index, remarks in self._remarks.items()
+                                    if start <= index < stop})),
+            ('media', _json_ints(self._flags[start:stop])),
+            ('media_duration', _json_ints(self._media_durations[start:stop])),
+            ('width', _json_ints(self._widths[start:stop])),
+            ('height', _json_ints(self._heights[start:stop])),
+            ('codecs', json.dumps([None] + self._codec_names)),
+            ('codec', _json_ints(self._codecs[start:stop]))
+        ]
+        return '{' + ','.join(f'"{key}":{value}' for key, value in columns) + '}'
+
+def _or_missing(value: Optional[int]) -> int:
+    return MISSING if value is None else int(value)
+
+def _json_int(value: int) -> str:
+    return 'null' if value == MISSING else str(value)
+
+def _json_ints(values: Iterable[int]) -> str:
+    return '[' + ','.join('null' if value == MISSING else str(value) for value in values) + ']'
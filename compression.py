@@ -0,0 +1,130 @@
+import gzip
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional, Tuple
+
+# Optional encoders: brotli and zstd are used when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Responses smaller than this are sent as-is
+COMPRESS_MIN_SIZE = 1024
+
+# Compression levels: fast enough for freshly built listings, since unchanged
+# ones are served from the cache
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 6
+
+# Bytes of encoded listings kept per process
+RESPONSE_CACHE_BYTES = int(os.getenv('RESPONSE_CACHE_BYTES', str(64 * 2 ** 20)))
+
+def available_encodings() -> Tuple[str, ...]:
+    """Content codings this process can produce, most preferred first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return tuple(encodings)
+
+ENCODINGS = available_encodings()
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """Best content coding accepted by the client (werkzeug's request.accept_encodings)"""
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Encode a response body with 'zstd', 'br' or 'gzip'"""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+def gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Gzip a streamed response, flushing after every chunk so clients see each batch promptly"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+class EncodedResponseCache:
+    """LRU cache of response bodies, raw and encoded, keyed by ETag
+    
+    A listing's ETag changes whenever its contents do, so an entry is valid
+    for as long as the ETag is requested. Requests for an unchanged listing
+    then skip the database, the JSON serialization and the compression.
+    """
+    
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = RESPONSE_CACHE_BYTES if max_bytes is None else max_bytes
+        self._entries = OrderedDict()  # (etag, encoding or None) -> body
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def get(self, etag: str, encoding: Optional[str], build: Callable[[], bytes]) -> Tuple[bytes, Optional[str]]:
+        """(body, encoding actually used) for a response, building and encoding it on a miss
+        
+        Bodies under COMPRESS_MIN_SIZE are never encoded.
+        """
+        body = self._lookup(etag, encoding)
+        if body is not None:
+            return body, encoding
+        
+        raw = self._lookup(etag, None)
+        if raw is None:
+            raw = build()
+            self._store(etag, None, raw)
+        
+        if encoding is None or len(raw) < COMPRESS_MIN_SIZE:
+            return raw, None
+        
+        body = compress(raw, encoding)
+        self._store(etag, encoding, body)
+        return body, encoding
+    
+    def clear(self):
+        """Drop every cached body"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+    
+    def _lookup(self, etag: str, encoding: Optional[str]) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get((etag, encoding))
+            if body is not None:
+                self._entries.move_to_end((etag, encoding))
+            return body
+    
+    def _store(self, etag: str, encoding: Optional[str], body: bytes):
+        if len(body) > self.max_bytes // 4:
+            return  # Don't let one huge listing flush everything else
+        
+        with self._lock:
+            previous = self._entries.pop((etag, encoding), None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[(etag, encoding)] = body
+            self._size += len(body)
+            
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
@@ -0,0 +1,129 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+# Events buffered per subscriber before it is told to resync instead
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# How often the relay checks the shared event log, and how long events stay there
+EVENT_RELAY_INTERVAL = 0.5
+EVENT_RETENTION = 300
+
+class EventBroker:
+    """Fans out server-side events (library changes, progress, ...) to subscribers
+    
+    Subscribers only see events published in the same process. Pass a
+    VideoTracker as `store` when several worker processes serve the app:
+    events are then also written to the shared database, and a relay
+    thread delivers the ones published by other processes.
+    """
+    
+    def __init__(self, store=None, relay_interval: float = None):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        
+        self._store = store
+        self._origin = os.urandom(4).hex()
+        self._stop_relay = threading.Event()
+        self._relay_thread = None
+        
+        if store is not None:
+            self._last_id = store.get_last_event_id()
+            self._relay_interval = relay_interval or EVENT_RELAY_INTERVAL
+            self._relay_thread = threading.Thread(target=self._relay_loop, daemon=True, name='event-relay')
+            self._relay_thread.start()
+    
+    def subscribe(self) -> queue.Queue:
+        """Register a subscriber; events arrive on the returned queue as (type, data)
+        
+        None on the queue means the broker was closed and the subscriber
+        should stop.
+        """
+        subscription = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if self._closed:
+                subscription.put_nowait(None)
+            else:
+                self._subscribers.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription: queue.Queue):
+        """Stop delivering events to a subscriber"""
+        with self._lock:
+            self._subscribers.discard(subscription)
+    
+    def publish(self, event_type: str, data: Dict[str, Any]):
+        """Deliver an event to every subscriber without blocking the publisher"""
+        self.publish_many([(event_type, data)])
+    
+    def publish_many(self, events: List[Tuple[str, Dict[str, Any]]]):
+        """Deliver several events in order; they are logged for other processes in one write"""
+        if not events:
+            return
+        for event in events:
+            self._deliver(event)
+        
+        if self._store is not None:
+            try:
+                self._store.append_events(self._origin, [(event_type, json.dumps(data))
+                                                         for event_type, data in events])
+            except sqlite3.Error:
+                pass  # Local subscribers still got them
+    
+    def close(self):
+        """Stop the relay and tell every subscriber to finish"""
+        self._stop_relay.set()
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        
+        for subscription in subscribers:
+            with subscription.mutex:
+                subscription.queue.clear()
+            subscription.put_nowait(None)
+        
+        if self._relay_thread and self._relay_thread is not threading.current_thread():
+            self._relay_thread.join()
+    
+    @property
+    def subscriber_count(self) -> int:
+        """Number of connected subscribers"""
+        with self._lock:
+            return len(self._subscribers)
+    
+    def _deliver(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # A stalled client missed events; drop its backlog and tell
+                # it to reload rather than let the queue grow without bound
+                with subscription.mutex:
+                    subscription.queue.clear()
+                subscription.put_nowait(('resync', {}))
+    
+    def _relay_loop(self):
+        """Background thread: deliver events logged by other processes"""
+        last_prune = time.monotonic()
+        
+        while not self._stop_relay.wait(self._relay_interval):
+            try:
+                for event_id, origin, event_type, data in self._store.get_events_after(self._last_id):
+                    self._last_id = event_id
+                    if origin != self._origin:
+                        self._deliver((event_type, json.loads(data)))
+                
+                if time.monotonic() - last_prune > EVENT_RETENTION:
+                    self._store.prune_events(EVENT_RETENTION)
+                    last_prune = time.monotonic()
+            except sqlite3.Error:
+                pass  # Database busy or closing; retry on the next tick
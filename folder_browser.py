@@ -0,0 +1,100 @@
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from video_tracker import MTIME_SETTLE_SECONDS, VIDEO_EXTENSIONS
+
+# Folder browser pages, and how long / how many directory listings are cached
+BROWSE_PAGE_SIZE = 500
+BROWSE_CACHE_TTL = float(os.getenv('BROWSE_CACHE_TTL', '60'))
+BROWSE_CACHE_SIZE = int(os.getenv('BROWSE_CACHE_SIZE', '64'))
+
+class DirectoryListing(NamedTuple):
+    """Visible subdirectories of a directory (sorted) and its own video count"""
+    subdirs: List[str]
+    video_count: int
+
+def list_subdirectories(dir_path: str) -> DirectoryListing:
+    """List a directory's visible subdirectories with os.scandir
+    
+    The entry types come from the directory listing itself, so only
+    symlinks cost an extra stat. Raises OSError if the directory can't be
+    read.
+    """
+    subdirs = []
+    video_count = 0
+    
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                    video_count += 1
+            except OSError:
+                continue  # Broken symlink or entry removed meanwhile
+    
+    subdirs.sort()
+    return DirectoryListing(subdirs, video_count)
+
+class FolderBrowser:
+    """Pages through directory listings for the folder picker
+    
+    Listings are cached per directory and reused while the directory's
+    mtime is unchanged (one stat per request), for at most `ttl` seconds.
+    """
+    
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        self.ttl = BROWSE_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or BROWSE_CACHE_SIZE
+        self._cache = OrderedDict()  # dir_path -> (mtime_ns, cached_at, DirectoryListing)
+        self._lock = threading.Lock()
+    
+    def listing(self, dir_path: str) -> DirectoryListing:
+        """The directory's listing, from the cache when it is still valid"""
+        mtime_ns = os.stat(dir_path).st_mtime_ns
+        now = time.monotonic()
+        
+        with self._lock:
+            cached = self._cache.get(dir_path)
+            if cached and cached[0] == mtime_ns and now - cached[1] < self.ttl:
+                self._cache.move_to_end(dir_path)
+                return cached[2]
+        
+        listing = list_subdirectories(dir_path)
+        
+        # An entry added within the same mtime tick wouldn't change the
+        # mtime, so a directory modified just now isn't cached
+        if mtime_ns < time.time_ns() - int(MTIME_SETTLE_SECONDS * 1e9):
+            with self._lock:
+                self._cache[dir_path] = (mtime_ns, now, listing)
+                self._cache.move_to_end(dir_path)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        
+        return listing
+    
+    def page(self, dir_path: str, prefix: str = '', cursor: str = None,
+             limit: int = None) -> Tuple[List[str], int, Optional[str], int]:
+        """One page of subdirectory names: (names, total matching, next cursor, video count)
+        
+        prefix filters names case-insensitively. Pass the last name of the
+        previous page as `cursor` for the next one.
+        """
+        listing = self.listing(dir_path)
+        names = listing.subdirs
+        if prefix:
+            prefix = prefix.lower()
+            names = [name for name in names if name.lower().startswith(prefix)]
+        
+        limit = limit or BROWSE_PAGE_SIZE
+        start = bisect.bisect_right(names, cursor) if cursor else 0
+        page = names[start:start + limit]
+        next_cursor = page[-1] if start + limit < len(names) else None
+        
+        return page, len(names), next_cursor, listing.video_count
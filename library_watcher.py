@@ -0,0 +1,368 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from events import EventBroker
+from video_tracker import SCAN_FOLLOW_SYMLINKS, VideoTracker
+
+# 'auto' uses inotify where available and polling otherwise; 'inotify' and
+# 'poll' force one backend; 'off' disables watching. Note that inotify does
+# not see changes made by other hosts on NFS/SMB mounts, so use 'poll' there.
+LIBRARY_WATCH = os.getenv('LIBRARY_WATCH', 'off').lower()
+LIBRARY_POLL_INTERVAL = float(os.getenv('LIBRARY_POLL_INTERVAL', '30'))
+
+# Collect inotify events this long before applying them, so copying a whole
+# season becomes one batch
+EVENT_BATCH_DELAY = 0.5
+
+# How often to pick up new folders from root_source, and to retry the
+# leader lock when another process holds it
+ROOT_SYNC_INTERVAL = 10
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+def acquire_process_lock(lock_path: Optional[str], stop: threading.Event):
+    """Block until this process holds an exclusive lock file, or `stop` is set
+    
+    Used so only one of several worker processes runs a background job.
+    Returns the open lock file (close it to release), or None when there is
+    no lock to take.
+    """
+    if not lock_path or fcntl is None:
+        return None
+    
+    lock_file = open(lock_path, 'a')
+    while True:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except OSError:
+            if stop.wait(ROOT_SYNC_INTERVAL):
+                lock_file.close()
+                return None
+
+class _Inotify:
+    """Minimal ctypes binding to Linux inotify (no extra dependency)"""
+    
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+    
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+    
+    def rm_watch(self, wd: int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+    
+    def read_events(self) -> List[Tuple[int, int, int, str]]:
+        """Drain all queued events as (wd, mask, cookie, name)"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((wd, mask, cookie, name))
+    
+    def close(self):
+        os.close(self.fd)
+
+class LibraryWatcher:
+    """Keeps the library index of watched folders current and publishes deltas
+    
+    Each change is applied to the index incrementally: with inotify only the
+    directories that reported events are re-listed, and the polling fallback
+    uses refresh_library(), which re-lists only directories whose mtime
+    changed. Deltas go to the broker as 'library' events with added,
+    removed and renamed video paths.
+    """
+    
+    def __init__(self, tracker: VideoTracker, broker: EventBroker,
+                 mode: str = None, poll_interval: float = None,
+                 root_source: Callable[[], Iterable[str]] = None, lock_path: str = None):
+        """root_source, if given, is polled for folders to watch (e.g. the
+        folder history). With lock_path, only the process holding that lock
+        file watches, so several workers don't all watch the same folders.
+        """
+        self.tracker = tracker
+        self.broker = broker
+        self.poll_interval = poll_interval or LIBRARY_POLL_INTERVAL
+        self.root_source = root_source
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._next_root_sync = 0
+        mode = (mode or LIBRARY_WATCH).lower()
+        
+        self._roots = set()
+        self._new_roots = queue.Queue()
+        self._watches = {}  # wd -> dir_path
+        self._watch_ids = {}  # dir_path -> wd
+        self._inotify = None
+        
+        if mode in ('auto', 'inotify'):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                # No inotify on this platform/libc; fall back to polling
+                if mode == 'inotify':
+                    raise
+        
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='library-watcher')
+        self._thread.start()
+    
+    @property
+    def backend(self) -> str:
+        return 'inotify' if self._inotify else 'poll'
+    
+    def watch(self, folder: str):
+        """Start watching a folder (indexed in the background)"""
+        self._new_roots.put(os.path.normpath(folder))
+    
+    def close(self):
+        """Stop the watcher thread and release inotify"""
+        self._stop.set()
+        self._new_roots.put(None)
+        self._thread.join()
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+    
+    def _sync_roots(self):
+        """Queue folders from root_source that aren't watched yet"""
+        if not self.root_source or time.monotonic() < self._next_root_sync:
+            return
+        self._next_root_sync = time.monotonic() + ROOT_SYNC_INTERVAL
+        
+        try:
+            roots = [os.path.normpath(root) for root in self.root_source()]
+        except Exception:
+            return  # e.g. database busy; try again next time
+        for root in roots:
+            if root not in self._roots:
+                self._new_roots.put(root)
+    
+    def _run(self):
+        self._lock_file = acquire_process_lock(self.lock_path, self._stop)
+        if self._stop.is_set():
+            return
+        
+        while not self._stop.is_set():
+            self._sync_roots()
+            if self._inotify:
+                self._add_new_roots(block=False)
+                self._process_inotify()
+            else:
+                # Wake up for new roots, otherwise poll on the interval
+                if not self._add_new_roots(block=True):
+                    for root in list(self._roots):
+                        self._publish(*self.tracker.refresh_library(root))
+    
+    def _add_new_roots(self, block: bool) -> bool:
+        """Index newly watched folders; returns False if the poll interval elapsed"""
+        try:
+            root = self._new_roots.get(timeout=self.poll_interval) if block else self._new_roots.get_nowait()
+        except queue.Empty:
+            return False
+        
+        while root is not None:
+            if root not in self._roots:
+                self._roots.add(root)
+                self._publish(*self.tracker.refresh_library(root))
+                self._watch_tree(root)
+            try:
+                root = self._new_roots.get_nowait()
+            except queue.Empty:
+                break
+        return True
+    
+    def _watch_tree(self, dir_path: str):
+        """Add inotify watches for an indexed directory and its subdirectories"""
+        if not self._inotify:
+            return
+        
+        for path in self.tracker.get_indexed_dirs(dir_path):
+            if path in self._watch_ids:
+                continue
+            try:
+                wd = self._inotify.add_watch(path)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    # Out of inotify watches (fs.inotify.max_user_watches):
+                    # poll every root instead
+                    self._inotify.close()
+                    self._inotify = None
+                    self._watches.clear()
+                    self._watch_ids.clear()
+                    return
+                continue
+            self._watches[wd] = path
+            self._watch_ids[path] = wd
+    
+    def _unwatch_tree(self, dir_path: str):
+        """Drop the watches for a directory that was moved away or deleted"""
+        prefix = os.path.join(dir_path, '')
+        for path in [p for p in self._watch_ids if p == dir_path or p.startswith(prefix)]:
+            wd = self._watch_ids.pop(path)
+            self._watches.pop(wd, None)
+            self._inotify.rm_watch(wd)
+    
+    def _process_inotify(self):
+        ready, _, _ = select.select([self._inotify.fd], [], [], 1.0)
+        if not ready or self._stop.wait(EVENT_BATCH_DELAY):
+            return
+        
+        dirty = set()  # Directories whose entries changed
+        new_dirs = []  # Directories created or moved into a watched tree
+        moved_from = {}  # inotify cookie -> old path
+        renames = []  # (old path, new path)
+        overflow = False
+        
+        for wd, mask, cookie, name in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            
+            dir_path = self._watches.get(wd)
+            if dir_path is None:
+                continue
+            if mask & IN_IGNORED:
+                # The watched directory itself is gone
+                self._watches.pop(wd, None)
+                self._watch_ids.pop(dir_path, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue  # Handled through the parent directory's events
+            
+            path = os.path.join(dir_path, name)
+            dirty.add(dir_path)
+            
+            if mask & IN_MOVED_FROM:
+                moved_from[cookie] = path
+                if mask & IN_ISDIR:
+                    self._unwatch_tree(path)
+            if mask & IN_MOVED_TO and cookie in moved_from:
+                renames.append((moved_from.pop(cookie), path))
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                new_dirs.append(path)
+        
+        if overflow:
+            # Events were lost; fall back to an incremental refresh of every root
+            for root in list(self._roots):
+                self._publish(*self.tracker.refresh_library(root))
+                self._watch_tree(root)
+            return
+        
+        # Watch new directories before listing them, so nothing created in
+        # between is missed
+        for dir_path in new_dirs:
+            try:
+                wd = self._inotify.add_watch(dir_path)
+                self._watches[wd] = dir_path
+                self._watch_ids[dir_path] = wd
+            except OSError:
+                pass
+        
+        added = []
+        removed = []
+        if SCAN_FOLLOW_SYMLINKS:
+            # A new link may reach a directory indexed elsewhere in the
+            # library, which only a walk of the whole root can tell
+            refreshes = [(root, False, root) for root in sorted({self._root_of(d) for d in dirty})]
+        else:
+            refreshes = [(dir_path, True, self._root_of(dir_path)) for dir_path in sorted(dirty)]
+        for dir_path, shallow, root in refreshes:
+            dir_added, dir_removed = self.tracker.refresh_library(dir_path, shallow=shallow, depth_root=root)
+            added.extend(dir_added)
+            removed.extend(dir_removed)
+        
+        for dir_path in new_dirs:
+            if self._inotify:
+                self._watch_tree(dir_path)
+        
+        self._publish(added, removed, renames)
+    
+    def _root_of(self, dir_path: str) -> str:
+        """The innermost watched root containing a directory"""
+        roots = [root for root in self._roots
+                 if dir_path == root or dir_path.startswith(os.path.join(root, ''))]
+        return max(roots, key=len) if roots else dir_path
+    
+    def _publish(self, added: List[str], removed: List[str], renames: List[Tuple[str, str]] = ()):
+        """Publish a library delta, pairing removals and additions into renames"""
+        added_set = set(added)
+        removed_set = set(removed)
+        renamed = []
+        
+        for old_path, new_path in renames:
+            if old_path in removed_set and new_path in added_set:
+                # A single file was renamed or moved
+                pairs = [(old_path, new_path)]
+            else:
+                # A directory was renamed: pair up the videos inside it
+                old_prefix = os.path.join(old_path, '')
+                pairs = [(path, os.path.join(new_path, path[len(old_prefix):]))
+                         for path in removed_set if path.startswith(old_prefix)]
+            
+            for old, new in pairs:
+                if old in removed_set and new in added_set:
+                    removed_set.discard(old)
+                    added_set.discard(new)
+                    renamed.append({'from': old, 'to': new})
+        
+        if added_set or removed_set or renamed:
+            self.broker.publish('library', {
+                'added': sorted(added_set),
+                'removed': sorted(removed_set),
+                'renamed': renamed
+            })
+
+def create_watcher(tracker: VideoTracker, broker: EventBroker, **options) -> Optional[LibraryWatcher]:
+    """Create the watcher configured by LIBRARY_WATCH, or None when it is off"""
+    if LIBRARY_WATCH == 'off':
+        return None
+    return LibraryWatcher(tracker, broker, **options)
@@ -3,10 +3,53 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import vlc
 import os
+import queue
+import sqlite3
 import threading
 import time
 from pathlib import Path
-from video_tracker import VideoTracker, find_videos
+from video_tracker import VideoTracker
+from events import EventBroker
+from library_watcher import create_watcher
+from catalog import VideoCatalog
+
+# Seconds between progress saves while a video plays
+PROGRESS_SAVE_INTERVAL = 5
+
+# Milliseconds between deliveries of player events to the UI while playing
+PLAYER_EVENT_INTERVAL = 200
+
+# Saved positions this close to the end (fraction of the duration) start over
+RESUME_LIMIT = 0.95
+
+class ProgressWriter:
+    """Runs progress saves on a background thread, in order, so the UI never waits on disk"""
+    
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def save(self, file_path, position, duration, flush=False):
+        """Queue a save_progress call"""
+        self.queue.put((file_path, position, duration, flush))
+    
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            file_path, position, duration, flush = item
+            try:
+                self.tracker.save_progress(file_path, position, duration, flush=flush)
+            except sqlite3.Error:
+                pass  # A failed flush stays buffered in the tracker and is retried
+    
+    def close(self):
+        """Write the queued saves, then stop"""
+        self.queue.put(None)
+        self.thread.join()
 
 class VideoPlayerApp:
     def __init__(self, root):
@@ -15,15 +58,33 @@ class VideoPlayerApp:
         self.root.geometry("1200x700")
         
         self.tracker = VideoTracker()
+        
+        # One VLC instance and player for the whole session; the media of the
+        # videos around the current one are parsed ahead of time
+        self.vlc_instance = vlc.Instance()
         self.player = None
+        self.preloaded = {}  # Path -> vlc.Media
+        self.pending_resume = None  # Saved position to offer once playback starts
         self.current_video = None
-        self.video_list = []
+        self.video_list = VideoCatalog('')
         self.is_playing = False
-        self.progress_update_thread = None
-        self.should_update = False
         self.selected_folder = None
         
+        # Player events arrive on VLC's threads and are handled on the Tk loop
+        self.player_events = queue.SimpleQueue()
+        self.player_events_scheduled = False
+        self.current_length = 0
+        self.last_save = 0
+        self.progress_writer = ProgressWriter(self.tracker)
+        
+        # Optional library watcher (LIBRARY_WATCH) keeps the list current
+        self.events = EventBroker()
+        self.library_events = self.events.subscribe()
+        self.watcher = create_watcher(self.tracker, self.events)
+        
         self.setup_ui()
+        if self.watcher:
+            self.root.after(1000, self.check_library_events)
         
     def setup_ui(self):
         """Setup the user interface"""
@@ -126,10 +187,12 @@ class VideoPlayerApp:
             self.selected_folder = folder
             self.folder_label.config(text=f"Folder: {os.path.basename(folder)}", foreground="black")
             self.load_videos(folder)
+            if self.watcher:
+                self.watcher.watch(folder)
     
     def load_videos(self, folder):
         """Load all videos from the selected folder"""
-        self.video_list = find_videos(folder)
+        self.video_list = VideoCatalog.build(folder, self.tracker.scan_library(folder))
         self.update_video_list()
         
         if self.video_list:
@@ -141,21 +204,36 @@ class VideoPlayerApp:
         """Update the video listbox"""
         self.video_listbox.delete(0, tk.END)
         
-        for video_path in self.video_list:
-            # Get relative path for display
-            if self.selected_folder:
-                display_name = os.path.relpath(video_path, self.selected_folder)
-            else:
-                display_name = os.path.basename(video_path)
-            
-            # Check if video has progress
-            progress = self.tracker.get_progress(video_path)
-            if progress and progress[1]:  # Has duration
-                percent = (progress[0] / progress[1]) * 100
+        # Fetch progress for the whole listing at once, into a compact catalog
+        progress_map = self.tracker.get_progress_for_folder(self.video_list.root)
+        self.video_list = VideoCatalog.build(self.video_list.root, self.video_list, progress_map)
+        
+        for index in range(len(self.video_list)):
+            # Relative path for display, with progress if the duration is known
+            display_name = self.video_list.display_name(index)
+            percent = self.video_list.percent(index)
+            if percent is not None:
                 display_name = f"[{percent:.0f}%] {display_name}"
             
             self.video_listbox.insert(tk.END, display_name)
     
+    def check_library_events(self):
+        """Reload the list from the index when the watcher reports changes"""
+        changed = False
+        while not self.library_events.empty():
+            event_type, data = self.library_events.get_nowait()
+            if self.selected_folder:
+                prefix = os.path.join(self.selected_folder, '')
+                paths = data.get('added', []) + data.get('removed', []) + [p for r in data.get('renamed', []) for p in (r['from'], r['to'])]
+                changed = changed or event_type == 'resync' or any(p.startswith(prefix) for p in paths)
+        
+        if changed:
+            self.video_list = VideoCatalog.build(self.selected_folder,
+                                                 self.tracker.get_indexed_videos(self.selected_folder))
+            self.update_video_list()
+        
+        self.root.after(1000, self.check_library_events)
+    
     def on_video_select(self, event):
         """Handle video selection from list"""
         selection = self.video_listbox.curselection()
@@ -173,52 +251,143 @@ class VideoPlayerApp:
         # Stop current video if playing
         if self.player:
             self.stop_video()
+        else:
+            self.create_player()
         
         self.current_video = video_path
         
-        # Create VLC instance and player
-        instance = vlc.Instance()
-        self.player = instance.media_player_new()
-        
-        # Set video output to the panel
-        if os.name == 'nt':  # Windows
-            self.player.set_hwnd(self.video_panel.winfo_id())
-        else:  # Linux/Mac
-            self.player.set_xwindow(self.video_panel.winfo_id())
-        
-        # Load media
-        media = instance.media_new(video_path)
+        # Load media, parsed already if it was preloaded
+        media = self.preloaded.pop(video_path, None) or self.vlc_instance.media_new(video_path)
         self.player.set_media(media)
+        media.release()  # The player holds its own reference
+        self.current_length = 0
+        self.last_save = time.monotonic()
         
         # Update info
         filename = os.path.basename(video_path)
         self.info_label.config(text=f"Playing: {filename}", foreground="black")
         
+        # Offer the saved position once playback has started
+        progress = self.tracker.get_progress(video_path)
+        self.pending_resume = progress if progress and progress[0] > 0 else None
+        
         # Start playing
         self.player.play()
         self.is_playing = True
         self.play_button.config(text="⏸ Pause")
+        self.schedule_player_events()
         
-        # Wait for video to load
-        time.sleep(0.5)
+        self.preload_neighbours(video_path)
+    
+    def create_player(self):
+        """Create the media player, drawing into the video panel"""
+        self.player = self.vlc_instance.media_player_new()
         
-        # Check for saved progress and resume
-        progress = self.tracker.get_progress(video_path)
-        if progress and progress[0] > 0:
-            position_ms = progress[0]
-            duration_ms = progress[1] if progress[1] else self.player.get_length()
+        # Set video output to the panel
+        if os.name == 'nt':  # Windows
+            self.player.set_hwnd(self.video_panel.winfo_id())
+        else:  # Linux/Mac
+            self.player.set_xwindow(self.video_panel.winfo_id())
+        
+        self.attach_player_events(self.player)
+    
+    def preload_neighbours(self, video_path):
+        """Parse the media of the next and previous videos in the background"""
+        try:
+            index = self.video_list.index(video_path)
+        except ValueError:
+            return
+        neighbours = [self.video_list[i] for i in (index + 1, index - 1) if 0 <= i < len(self.video_list)]
+        
+        for path in list(self.preloaded):
+            if path not in neighbours:
+                self.preloaded.pop(path).release()
+        for path in neighbours:
+            if path not in self.preloaded and os.path.exists(path):
+                media = self.vlc_instance.media_new(path)
+                media.parse_with_options(vlc.MediaParseFlag.local, 0)  # Asynchronous
+                self.preloaded[path] = media
+    
+    def attach_player_events(self, player):
+        """Forward the player's playing, time, length and end events to the Tk loop"""
+        # The callbacks run on VLC's threads, which must not call into Tk
+        # (and a Tk call could deadlock against player.stop() on the main
+        # thread), so they only queue the event
+        events = player.event_manager()
+        events.event_attach(vlc.EventType.MediaPlayerPlaying,
+                            lambda event: self.player_events.put(('playing', None)))
+        events.event_attach(vlc.EventType.MediaPlayerTimeChanged,
+                            lambda event: self.player_events.put(('time', event.u.new_time)))
+        events.event_attach(vlc.EventType.MediaPlayerLengthChanged,
+                            lambda event: self.player_events.put(('length', event.u.new_length)))
+        events.event_attach(vlc.EventType.MediaPlayerEndReached,
+                            lambda event: self.player_events.put(('end', None)))
+    
+    def schedule_player_events(self):
+        """Start delivering player events to the UI (it stops on its own when playback does)"""
+        if not self.player_events_scheduled:
+            self.player_events_scheduled = True
+            self.root.after(PLAYER_EVENT_INTERVAL, self.process_player_events)
+    
+    def process_player_events(self):
+        """Apply the queued player events; runs on the Tk loop"""
+        time_ms = None
+        playing = ended = False
+        while not self.player_events.empty():
+            kind, value = self.player_events.get_nowait()
+            if kind == 'playing':
+                playing = True
+            elif kind == 'time':
+                time_ms = value  # Only the latest time is shown
+            elif kind == 'length':
+                self.current_length = value
+            elif kind == 'end':
+                ended = True
+        
+        if playing and self.pending_resume:
+            self.offer_resume()
+        
+        if time_ms is not None and self.current_length > 0:
+            self.show_progress(time_ms, self.current_length)
             
-            # Only resume if not near the end (more than 5% remaining)
-            if duration_ms and position_ms < duration_ms * 0.95:
-                response = messagebox.askyesno("Resume", 
-                    f"Resume from {self.format_time(position_ms)}?")
-                if response:
-                    self.player.set_time(position_ms)
-        
-        # Start progress update thread
-        self.should_update = True
-        self.progress_update_thread = threading.Thread(target=self.update_progress, daemon=True)
-        self.progress_update_thread.start()
+            # Save progress every few seconds
+            if time.monotonic() - self.last_save > PROGRESS_SAVE_INTERVAL:
+                self.progress_writer.save(self.current_video, time_ms, self.current_length)
+                self.last_save = time.monotonic()
+        
+        if ended:
+            self.player_events_scheduled = False
+            self.on_end_reached()
+        elif self.is_playing:
+            self.root.after(PLAYER_EVENT_INTERVAL, self.process_player_events)
+        else:
+            self.player_events_scheduled = False  # Paused or stopped: nothing to deliver
+    
+    def offer_resume(self):
+        """Ask whether to continue from the saved position of the video that just started"""
+        position_ms, duration_ms = self.pending_resume[:2]
+        self.pending_resume = None
+        duration_ms = duration_ms or self.player.get_length()
+        
+        # Only resume if not near the end (more than 5% remaining)
+        if duration_ms and position_ms < duration_ms * RESUME_LIMIT:
+            response = messagebox.askyesno("Resume",
+                f"Resume from {self.format_time(position_ms)}?")
+            if response:
+                self.player.set_time(position_ms)
+    
+    def show_progress(self, time_ms, duration):
+        """Update the progress bar and time label"""
+        self.progress_var.set((time_ms / duration) * 100)
+        self.time_label.config(text=f"{self.format_time(time_ms)} / {self.format_time(duration)}")
+    
+    def on_end_reached(self):
+        """Mark the finished video as watched and move on to the next one"""
+        if self.current_length > 0:
+            self.progress_writer.save(self.current_video, self.current_length, self.current_length, flush=True)
+        self.is_playing = False
+        self.play_button.config(text="▶ Play")
+        self.next_video()
     
     def toggle_play(self):
         """Toggle play/pause"""
@@ -228,11 +397,17 @@ class VideoPlayerApp:
         if self.is_playing:
             self.player.pause()
             self.is_playing = False
+            
+            # Persist the paused position right away
+            position = self.player.get_time()
+            if self.current_video and position > 0:
+                self.progress_writer.save(self.current_video, position, self.player.get_length(), flush=True)
             self.play_button.config(text="▶ Play")
         else:
             self.player.play()
             self.is_playing = True
             self.play_button.config(text="⏸ Pause")
+            self.schedule_player_events()
     
     def stop_video(self):
         """Stop the current video"""
@@ -242,10 +417,12 @@ class VideoPlayerApp:
                 position = self.player.get_time()
                 duration = self.player.get_length()
                 if position > 0:
-                    self.tracker.save_progress(self.current_video, position, duration)
+                    self.progress_writer.save(self.current_video, position, duration, flush=True)
             
-            self.should_update = False
             self.player.stop()
+            while not self.player_events.empty():
+                self.player_events.get_nowait()  # Don't let queued times overwrite the reset below
+            self.pending_resume = None
             self.is_playing = False
             self.play_button.config(text="▶ Play")
             self.progress_var.set(0)
@@ -304,35 +481,6 @@ class VideoPlayerApp:
         if self.player:
             self.player.set_rate(speed)
     
-    def update_progress(self):
-        """Update progress bar and save progress periodically"""
-        last_save = 0
-        
-        while self.should_update:
-            if self.player and self.player.get_length() > 0:
-                current_time = self.player.get_time()
-                duration = self.player.get_length()
-                
-                # Update progress bar
-                progress = (current_time / duration) * 100
-                self.progress_var.set(progress)
-                
-                # Update time label
-                self.time_label.config(
-                    text=f"{self.format_time(current_time)} / {self.format_time(duration)}"
-                )
-                
-                # Save progress every 5 seconds
-                if time.time() - last_save > 5:
-                    self.tracker.save_progress(self.current_video, current_time, duration)
-                    last_save = time.time()
-                
-                # Check if video ended
-                if current_time >= duration - 1000 and self.is_playing:
-                    self.root.after(0, self.next_video)
-            
-            time.sleep(0.1)
-    
     def refresh_videos(self):
         """Refresh the video list"""
         if self.selected_folder:
@@ -360,6 +508,14 @@ class VideoPlayerApp:
         """Handle window close"""
         if self.player:
             self.stop_video()
+            self.player.release()
+        for media in self.preloaded.values():
+            media.release()
+        self.vlc_instance.release()
+        self.progress_writer.close()
+        if self.watcher:
+            self.watcher.close()
+        self.tracker.close()
         self.root.destroy()
 
 def main():
@@ -0,0 +1,516 @@
+import logging
+import os
+import queue
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+
+from events import EventBroker
+from library_watcher import acquire_process_lock
+from video_tracker import VideoTracker
+
+# Background probing of unwatched videos ('on' or 'off'), worker threads,
+# and files probed per second (slower while videos are being streamed)
+MEDIA_PROBE = os.getenv('MEDIA_PROBE', 'on').lower()
+PROBE_WORKERS = int(os.getenv('PROBE_WORKERS', '2'))
+PROBE_RATE = float(os.getenv('PROBE_RATE', '20'))
+PROBE_RATE_STREAMING = float(os.getenv('PROBE_RATE_STREAMING', '2'))
+
+# Files probed per database write, and seconds between checks for new files
+PROBE_BATCH_SIZE = 50
+PROBE_IDLE_INTERVAL = 30
+
+# Most boxes/elements/chunks read per level, so a corrupt file can't turn a
+# probe into a full read
+MAX_BOXES = 4096
+
+# Largest header field read whole; sizes come from the file, so a field
+# claiming more (or a negative size) marks the file as unprobeable
+MAX_ELEMENT_BYTES = 4096
+
+logger = logging.getLogger(__name__)
+
+# Container codec identifiers -> short codec names
+CODEC_NAMES = {
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264', 'x264': 'h264', 'V_MPEG4/ISO/AVC': 'h264',
+    'hvc1': 'hevc', 'hev1': 'hevc', 'h265': 'hevc', 'hevc': 'hevc', 'V_MPEGH/ISO/HEVC': 'hevc',
+    'vp08': 'vp8', 'V_VP8': 'vp8', 'vp09': 'vp9', 'V_VP9': 'vp9',
+    'av01': 'av1', 'V_AV1': 'av1',
+    'mp4v': 'mpeg4', 'xvid': 'mpeg4', 'divx': 'mpeg4', 'dx50': 'mpeg4', 'fmp4': 'mpeg4',
+    'V_MPEG4/ISO/ASP': 'mpeg4', 'V_MPEG4/ISO/SP': 'mpeg4',
+    'mjpg': 'mjpeg', 'V_MJPEG': 'mjpeg', 'V_MPEG2': 'mpeg2', 'V_THEORA': 'theora',
+}
+
+def _codec_name(codec_id) -> Optional[str]:
+    """Normalize a fourcc or Matroska CodecID"""
+    if isinstance(codec_id, bytes):
+        codec_id = codec_id.decode('latin-1')
+    codec_id = (codec_id or '').strip('\0 ')
+    if not codec_id:
+        return None
+    return CODEC_NAMES.get(codec_id) or CODEC_NAMES.get(codec_id.lower()) or codec_id.lower()
+
+def probe_media(file_path: str) -> Optional[Dict[str, Any]]:
+    """Read duration (ms), width, height and video codec from a container header
+    
+    Supports MP4/MOV (moov/mvhd), Matroska/WebM (Segment/Info, Tracks) and
+    AVI (hdrl). Only the header structures are read. Returns None for other
+    formats or unreadable files; missing fields are None.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            magic = f.read(12)
+            f.seek(0)
+            
+            if magic[:4] == b'RIFF' and magic[8:12] == b'AVI ':
+                return _probe_avi(f, size)
+            if magic[:4] == b'\x1a\x45\xdf\xa3':
+                return _probe_matroska(f, size)
+            if magic[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+                return _probe_mp4(f, size)
+    except (OSError, struct.error, ValueError, IndexError):
+        pass
+    return None
+
+# MP4 / QuickTime
+
+def _iter_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, payload start, box end) for the ISO BMFF boxes in a range"""
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset + 8 > end:
+            return
+        f.seek(offset)
+        box_size, box_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if box_size == 1:
+            box_size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < header:
+            return
+        yield box_type, offset + header, min(offset + box_size, end)
+        offset += box_size
+
+def _read_payload(f: BinaryIO, start: int, end: int, limit: int) -> bytes:
+    """The first `limit` bytes (at most) of a box or chunk"""
+    if end < start:
+        raise ValueError("Negative payload size")
+    f.seek(start)
+    return f.read(min(end - start, limit))
+
+def _read_element(f: BinaryIO, start: int, end: int, max_size: int = MAX_ELEMENT_BYTES) -> bytes:
+    """The whole data of a header field; ValueError unless 0 <= size <= max_size"""
+    if not 0 <= end - start <= min(max_size, MAX_ELEMENT_BYTES):
+        raise ValueError(f"Header field of {end - start} bytes")
+    f.seek(start)
+    return f.read(end - start)
+
+def _probe_mp4(f: BinaryIO, size: int) -> Optional[Dict[str, Any]]:
+    # moov may be after mdat; seeking over mdat costs nothing
+    for box_type, start, end in _iter_boxes(f, 0, size):
+        if box_type == b'moov':
+            return _parse_moov(f, start, end)
+    return None
+
+def _parse_moov(f: BinaryIO, start: int, end: int) -> Dict[str, Any]:
+    info = {'duration': None, 'width': None, 'height': None, 'codec': None}
+    timescale = duration = None
+    fragment_duration = None
+    
+    for box_type, box_start, box_end in list(_iter_boxes(f, start, end)):
+        if box_type == b'mvhd':
+            data = _read_payload(f, box_start, box_end, 32)
+            if data[0] == 1:
+                timescale, duration = struct.unpack_from('>IQ', data, 20)
+            else:
+                timescale, duration = struct.unpack_from('>II', data, 12)
+        elif box_type == b'mvex':
+            # Fragmented MP4: the movie header duration is often 0
+            for child_type, child_start, child_end in _iter_boxes(f, box_start, box_end):
+                if child_type == b'mehd':
+                    data = _read_payload(f, child_start, child_end, 12)
+                    fragment_duration = struct.unpack_from('>Q' if data[0] == 1 else '>I', data, 4)[0]
+        elif box_type == b'trak' and info['codec'] is None:
+            track = _parse_trak(f, box_start, box_end)
+            if track.get('handler') == b'vide':
+                info['width'] = track.get('width')
+                info['height'] = track.get('height')
+                info['codec'] = _codec_name(track.get('codec'))
+    
+    duration = duration or fragment_duration
+    if timescale and duration:
+        info['duration'] = duration * 1000 // timescale
+    return info
+
+def _parse_trak(f: BinaryIO, start: int, end: int) -> Dict[str, Any]:
+    track = {}
+    for box_type, box_start, box_end in list(_iter_boxes(f, start, end)):
+        if box_type == b'tkhd':
+            data = _read_payload(f, box_start, box_end, 96)
+            offset = 88 if data[0] == 1 else 76
+            if len(data) >= offset + 8:
+                width, height = struct.unpack_from('>II', data, offset)
+                track['width'], track['height'] = width >> 16, height >> 16
+        elif box_type in (b'mdia', b'minf', b'stbl'):
+            track.update(_parse_trak(f, box_start, box_end))
+        elif box_type == b'hdlr':
+            track['handler'] = _read_payload(f, box_start, box_end, 12)[8:12]
+        elif box_type == b'stsd':
+            data = _read_payload(f, box_start, box_end, 16)
+            if len(data) >= 16:
+                track['codec'] = data[12:16]
+    return track
+
+# Matroska / WebM (EBML)
+
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_TYPE = 0x83
+MKV_CODEC_ID = 0x86
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+MKV_CLUSTER = 0x1F43B675
+
+def _read_vint(f: BinaryIO, keep_marker: bool) -> Tuple[Optional[int], int]:
+    """Read an EBML variable-length integer; returns (value, length)
+    
+    The value is None for the reserved "unknown size" encoding.
+    """
+    first = f.read(1)
+    if not first:
+        raise ValueError("Unexpected end of file")
+    first = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8:
+        raise ValueError("Invalid EBML integer")
+    
+    value = first if keep_marker else first & (mask - 1)
+    for byte in f.read(length - 1):
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, length
+    return value, length
+
+def _iter_ebml(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[int, int, Optional[int]]]:
+    """Yield (id, data start, data end) for EBML elements in a range
+    
+    Data end is None for an element of unknown size, which ends iteration.
+    """
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset >= end:
+            return
+        f.seek(offset)
+        element_id, id_length = _read_vint(f, keep_marker=True)
+        size, size_length = _read_vint(f, keep_marker=False)
+        data_start = offset + id_length + size_length
+        if size is None:
+            yield element_id, data_start, None
+            return
+        yield element_id, data_start, min(data_start + size, end)
+        offset = data_start + size
+
+def _read_uint(f: BinaryIO, start: int, end: int) -> int:
+    return int.from_bytes(_read_element(f, start, end, 8), 'big')
+
+def _probe_matroska(f: BinaryIO, size: int) -> Optional[Dict[str, Any]]:
+    segment = None
+    for element_id, start, end in _iter_ebml(f, 0, size):
+        if element_id == MKV_SEGMENT:
+            segment = (start, end if end is not None else size)
+            break
+    if segment is None:
+        return None
+    
+    info = {'duration': None, 'width': None, 'height': None, 'codec': None}
+    timecode_scale = 1000000  # ns per tick (Matroska default)
+    duration = None
+    seen_tracks = False
+    
+    for element_id, start, end in _iter_ebml(f, *segment):
+        if end is None or element_id == MKV_CLUSTER:
+            break  # Headers come before the media data
+        
+        if element_id == MKV_INFO:
+            for child_id, child_start, child_end in list(_iter_ebml(f, start, end)):
+                if child_end is None:
+                    break
+                if child_id == MKV_TIMECODE_SCALE:
+                    timecode_scale = _read_uint(f, child_start, child_end) or timecode_scale
+                elif child_id == MKV_DURATION:
+                    data = _read_element(f, child_start, child_end, 8)
+                    if len(data) in (4, 8):
+                        duration = struct.unpack('>f' if len(data) == 4 else '>d', data)[0]
+        elif element_id == MKV_TRACKS:
+            seen_tracks = True
+            for entry_id, entry_start, entry_end in list(_iter_ebml(f, start, end)):
+                if entry_end is None:
+                    break
+                if entry_id == MKV_TRACK_ENTRY and info['codec'] is None:
+                    _parse_mkv_track(f, entry_start, entry_end, info)
+        
+        if duration is not None and seen_tracks:
+            break
+    
+    if duration:
+        info['duration'] = int(duration * timecode_scale / 1000000)
+    return info
+
+def _parse_mkv_track(f: BinaryIO, start: int, end: int, info: Dict[str, Any]):
+    track_type = codec_id = width = height = None
+    for element_id, child_start, child_end in list(_iter_ebml(f, start, end)):
+        if child_end is None:
+            break
+        if element_id == MKV_TRACK_TYPE:
+            track_type = _read_uint(f, child_start, child_end)
+        elif element_id == MKV_CODEC_ID:
+            codec_id = _read_element(f, child_start, child_end)[:64]
+        elif element_id == MKV_VIDEO:
+            for video_id, video_start, video_end in list(_iter_ebml(f, child_start, child_end)):
+                if video_end is None:
+                    break
+                if video_id == MKV_PIXEL_WIDTH:
+                    width = _read_uint(f, video_start, video_end)
+                elif video_id == MKV_PIXEL_HEIGHT:
+                    height = _read_uint(f, video_start, video_end)
+    
+    if track_type == 1:  # Video
+        info['codec'] = _codec_name(codec_id)
+        info['width'] = width
+        info['height'] = height
+
+# AVI (RIFF)
+
+def _iter_riff(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (chunk id, data start, data end) for RIFF chunks in a range"""
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset + 8 > end:
+            return
+        f.seek(offset)
+        chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+        yield chunk_id, offset + 8, min(offset + 8 + chunk_size, end)
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+def _probe_avi(f: BinaryIO, size: int) -> Optional[Dict[str, Any]]:
+    info = {'duration': None, 'width': None, 'height': None, 'codec': None}
+    frame_usec = total_frames = stream_duration = None
+    
+    # Only the RIFF 'AVI ' chunk; later 'AVIX' chunks (OpenDML) hold media
+    f.seek(4)
+    riff_end = min(8 + struct.unpack('<I', f.read(4))[0], size)
+    
+    for chunk_id, start, end in _iter_riff(f, 12, riff_end):
+        if chunk_id != b'LIST':
+            continue
+        f.seek(start)
+        if f.read(4) != b'hdrl':
+            continue  # 'movi' and friends hold the media data
+        
+        for child_id, child_start, child_end in list(_iter_riff(f, start + 4, end)):
+            if child_id == b'avih':
+                data = _read_payload(f, child_start, child_end, 40)
+                frame_usec, total_frames = struct.unpack_from('<I12xI', data, 0)
+                info['width'], info['height'] = struct.unpack_from('<II', data, 32)
+            elif child_id == b'LIST':
+                f.seek(child_start)
+                list_type = f.read(4)
+                if list_type == b'strl' and info['codec'] is None:
+                    stream_duration = _parse_avi_stream(f, child_start + 4, child_end, info)
+                elif list_type == b'odml':
+                    # OpenDML: the frame count in avih only covers the first 1 GB
+                    for odml_id, odml_start, odml_end in _iter_riff(f, child_start + 4, child_end):
+                        if odml_id == b'dmlh':
+                            total_frames = _read_uint_le(f, odml_start, 4) or total_frames
+        break
+    
+    if stream_duration:
+        info['duration'] = stream_duration
+    elif frame_usec and total_frames:
+        info['duration'] = frame_usec * total_frames // 1000
+    return info
+
+def _read_uint_le(f: BinaryIO, start: int, length: int) -> int:
+    f.seek(start)
+    return int.from_bytes(f.read(length), 'little')
+
+def _parse_avi_stream(f: BinaryIO, start: int, end: int, info: Dict[str, Any]) -> Optional[int]:
+    """Parse a video stream's strh/strf; returns its duration in ms"""
+    handler = compression = None
+    duration = None
+    for chunk_id, chunk_start, chunk_end in list(_iter_riff(f, start, end)):
+        if chunk_id == b'strh':
+            data = _read_payload(f, chunk_start, chunk_end, 36)
+            if data[:4] != b'vids':
+                return None
+            handler = data[4:8]
+            scale, rate, _, length = struct.unpack_from('<IIII', data, 20)
+            if scale and rate and length:
+                duration = length * scale * 1000 // rate
+        elif chunk_id == b'strf':
+            # BITMAPINFOHEADER biCompression
+            data = _read_payload(f, chunk_start, chunk_end, 20)
+            if len(data) >= 20:
+                compression = data[16:20]
+    
+    info['codec'] = _codec_name(compression if compression and compression.strip(b'\0') else handler)
+    return duration
+
+class _RateLimiter:
+    """Spaces calls out to at most `rate()` per second across threads"""
+    
+    def __init__(self, rate: Callable[[], float]):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+    
+    def wait(self, stop: threading.Event) -> bool:
+        """Block until the next slot; False if stopped first"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / max(self.rate(), 0.01)
+        return not stop.wait(slot - now) if slot > now else not stop.is_set()
+
+class MediaProber:
+    """Background pool that probes indexed videos and stores their metadata
+    
+    Files are probed once: results are keyed by path, size and mtime, and
+    only files without a matching row are probed. Probing is rate limited,
+    and slows down further while `is_streaming()` reports active streams,
+    so it never competes with playback for disk bandwidth.
+    """
+    
+    def __init__(self, tracker: VideoTracker, broker: EventBroker = None,
+                 workers: int = None, is_streaming: Callable[[], bool] = None,
+                 lock_path: str = None):
+        self.tracker = tracker
+        self.broker = broker
+        self.lock_path = lock_path
+        self.is_streaming = is_streaming or (lambda: False)
+        
+        self._limiter = _RateLimiter(lambda: PROBE_RATE_STREAMING if self.is_streaming() else PROBE_RATE)
+        self._executor = ThreadPoolExecutor(max_workers=workers or PROBE_WORKERS, thread_name_prefix='media-probe')
+        self._folders = queue.Queue()
+        self._stop = threading.Event()
+        self._lock_file = None
+        self._thread = threading.Thread(target=self._run, daemon=True, name='media-prober')
+        self._thread.start()
+    
+    def probe_folder(self, folder: str):
+        """Probe a folder's videos ahead of the rest of the library"""
+        self._folders.put(os.path.normpath(folder))
+    
+    def close(self):
+        """Stop probing (results probed so far are kept)"""
+        self._stop.set()
+        self._folders.put(None)
+        self._thread.join()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+    
+    def _run(self):
+        self._lock_file = acquire_process_lock(self.lock_path, self._stop)
+        if self._stop.is_set():
+            return
+        
+        while not self._stop.is_set():
+            try:
+                folder = self._folders.get(timeout=PROBE_IDLE_INTERVAL)
+            except queue.Empty:
+                folder = ''  # Idle: work through the rest of the library
+            if folder is None:
+                break
+            
+            try:
+                if folder:
+                    self._revalidate(folder)
+                    self._probe_pending(folder)
+                self._probe_pending('')
+            except sqlite3.Error:
+                pass  # Database busy or closing; pick up again next round
+            except RuntimeError:
+                break  # Interpreter exiting: the thread pool no longer accepts work
+            except Exception:
+                logger.exception("Media probing round failed; retrying in the next one")
+    
+    def _revalidate(self, folder: str):
+        """Forget metadata for files in a folder whose size or mtime changed"""
+        metadata = self.tracker.get_media_metadata_for_folder(folder)
+        
+        def changed(path):
+            size, mtime_ns = metadata[path][:2]
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False  # Gone; the library index drops it
+            return stat.st_size != size or stat.st_mtime_ns != mtime_ns
+        
+        stale = [path for path, is_changed in zip(metadata, self._executor.map(changed, metadata)) if is_changed]
+        if stale:
+            self.tracker.delete_media_metadata(stale)
+    
+    def _probe_pending(self, folder: str):
+        """Probe every indexed video under a folder ('' for all) that has no metadata"""
+        while not self._stop.is_set():
+            paths = self.tracker.get_unprobed_videos(folder or None, limit=PROBE_BATCH_SIZE)
+            if not paths:
+                return
+            
+            rows = [row for row in self._executor.map(self._probe_file, paths) if row]
+            if len(rows) < len(paths):
+                return  # Stopped midway
+            
+            self.tracker.save_media_metadata(rows)
+            if self.broker:
+                self.broker.publish('metadata', {'videos': [
+                    {'path': path, 'duration': duration, 'width': width, 'height': height, 'codec': codec}
+                    for path, _, _, duration, width, height, codec in rows
+                ]})
+            
+            # A folder the user just opened goes before the rest of the library
+            if not folder and not self._folders.empty():
+                return
+    
+    def _probe_file(self, path: str):
+        if not self._limiter.wait(self._stop):
+            return None
+        
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Gone since it was indexed; record it so it isn't retried
+            return (path, -1, -1, None, None, None, None)
+        
+        try:
+            info = probe_media(path) or {}
+        except Exception:
+            # Recorded without metadata like any unprobeable file, so one bad
+            # file can't stop probing or be retried forever
+            logger.exception("Probing %s failed", path)
+            info = {}
+        return (path, stat.st_size, stat.st_mtime_ns, info.get('duration'),
+                info.get('width'), info.get('height'), info.get('codec'))
+
+def create_prober(tracker: VideoTracker, broker: EventBroker = None, **options) -> Optional[MediaProber]:
+    """Create the prober configured by MEDIA_PROBE, or None when it is off"""
+    if MEDIA_PROBE == 'off':
+        return None
+    return MediaProber(tracker, broker, **options)
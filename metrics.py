@@ -0,0 +1,267 @@
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Serve Prometheus metrics at /metrics ('on' or 'off')
+METRICS_ENABLED = os.getenv('METRICS', 'off').lower() == 'on'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Histogram bucket upper bounds (seconds)
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+SCAN_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Shards of threads that have exited are folded into the totals once a
+# family has more than this many
+MAX_IDLE_SHARDS = 64
+
+REGISTRY: List['_Family'] = []
+
+class _Family:
+    """A metric with optional labels, counted without locks
+    
+    Every thread updates its own shard (label index -> list of numbers), so
+    an update is a thread-local lookup and an in-place add. Shards are only
+    summed when the metrics are rendered. Locks are only taken the first
+    time a thread or a label set is seen.
+    """
+    
+    kind = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._labelsets: List[Tuple[str, ...]] = []
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._shards: List[Tuple[threading.Thread, Dict[int, list]]] = []
+        self._retired: Dict[int, list] = {}  # Totals from threads that have exited
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._default = self.labels() if not self.labelnames else None
+        REGISTRY.append(self)
+    
+    def labels(self, *values: str):
+        """The child metric for a set of label values (cached; resolve it once on hot paths)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    index = len(self._labelsets)
+                    self._labelsets.append(values)
+                    child = self._children[values] = self._child_class(self, index)
+        return child
+    
+    def _values(self, index: int) -> list:
+        """This thread's numbers for a label set"""
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        values = shard.get(index)
+        if values is None:
+            values = shard[index] = self._zero()
+        return values
+    
+    def _new_shard(self) -> Dict[int, list]:
+        shard = self._local.shard = {}
+        with self._lock:
+            if len(self._shards) > MAX_IDLE_SHARDS:
+                self._retire_dead_shards()
+            self._shards.append((threading.current_thread(), shard))
+        return shard
+    
+    def _retire_dead_shards(self):
+        """Fold the shards of exited threads into _retired; holds _lock"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                for index, values in shard.items():
+                    self._add(self._retired.setdefault(index, self._zero()), values)
+        self._shards = alive
+    
+    def _totals(self) -> Dict[int, list]:
+        """Per label index, the numbers summed over all threads"""
+        with self._lock:
+            self._retire_dead_shards()
+            totals = {index: list(values) for index, values in self._retired.items()}
+            shards = [shard for _, shard in self._shards]
+        
+        for shard in shards:
+            for index, values in shard.copy().items():
+                self._add(totals.setdefault(index, self._zero()), values)
+        return totals
+    
+    @staticmethod
+    def _add(total: list, values: list):
+        for i, value in enumerate(values):
+            total[i] += value
+    
+    def _label_text(self, index: int, extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, self._labelsets[index])]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+    
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        totals = self._totals()
+        if not self.labelnames:
+            totals.setdefault(0, self._zero())  # Unlabelled metrics are always shown
+        for index, values in sorted(totals.items()):
+            lines.extend(self._samples(index, values))
+        return lines
+
+class _CounterChild:
+    __slots__ = ('_family', '_index')
+    
+    def __init__(self, family: _Family, index: int):
+        self._family = family
+        self._index = index
+    
+    def inc(self, amount: float = 1):
+        self._family._values(self._index)[0] += amount
+
+class Counter(_Family):
+    """Monotonic total (use labels(...).inc() when the family has labels)"""
+    
+    kind = 'counter'
+    _child_class = _CounterChild
+    
+    def _zero(self) -> list:
+        return [0]
+    
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+    
+    def _samples(self, index: int, values: list) -> List[str]:
+        return [f'{self.name}{self._label_text(index)} {_number(values[0])}']
+
+class _HistogramChild:
+    __slots__ = ('_family', '_index', '_buckets')
+    
+    def __init__(self, family: 'Histogram', index: int):
+        self._family = family
+        self._index = index
+        self._buckets = family.buckets
+    
+    def observe(self, value: float):
+        values = self._family._values(self._index)
+        values[bisect.bisect_left(self._buckets, value)] += 1
+        values[-1] += value
+    
+    def time(self, func: Callable) -> Callable:
+        """Decorate func so each call's duration is observed"""
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(time.perf_counter() - start)
+        return timed
+
+class Histogram(_Family):
+    """Distribution of observed values in fixed buckets, plus their sum and count"""
+    
+    kind = 'histogram'
+    _child_class = _HistogramChild
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = REQUEST_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+    
+    def _zero(self) -> list:
+        # One count per bucket, one for +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+    
+    def observe(self, value: float):
+        self._default.observe(value)
+    
+    def _samples(self, index: int, values: list) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), values):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+            lines.append(f'{self.name}_bucket{self._label_text(index, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{self._label_text(index)} {_number(values[-1])}')
+        lines.append(f'{self.name}_count{self._label_text(index)} {cumulative}')
+        return lines
+
+class GaugeFunction:
+    """A gauge read from a callback when the metrics are rendered"""
+    
+    def __init__(self, name: str, documentation: str, func: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        REGISTRY.append(self)
+    
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge',
+                f'{self.name} {_number(self.func())}']
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value: float) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for family in REGISTRY:
+        lines.extend(family.render())
+    return '\n'.join(lines) + '\n'
+
+def instrument_methods(cls: type, histogram: Histogram):
+    """Time every public method of a class into histogram, labelled with the method name
+    
+    Patches the class, so it applies to all instances; call it once.
+    """
+    for name, func in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(func):
+            continue
+        setattr(cls, name, histogram.labels(name).time(func))
+
+# Web server
+HTTP_REQUEST_DURATION = Histogram(
+    'watchmarker_http_request_duration_seconds',
+    "Time to produce a response (streamed bodies excluded), by route, method and status",
+    ('route', 'method', 'status'))
+STREAM_BYTES = Counter('watchmarker_stream_bytes_total', "Video bytes sent by stream_video")
+
+# Database
+DB_OPERATION_DURATION = Histogram(
+    'watchmarker_db_operation_duration_seconds', "VideoTracker method call duration, by method",
+    ('method',), buckets=DB_BUCKETS)
+DB_LOCK_WAIT = Histogram(
+    'watchmarker_db_lock_wait_seconds', "Time write transactions waited for the SQLite write lock",
+    buckets=DB_BUCKETS)
+DB_BUSY_WAITS = Counter(
+    'watchmarker_db_busy_waits_total', "Write transactions that found the database locked and retried")
+DB_BUSY_TIMEOUTS = Counter(
+    'watchmarker_db_busy_timeouts_total', "Write transactions that gave up after DB_BUSY_TIMEOUT")
+DB_FLUSH_RETRIES = Counter(
+    'watchmarker_db_flush_retries_total', "Buffered progress flushes that failed and were re-queued")
+DB_COMMITS = Counter('watchmarker_db_commits_total', "Committed write transactions")
+
+# Library scans
+SCAN_DURATION = Histogram(
+    'watchmarker_scan_duration_seconds', "Library scan duration, by scan (find_videos, refresh_library)",
+    ('scan',), buckets=SCAN_BUCKETS)
+SCAN_FILES = Counter(
+    'watchmarker_scan_files_total', "Video files found by find_videos or re-listed by refresh_library",
+    ('scan',))
@@ -0,0 +1,125 @@
+import errno
+import os
+import stat
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_for
+from typing import Dict, Iterable, Optional, Tuple
+
+# How long a folder check stays fresh, how long a check may run before the
+# folder counts as unreachable, and how many checks run at once
+PATH_CHECK_TTL = float(os.getenv('PATH_CHECK_TTL', '30'))
+PATH_CHECK_TIMEOUT = float(os.getenv('PATH_CHECK_TIMEOUT', '2.0'))
+PATH_CHECK_WORKERS = int(os.getenv('PATH_CHECK_WORKERS', '4'))
+
+# Longest a request waits for a folder it has to list to be re-checked
+PATH_CHECK_WAIT = float(os.getenv('PATH_CHECK_WAIT', '0.5'))
+
+# Folder states
+PATH_OK = 'ok'
+PATH_MISSING = 'missing'
+PATH_UNREACHABLE = 'unreachable'
+
+def check_folder(path: str) -> str:
+    """Whether a folder exists and can be listed: PATH_OK, PATH_MISSING or PATH_UNREACHABLE"""
+    try:
+        stat_result = os.stat(path)
+    except OSError as e:
+        if e.errno in (errno.ENOENT, errno.ENOTDIR):
+            return PATH_MISSING
+        return PATH_UNREACHABLE  # EIO, ESTALE, EACCES, ...
+    
+    if not stat.S_ISDIR(stat_result.st_mode):
+        return PATH_MISSING
+    if not os.access(path, os.R_OK | os.X_OK):
+        return PATH_UNREACHABLE
+    return PATH_OK
+
+class PathStatusCache:
+    """Folder existence checks answered from a TTL cache
+    
+    status() never touches the filesystem: it returns the last known state
+    and schedules a re-check on a small thread pool when that state is
+    missing or older than the TTL. A hung network mount therefore ties up a
+    pool thread, not the request. A check still running after `timeout`
+    seconds reports the folder unreachable until it finishes.
+    """
+    
+    def __init__(self, ttl: float = None, timeout: float = None, workers: int = None):
+        self.ttl = PATH_CHECK_TTL if ttl is None else ttl
+        self.timeout = PATH_CHECK_TIMEOUT if timeout is None else timeout
+        
+        self._entries: Dict[str, Tuple[str, float]] = {}  # path -> (state, checked at)
+        self._running: Dict[str, Tuple[Future, float]] = {}  # path -> (check, started at)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=workers or PATH_CHECK_WORKERS,
+                                            thread_name_prefix='path-check')
+    
+    def status(self, path: str, wait: float = 0) -> Tuple[Optional[str], bool]:
+        """Last known (state, stale) of a folder
+        
+        state is None when the folder was never checked. stale is True when
+        the state is unknown or older than the TTL; a re-check is then
+        already on its way. With wait > 0, wait up to that many seconds for
+        that re-check before answering.
+        """
+        with self._lock:
+            state, stale, check = self._lookup(path)
+        
+        if check is not None and wait > 0:
+            wait_for([check], timeout=wait)
+            with self._lock:
+                state, stale, _ = self._lookup(path)
+        
+        return state, stale
+    
+    def refresh(self, paths: Iterable[str]):
+        """Check folders in the background unless their state is still fresh"""
+        with self._lock:
+            for path in paths:
+                self._lookup(path)
+    
+    def forget(self, path: str):
+        """Drop a folder's cached state (e.g. after it was removed from the history)"""
+        with self._lock:
+            self._entries.pop(path, None)
+    
+    def close(self):
+        """Stop scheduling checks; running ones are abandoned"""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _lookup(self, path: str) -> Tuple[Optional[str], bool, Optional[Future]]:
+        """(state, stale, running check) for a path, scheduling a check if needed; holds _lock"""
+        now = time.monotonic()
+        entry = self._entries.get(path)
+        running = self._running.get(path)
+        
+        if running is not None:
+            check, started = running
+            if now - started > self.timeout:
+                return PATH_UNREACHABLE, False, None
+            return (entry[0] if entry else None), True, check
+        
+        if entry is not None and now - entry[1] < self.ttl:
+            return entry[0], False, None
+        
+        if self._closed:
+            return (entry[0] if entry else None), True, None
+        
+        check = self._executor.submit(self._check, path)
+        self._running[path] = (check, now)
+        return (entry[0] if entry else None), True, check
+    
+    def _check(self, path: str):
+        """Pool thread: check one folder and record the result"""
+        try:
+            state = check_folder(path)
+        except Exception:
+            state = PATH_UNREACHABLE
+        
+        with self._lock:
+            self._entries[path] = (state, time.monotonic())
+            self._running.pop(path, None)
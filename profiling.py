@@ -0,0 +1,279 @@
+import cProfile
+import functools
+import inspect
+import io
+import json
+import marshal
+import os
+import pstats
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# On-demand profiling ('on' or 'off'); nothing below is installed when off
+PROFILING_ENABLED = os.getenv('PROFILING', 'off').lower() == 'on'
+
+# If set, profiling requests and the profile endpoints need X-Profile-Token
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+
+# Where profiles and the slow-operation log are kept (default: a
+# 'profiles' directory next to the database) and how many profiles to keep
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(os.getenv('DB_PATH', 'video_progress.db'))), 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+
+# VideoTracker calls and library walks slower than this are logged
+SLOW_OP_MS = float(os.getenv('SLOW_OP_MS', '250'))
+
+# Statements recorded per traced call, and how many of the slowest get an
+# EXPLAIN QUERY PLAN
+TRACE_MAX_STATEMENTS = 200
+EXPLAIN_STATEMENTS = 3
+
+# The slow-operation log is rotated once it grows past this
+SLOW_LOG_BYTES = 5 * 2 ** 20
+
+PROFILE_ID = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]+-[0-9]+$')
+
+class ProfileStore:
+    """Request profiles and the slow-operation log, kept as files
+    
+    Files are shared by every worker process, so a profile captured by one
+    worker can be downloaded through another. Each profile is a .prof file
+    in the format of pstats dump_stats (readable by pstats, snakeviz, ...)
+    with a .json file of request details next to it.
+    """
+    
+    def __init__(self, directory: str = None, keep: int = None):
+        self.directory = directory or PROFILE_DIR
+        self.keep = keep or PROFILE_KEEP
+        self._sequence = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+    
+    def save(self, profile: cProfile.Profile, details: Dict) -> str:
+        """Store a finished profile with its request details and return its id"""
+        with self._lock:
+            self._sequence += 1
+            profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._sequence}"
+        
+        stats = pstats.Stats(profile)
+        with open(os.path.join(self.directory, profile_id + '.prof'), 'wb') as f:
+            marshal.dump(stats.stats, f)
+        with open(os.path.join(self.directory, profile_id + '.json'), 'w') as f:
+            json.dump(dict(details, id=profile_id, created=time.time()), f)
+        
+        self._prune()
+        return profile_id
+    
+    def list(self) -> List[Dict]:
+        """Details of the stored profiles, newest first"""
+        profiles = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # Pruned or still being written
+        return sorted(profiles, key=lambda profile: profile['created'], reverse=True)
+    
+    def path(self, profile_id: str) -> Optional[str]:
+        """The .prof file of a profile, or None if there is no such profile"""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + '.prof')
+        return path if os.path.exists(path) else None
+    
+    def text(self, profile_id: str, limit: int = 40) -> Optional[str]:
+        """The top functions of a profile by cumulative time, as pstats prints them"""
+        path = self.path(profile_id)
+        if path is None:
+            return None
+        output = io.StringIO()
+        pstats.Stats(path, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+    
+    def _prune(self):
+        for profile in self.list()[self.keep:]:
+            for extension in ('.prof', '.json'):
+                try:
+                    os.remove(os.path.join(self.directory, profile['id'] + extension))
+                except OSError:
+                    pass
+    
+    def log_slow_op(self, entry: Dict):
+        """Append an entry to the slow-operation log"""
+        path = os.path.join(self.directory, 'slow-ops.jsonl')
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            try:
+                if os.path.getsize(path) > SLOW_LOG_BYTES:
+                    os.replace(path, path + '.1')
+            except OSError:
+                pass
+            with open(path, 'a') as f:
+                f.write(line)
+    
+    def slow_ops(self, limit: int = 100) -> List[Dict]:
+        """The most recent slow-operation log entries, newest first"""
+        try:
+            with open(os.path.join(self.directory, 'slow-ops.jsonl')) as f:
+                lines = deque(f, maxlen=limit)
+        except OSError:
+            return []
+        
+        entries = []
+        for line in reversed(lines):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue  # Partly written by another process
+        return entries
+
+class RequestProfiler:
+    """Runs cProfile around single requests
+    
+    A request is profiled when it asks to be (the X-Profile header) or when
+    the profiler has been armed for the next requests to a path. Only one
+    request is profiled at a time, since profilers of concurrent threads
+    would interfere.
+    """
+    
+    def __init__(self, store: ProfileStore):
+        self.store = store
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._armed = 0
+        self._armed_prefix = ''
+    
+    def arm(self, count: int, path_prefix: str = ''):
+        """Profile the next `count` requests whose path starts with path_prefix (0 disarms)"""
+        with self._lock:
+            self._armed = max(0, count)
+            self._armed_prefix = path_prefix
+    
+    def armed(self) -> Dict:
+        with self._lock:
+            return {'requests': self._armed, 'path': self._armed_prefix}
+    
+    def start(self, path: str, requested: bool) -> Optional[cProfile.Profile]:
+        """Start profiling this request if it asked for it or the profiler is armed for it"""
+        if not self._busy.acquire(blocking=False):
+            return None  # Another request is being profiled
+        
+        if not requested:
+            with self._lock:
+                if not self._armed or not path.startswith(self._armed_prefix):
+                    self._busy.release()
+                    return None
+                self._armed -= 1
+        
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            self._busy.release()  # Another profiling tool is active
+            return None
+        return profile
+    
+    def stop(self, profile: cProfile.Profile, details: Dict) -> str:
+        """Stop profiling and store the profile; returns its id"""
+        try:
+            profile.disable()
+        finally:
+            self._busy.release()
+        return self.store.save(profile, details)
+
+class SlowOpTracer:
+    """Logs VideoTracker calls and library walks that take longer than a threshold
+    
+    Statements run during a traced call are recorded through each
+    connection's trace callback, with their bound values filled in. When
+    the call turns out slow, the entry lists them with their approximate
+    durations (the time until the next statement started) and the query
+    plans of the slowest ones.
+    """
+    
+    def __init__(self, store: ProfileStore, explain: Callable[[str], List[str]], threshold_ms: float = None):
+        self.store = store
+        self.explain = explain
+        self.threshold = (SLOW_OP_MS if threshold_ms is None else threshold_ms) / 1000
+        self._local = threading.local()
+    
+    def connection_hook(self, conn: sqlite3.Connection):
+        """For video_tracker.CONNECTION_HOOKS: record statements while a call is traced"""
+        conn.set_trace_callback(self._trace)
+    
+    def _trace(self, sql: str):
+        statements = getattr(self._local, 'statements', None)
+        if statements is not None and len(statements) < TRACE_MAX_STATEMENTS:
+            statements.append((time.perf_counter(), sql))
+    
+    def instrument(self, cls: type, exclude=()):
+        """Trace every public method of a class (patches the class; call it once)"""
+        for name, func in list(vars(cls).items()):
+            if name.startswith('_') or name in exclude or not inspect.isfunction(func):
+                continue
+            setattr(cls, name, self._traced(func, f'{cls.__name__}.{name}'))
+    
+    def _traced(self, func: Callable, operation: str) -> Callable:
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            if getattr(self._local, 'statements', None) is not None:
+                return func(*args, **kwargs)  # Part of an outer traced call
+            
+            self._local.statements = statements = []
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                self._local.statements = None
+                if end - start >= self.threshold:
+                    self._log_query(operation, args[1:], kwargs, start, end, statements)
+        return traced
+    
+    def _log_query(self, operation, args, kwargs, start, end, statements):
+        timed = []
+        for i, (started, sql) in enumerate(statements):
+            finished = statements[i + 1][0] if i + 1 < len(statements) else end
+            timed.append({'sql': sql, 'ms': round((finished - started) * 1000, 3)})
+        
+        for statement in sorted(timed, key=lambda statement: statement['ms'], reverse=True)[:EXPLAIN_STATEMENTS]:
+            if statement['sql'].lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')):
+                try:
+                    statement['plan'] = self.explain(statement['sql'])
+                except sqlite3.Error as e:
+                    statement['plan'] = [f'EXPLAIN failed: {e}']
+        
+        self.store.log_slow_op({
+            'kind': 'query',
+            'operation': operation,
+            'args': _describe(args, kwargs),
+            'ms': round((end - start) * 1000, 3),
+            'at': time.time(),
+            'statements': timed,
+        })
+    
+    def scan_hook(self, scan: str, root_folder: str, seconds: float, count: int):
+        """For video_tracker.SCAN_HOOKS: log library walks slower than the threshold"""
+        if seconds >= self.threshold:
+            self.store.log_slow_op({
+                'kind': 'walk',
+                'operation': scan,
+                'args': root_folder,
+                'ms': round(seconds * 1000, 3),
+                'at': time.time(),
+                'count': count,
+            })
+
+def _describe(args, kwargs) -> str:
+    """Short repr of a call's arguments for the log"""
+    parts = [repr(arg) for arg in args] + [f'{key}={value!r}' for key, value in kwargs.items()]
+    text = ', '.join(parts)
+    return text if len(text) <= 300 else text[:297] + '...'
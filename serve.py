@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Production server: runs the Flask app under gunicorn with several
+worker processes, each serving requests from a pool of threads.
+
+Configuration comes from environment variables (see README). Use
+`python3 app.py` for the development server instead.
+"""
+import os
+import signal
+
+from gunicorn.app.base import BaseApplication
+
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.getenv('WEB_PORT', '5000'))
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', '2'))
+# Every open page holds a thread for its event stream and every playing
+# video one for its byte range, so keep this well above the expected viewers
+WEB_THREADS = int(os.getenv('WEB_THREADS', '32'))
+WEB_KEEPALIVE = int(os.getenv('WEB_KEEPALIVE', '5'))
+WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', '60'))
+WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+
+def post_worker_init(worker):
+    """Flush progress and end event streams as soon as a worker is told to stop
+    
+    Open event streams never finish on their own, so without this a worker
+    would wait out the graceful timeout and be killed before flushing.
+    """
+    import app
+    
+    handle_exit = signal.getsignal(signal.SIGTERM)
+    
+    def handle_term(signum, frame):
+        app.prepare_shutdown()
+        if callable(handle_exit):
+            handle_exit(signum, frame)
+    
+    signal.signal(signal.SIGTERM, handle_term)
+
+def worker_exit(server, worker):
+    """Write any progress buffered since the stop signal"""
+    import app
+    app.tracker.close()
+
+class WatchMarkerServer(BaseApplication):
+    """Gunicorn application that serves app.py"""
+    
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+    
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+    
+    def load(self):
+        from app import app
+        return app
+
+def worker_environment(workers):
+    """Default the settings that depend on the number of workers (call before they import app)"""
+    # Worker processes share the database; relay events between them
+    os.environ.setdefault('EVENT_RELAY', '1' if workers > 1 else '0')
+    
+    # Buffered progress is only visible to the worker holding it, so write
+    # every save through when another worker may serve the next read
+    if workers > 1:
+        os.environ.setdefault('PROGRESS_FLUSH_INTERVAL', '0')
+
+def main():
+    worker_environment(WEB_WORKERS)
+    
+    WatchMarkerServer({
+        'bind': f'{WEB_HOST}:{WEB_PORT}',
+        'workers': WEB_WORKERS,
+        'worker_class': 'gthread',
+        'threads': WEB_THREADS,
+        'keepalive': WEB_KEEPALIVE,
+        'timeout': WEB_TIMEOUT,
+        'graceful_timeout': WEB_GRACEFUL_TIMEOUT,
+        # Each worker must open its own SQLite connections and threads, so
+        # the app is imported after the fork, never in the master
+        'preload_app': False,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+        'accesslog': '-',
+    }).run()
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,35 @@ let currentVideoIndex = -1;
 let currentVideoPath = null;
 let selectedFolder = null;
 let progressSaveInterval = null;
+let listingToken = 0; // Bumped on every new listing so stale page loads stop
+let listingLoading = false; // True while loadRemainingVideos is fetching pages
+let listingStale = false; // Set when a library change arrives mid-load
+let eventsConnected = false; // Whether the event stream has connected before
+let videoCount = 0; // Videos in the folder, including pages not loaded yet
+
+// Identifies this tab so it can ignore its own progress echoes
+const clientId = Math.random().toString(36).slice(2);
+
+// Progress updates waiting to be sent, keyed by video path. Kept in
+// localStorage (shared by all tabs) so progress made offline survives reloads.
+const PROGRESS_QUEUE_KEY = 'watch-marker-progress-queue';
+const PROGRESS_FLUSH_INTERVAL = 10000;
+let memoryProgressQueue = {}; // Used when localStorage is unavailable
+let progressFlushing = false;
+let progressFlushAgain = false; // A flush was requested while one was in flight
+
+// Videos per page when listing a folder; the first page renders immediately
+const PAGE_SIZE = 200;
+
+// Retry delay (ms) while the server is still checking the last folder
+const LAST_FOLDER_RETRY_DELAY = 2000;
+
+// Folder picker: folders per page, filter prefix, and a token that makes
+// responses to superseded requests be ignored
+const BROWSE_PAGE_SIZE = 500;
+let browsePrefix = '';
+let browseToken = 0;
+let browseFilterTimer = null;
 
 const videoPlayer = document.getElementById('video-player');
 const noVideoDisplay = document.getElementById('no-video');
@@ -19,6 +48,11 @@ document.addEventListener('DOMContentLoaded', () => {
     setupVideoListeners();
     loadFolderHistory();
     loadLastFolder();
+    connectEvents();
+    
+    // Send queued progress regularly, including any left from a previous visit
+    flushProgressQueue();
+    setInterval(flushProgressQueue, PROGRESS_FLUSH_INTERVAL);
 });
 
 function setupVideoListeners() {
@@ -39,6 +73,11 @@ function setupVideoListeners() {
 
     videoPlayer.addEventListener('pause', () => {
         playPauseBtn.textContent = '▶️';
+        
+        // Persist the paused position immediately instead of waiting for the next flush
+        if (currentVideoPath && videoPlayer.currentTime > 0) {
+            saveProgress(true);
+        }
     });
 
     // Video ended - play next
@@ -111,11 +150,20 @@ function renderFolderHistory(folders) {
         if (selectedFolder === folder.path) {
             div.classList.add('active');
         }
+        if (folder.available === false) {
+            div.classList.add('unavailable');
+        }
         
         const name = document.createElement('div');
         name.className = 'folder-history-name';
         name.textContent = folder.name;
-        name.title = folder.path; // Show full path on hover
+        name.title = folder.available === false
+            ? `${folder.path} (not reachable)`
+            : folder.path; // Show full path on hover
+        
+        const stats = document.createElement('div');
+        stats.className = 'folder-history-stats';
+        stats.textContent = formatFolderStats(folder.stats);
         
         const removeBtn = document.createElement('button');
         removeBtn.className = 'folder-remove-btn';
@@ -127,6 +175,9 @@ function renderFolderHistory(folders) {
         };
         
         div.appendChild(name);
+        if (stats.textContent) {
+            div.appendChild(stats);
+        }
         div.appendChild(removeBtn);
         
         div.onclick = () => loadFolderFromHistory(folder.path);
@@ -135,6 +186,21 @@ function renderFolderHistory(folders) {
     });
 }
 
+function formatFolderStats(stats) {
+    // e.g. "3 done · 2 in progress · 4h 10m watched"
+    if (!stats || stats.video_count === 0) return '';
+    
+    const parts = [];
+    if (stats.completed_count) parts.push(`${stats.completed_count} done`);
+    if (stats.in_progress_count) parts.push(`${stats.in_progress_count} in progress`);
+    
+    const minutes = Math.round(stats.watched_ms / 60000);
+    if (minutes > 0) {
+        parts.push(`${Math.floor(minutes / 60)}h ${minutes % 60}m watched`);
+    }
+    return parts.join(' · ');
+}
+
 async function loadFolderFromHistory(folderPath) {
     try {
         const response = await fetch('/api/select-folder', {
@@ -142,7 +208,7 @@ async function loadFolderFromHistory(folderPath) {
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ folder_path: folderPath })
+            body: JSON.stringify({ folder_path: folderPath, limit: PAGE_SIZE, format: 'columns' })
         });
         
         const data = await response.json();
@@ -152,12 +218,13 @@ async function loadFolderFromHistory(folderPath) {
             return;
         }
         
-        videos = data.videos;
+        videos = decodeVideos(data.videos);
         selectedFolder = folderPath;
         document.getElementById('folder-name').textContent = `Folder: ${data.folder_name}`;
-        document.getElementById('video-count').textContent = `(${data.count})`;
+        updateVideoCount(data.count);
         
         renderVideoList();
+        loadRemainingVideos(data.next_cursor);
         loadFolderHistory(); // Refresh history to update active state
         
     } catch (error) {
@@ -185,17 +252,21 @@ async function removeFolderFromHistory(folderPath) {
 
 async function loadLastFolder() {
     try {
-        const response = await fetch('/api/last-folder');
+        const response = await fetch(`/api/last-folder?limit=${PAGE_SIZE}&format=columns`);
         const data = await response.json();
         
         if (data.folder && data.videos) {
-            videos = data.videos;
+            videos = decodeVideos(data.videos);
             selectedFolder = data.folder;
             document.getElementById('folder-name').textContent = `Folder: ${data.folder_name}`;
-            document.getElementById('video-count').textContent = `(${data.count})`;
+            updateVideoCount(data.count);
             renderVideoList();
+            loadRemainingVideos(data.next_cursor);
             loadFolderHistory(); // Refresh history to update active state
             console.log('Loaded last folder:', data.folder_name);
+        } else if (data.stale && !selectedFolder) {
+            // The server is still checking the folder (e.g. a slow network mount)
+            setTimeout(loadLastFolder, LAST_FOLDER_RETRY_DELAY);
         }
     } catch (error) {
         console.log('No previous folder found or error loading:', error);
@@ -208,6 +279,8 @@ function showFolderBrowser() {
     
     // Start browsing from last folder or home
     const startPath = selectedFolder || '/home';
+    browsePrefix = '';
+    document.getElementById('folder-filter').value = '';
     browsePath(startPath);
 }
 
@@ -216,40 +289,97 @@ function closeFolderBrowser() {
     modal.classList.remove('active');
 }
 
-async function browsePath(path) {
+async function browsePath(path, cursor = null) {
+    if (path !== selectedFolder) {
+        // A different folder: clear the filter
+        browsePrefix = '';
+        document.getElementById('folder-filter').value = '';
+    }
+    
+    const token = ++browseToken;
+    const params = new URLSearchParams({
+        path: path,
+        prefix: browsePrefix,
+        limit: BROWSE_PAGE_SIZE,
+        counts: '1'
+    });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    
     try {
-        const response = await fetch(`/api/browse?path=${encodeURIComponent(path)}`);
+        const response = await fetch(`/api/browse?${params}`);
         const data = await response.json();
+        if (token !== browseToken) return; // A newer request replaced this one
         
-        document.getElementById('current-path').textContent = data.current_path;
-        selectedFolder = data.current_path;
-        
-        const folderList = document.getElementById('folder-list');
-        folderList.innerHTML = '';
-        
-        data.items.forEach(item => {
-            const div = document.createElement('div');
-            div.className = 'folder-item';
-            div.onclick = () => browsePath(item.path);
-            
-            const icon = document.createElement('span');
-            icon.className = 'folder-icon';
-            icon.textContent = item.is_parent ? '⬆️' : '📁';
-            
-            const name = document.createElement('span');
-            name.textContent = item.name;
-            
-            div.appendChild(icon);
-            div.appendChild(name);
-            folderList.appendChild(div);
-        });
+        if (data.error) {
+            alert('Error browsing folder: ' + data.error);
+            return;
+        }
         
+        renderFolderPage(data, Boolean(cursor));
     } catch (error) {
         console.error('Error browsing folder:', error);
         alert('Error browsing folder: ' + error.message);
     }
 }
 
+function filterFolders() {
+    // Re-list the current folder with the typed prefix once typing pauses
+    clearTimeout(browseFilterTimer);
+    browseFilterTimer = setTimeout(() => {
+        browsePrefix = document.getElementById('folder-filter').value;
+        browsePath(selectedFolder);
+    }, 200);
+}
+
+function renderFolderPage(data, append) {
+    document.getElementById('current-path').textContent = data.current_path;
+    selectedFolder = data.current_path;
+    
+    const folderList = document.getElementById('folder-list');
+    if (!append) {
+        folderList.innerHTML = '';
+    }
+    const more = folderList.querySelector('.folder-more');
+    if (more) {
+        more.remove();
+    }
+    
+    data.items.forEach(item => {
+        const div = document.createElement('div');
+        div.className = 'folder-item';
+        div.onclick = () => browsePath(item.path);
+        
+        const icon = document.createElement('span');
+        icon.className = 'folder-icon';
+        icon.textContent = item.is_parent ? '⬆️' : '📁';
+        
+        const name = document.createElement('span');
+        name.textContent = item.name;
+        
+        div.appendChild(icon);
+        div.appendChild(name);
+        
+        if (item.video_count) {
+            const count = document.createElement('span');
+            count.className = 'folder-video-count';
+            count.textContent = `${item.video_count} videos`;
+            div.appendChild(count);
+        }
+        
+        folderList.appendChild(div);
+    });
+    
+    if (data.next_cursor) {
+        const div = document.createElement('div');
+        div.className = 'folder-item folder-more';
+        div.textContent = `Show more (${data.total} folders)`;
+        div.onclick = () => browsePath(data.current_path, data.next_cursor);
+        folderList.appendChild(div);
+    }
+}
+
 async function confirmFolder() {
     if (!selectedFolder) return;
     
@@ -261,7 +391,7 @@ async function confirmFolder() {
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ folder_path: selectedFolder })
+            body: JSON.stringify({ folder_path: selectedFolder, limit: PAGE_SIZE, format: 'columns' })
         });
         
         const data = await response.json();
@@ -271,11 +401,12 @@ async function confirmFolder() {
             return;
         }
         
-        videos = data.videos;
+        videos = decodeVideos(data.videos);
         document.getElementById('folder-name').textContent = `Folder: ${data.folder_name}`;
-        document.getElementById('video-count').textContent = `(${data.count})`;
+        updateVideoCount(data.count);
         
         renderVideoList();
+        loadRemainingVideos(data.next_cursor);
         loadFolderHistory(); // Refresh folder history
         
     } catch (error) {
@@ -284,6 +415,215 @@ async function confirmFolder() {
     }
 }
 
+async function loadRemainingVideos(cursor) {
+    // Fetch the rest of the listing page by page, appending as each arrives
+    const token = ++listingToken;
+    listingLoading = true;
+    listingStale = false;
+    
+    while (cursor) {
+        try {
+            const response = await fetch(`/api/videos?limit=${PAGE_SIZE * 5}&format=columns&cursor=${encodeURIComponent(cursor)}`);
+            const data = await response.json();
+            
+            if (token !== listingToken || data.error) return;
+            
+            const start = videos.length;
+            videos = videos.concat(decodeVideos(data.videos));
+            appendVideoItems(start);
+            updateVideoCount(videoCount);
+            cursor = data.next_cursor;
+        } catch (error) {
+            console.error('Error loading more videos:', error);
+            break;
+        }
+    }
+    
+    if (token !== listingToken) return;
+    listingLoading = false;
+    
+    // The library changed while pages were loading; reload to pick it up
+    if (listingStale) {
+        refreshVideos();
+    }
+}
+
+function connectEvents() {
+    // Server-sent events; EventSource reconnects on its own after errors
+    const source = new EventSource('/api/events');
+    
+    // Events sent while disconnected are lost, so reload after a reconnect
+    source.addEventListener('open', () => {
+        if (eventsConnected && selectedFolder) refreshVideos();
+        eventsConnected = true;
+    });
+    
+    source.addEventListener('progress', (e) => applyRemoteProgress(JSON.parse(e.data)));
+    source.addEventListener('metadata', (e) => applyMetadata(JSON.parse(e.data)));
+    source.addEventListener('library', (e) => applyLibraryDelta(JSON.parse(e.data)));
+    source.addEventListener('resync', () => {
+        if (selectedFolder) refreshVideos();
+    });
+}
+
+function applyRemoteProgress(data) {
+    // Progress saved by another session
+    if (data.client === clientId) return;
+    
+    setVideoProgress(data.path, data.position, data.duration);
+    
+    // Keep a paused player in step so resuming here continues from there
+    if (data.path === currentVideoPath && videoPlayer.paused) {
+        videoPlayer.currentTime = data.position / 1000;
+    }
+}
+
+function decodeVideos(listing) {
+    // Expand a listing sent in the compact columnar format (format=columns)
+    // into one entry per video; plain arrays are returned as they are
+    if (Array.isArray(listing)) return listing;
+    
+    const entries = new Array(listing.name.length);
+    for (let i = 0; i < entries.length; i++) {
+        const displayName = listing.dirs[listing.dir[i]] + listing.name[i];
+        const position = listing.position[i];
+        const duration = listing.duration[i];
+        const remarks = listing.remarks[i];
+        
+        entries[i] = {
+            path: listing.prefix + displayName,
+            display_name: displayName,
+            filename: listing.name[i],
+            progress: duration > 0 ? {
+                position: position,
+                duration: duration,
+                percent: Math.round((position / duration) * 1000) / 10
+            } : null,
+            remarks: remarks === undefined ? null : remarks,
+            media: listing.media[i] ? {
+                duration: listing.media_duration[i],
+                width: listing.width[i],
+                height: listing.height[i],
+                codec: listing.codecs[listing.codec[i]]
+            } : null
+        };
+    }
+    return entries;
+}
+
+function setVideoProgress(path, position, duration) {
+    // Update a video's progress in the list without re-rendering the rest
+    const index = videos.findIndex((video) => video.path === path);
+    if (index === -1) return;
+    
+    videos[index].progress = duration ? {
+        position: position,
+        duration: duration,
+        percent: Math.round((position / duration) * 1000) / 10
+    } : null;
+    
+    updateVideoItem(index);
+    updateVideoCount(videoCount);
+}
+
+function updateVideoItem(index) {
+    const videoList = document.getElementById('video-list');
+    const item = videoList.children[index];
+    if (item) {
+        videoList.replaceChild(createVideoItem(videos[index], index), item);
+    }
+}
+
+function applyMetadata(data) {
+    // Durations etc. probed in the background for videos in this list
+    const indexByPath = new Map(videos.map((video, index) => [video.path, index]));
+    
+    data.videos.forEach((media) => {
+        const index = indexByPath.get(media.path);
+        if (index === undefined) return;
+        
+        const { path, ...fields } = media;
+        videos[index].media = fields;
+        updateVideoItem(index);
+    });
+    
+    updateVideoCount(videoCount);
+}
+
+function updateVideoCount(count) {
+    // Video count plus the watch time left in the loaded part of the list
+    videoCount = count;
+    
+    let remaining = 0;
+    videos.forEach((video) => {
+        const progress = video.progress;
+        const duration = (progress && progress.duration) || (video.media && video.media.duration);
+        if (!duration || (progress && progress.percent >= 95)) return;
+        remaining += duration - (progress ? progress.position : 0);
+    });
+    
+    let text = `(${count})`;
+    if (remaining > 0) {
+        const minutes = Math.round(remaining / 60000);
+        text += ` · ${Math.floor(minutes / 60)}h ${minutes % 60}m left`;
+    }
+    document.getElementById('video-count').textContent = text;
+}
+
+function applyLibraryDelta(delta) {
+    // Apply added/removed/renamed videos from the library watcher in place
+    if (!selectedFolder) return;
+    
+    const prefix = selectedFolder.endsWith('/') ? selectedFolder : selectedFolder + '/';
+    const inFolder = (path) => path.startsWith(prefix);
+    const relevant = delta.added.some(inFolder) || delta.removed.some(inFolder) ||
+        delta.renamed.some((r) => inFolder(r.from) || inFolder(r.to));
+    if (!relevant) return;
+    
+    if (listingLoading) {
+        // Pages are still arriving; reload once they are done
+        listingStale = true;
+        return;
+    }
+    
+    const makeEntry = (path) => ({
+        path: path,
+        display_name: path.substring(prefix.length),
+        filename: path.substring(path.lastIndexOf('/') + 1),
+        progress: null,
+        remarks: null,
+        media: null
+    });
+    
+    const removed = new Set(delta.removed);
+    const renamed = new Map(delta.renamed.map((r) => [r.from, r.to]));
+    const known = new Set(videos.map((video) => video.path));
+    
+    let updated = [];
+    videos.forEach((video) => {
+        if (removed.has(video.path)) return;
+        
+        const newPath = renamed.get(video.path);
+        if (newPath === undefined) {
+            updated.push(video);
+        } else if (inFolder(newPath)) {
+            updated.push({ ...makeEntry(newPath), progress: video.progress, remarks: video.remarks, media: video.media });
+            if (video.path === currentVideoPath) currentVideoPath = newPath;
+        }
+    });
+    
+    delta.added.concat(delta.renamed.filter((r) => !known.has(r.from)).map((r) => r.to))
+        .filter((path) => inFolder(path) && !known.has(path))
+        .forEach((path) => updated.push(makeEntry(path)));
+    
+    updated.sort((a, b) => (a.path < b.path ? -1 : a.path > b.path ? 1 : 0));
+    videos = updated;
+    currentVideoIndex = videos.findIndex((video) => video.path === currentVideoPath);
+    
+    updateVideoCount(videos.length);
+    renderVideoList();
+}
+
 function renderVideoList() {
     const videoList = document.getElementById('video-list');
     videoList.innerHTML = '';
@@ -293,56 +633,71 @@ function renderVideoList() {
         return;
     }
     
-    videos.forEach((video, index) => {
-        const div = document.createElement('div');
-        div.className = 'video-item';
-        if (index === currentVideoIndex) {
-            div.classList.add('active');
-        }
-        div.onclick = () => loadVideoByIndex(index);
-        
-        const title = document.createElement('div');
-        title.className = 'video-item-title';
-        title.textContent = video.display_name;
-        
-        div.appendChild(title);
-        
-        // Always show progress info
-        const progressDiv = document.createElement('div');
-        progressDiv.className = 'video-item-progress';
-        
-        const miniBar = document.createElement('div');
-        miniBar.className = 'mini-progress';
-        const miniFill = document.createElement('div');
-        miniFill.className = 'mini-progress-fill';
-        
-        let percentText = document.createElement('span');
-        
-        if (video.progress && video.progress.percent > 0) {
-            // Has progress
-            miniFill.style.width = video.progress.percent + '%';
+    appendVideoItems(0);
+}
+
+function appendVideoItems(start) {
+    const videoList = document.getElementById('video-list');
+    const fragment = document.createDocumentFragment();
+    
+    videos.slice(start).forEach((video, offset) => {
+        fragment.appendChild(createVideoItem(video, start + offset));
+    });
+    
+    videoList.appendChild(fragment);
+}
+
+function createVideoItem(video, index) {
+    const div = document.createElement('div');
+    div.className = 'video-item';
+    if (index === currentVideoIndex) {
+        div.classList.add('active');
+    }
+    div.onclick = () => loadVideoByIndex(index);
+    
+    const title = document.createElement('div');
+    title.className = 'video-item-title';
+    title.textContent = video.display_name;
+    
+    div.appendChild(title);
+    
+    // Always show progress info
+    const progressDiv = document.createElement('div');
+    progressDiv.className = 'video-item-progress';
+    
+    const miniBar = document.createElement('div');
+    miniBar.className = 'mini-progress';
+    const miniFill = document.createElement('div');
+    miniFill.className = 'mini-progress-fill';
+    
+    let percentText = document.createElement('span');
+    
+    if (video.progress && video.progress.percent > 0) {
+        // Has progress
+        miniFill.style.width = video.progress.percent + '%';
             
-            if (video.progress.percent >= 95) {
-                percentText.textContent = '✓ Done';
-                percentText.className = 'progress-completed';
-                miniFill.style.background = '#10b981'; // Green
-            } else {
-                percentText.textContent = Math.round(video.progress.percent) + '%';
-            }
+        if (video.progress.percent >= 95) {
+            percentText.textContent = '✓ Done';
+            percentText.className = 'progress-completed';
+            miniFill.style.background = '#10b981'; // Green
         } else {
-            // Not started
-            miniFill.style.width = '0%';
-            percentText.textContent = '○ New';
-            percentText.className = 'progress-new';
+            percentText.textContent = Math.round(video.progress.percent) + '%';
         }
-        
-        miniBar.appendChild(miniFill);
-        progressDiv.appendChild(miniBar);
-        progressDiv.appendChild(percentText);
-        div.appendChild(progressDiv);
-        
-        videoList.appendChild(div);
-    });
+    } else {
+        // Not started
+        miniFill.style.width = '0%';
+        percentText.textContent = video.media && video.media.duration
+            ? `○ New · ${formatTime(video.media.duration / 1000)}`
+            : '○ New';
+        percentText.className = 'progress-new';
+    }
+    
+    miniBar.appendChild(miniFill);
+    progressDiv.appendChild(miniBar);
+    progressDiv.appendChild(percentText);
+    div.appendChild(progressDiv);
+    
+    return div;
 }
 
 async function loadVideoByIndex(index) {
@@ -362,22 +717,13 @@ async function loadVideoByIndex(index) {
     // Set video source
     videoPlayer.src = `/api/video${video.path}`;
     
-    // Check for saved progress
-    try {
-        const response = await fetch(`/api/progress?video_path=${encodeURIComponent(video.path)}`);
-        const data = await response.json();
-        
-        if (data.position > 0 && data.duration) {
-            const percent = (data.position / data.duration) * 100;
-            if (percent < 95) {
-                videoPlayer.addEventListener('loadedmetadata', function resumePlayback() {
-                    videoPlayer.currentTime = data.position / 1000;
-                    videoPlayer.removeEventListener('loadedmetadata', resumePlayback);
-                });
-            }
-        }
-    } catch (error) {
-        console.error('Error loading progress:', error);
+    // Resume from the listed progress; pushed updates keep it current
+    const progress = video.progress;
+    if (progress && progress.position > 0 && progress.percent < 95) {
+        videoPlayer.addEventListener('loadedmetadata', function resumePlayback() {
+            videoPlayer.currentTime = progress.position / 1000;
+            videoPlayer.removeEventListener('loadedmetadata', resumePlayback);
+        });
     }
     
     // Play video
@@ -465,26 +811,103 @@ function startProgressTracking() {
     }, 5000);
 }
 
-async function saveProgress() {
+function saveProgress(flush = false) {
     if (!currentVideoPath) return;
     
+    const position = Math.floor(videoPlayer.currentTime * 1000);
+    const duration = Math.floor(videoPlayer.duration * 1000);
+    
+    // Queue the update; the timestamp decides which save wins on the server
+    const queue = readProgressQueue();
+    queue[currentVideoPath] = {
+        video_path: currentVideoPath,
+        position: position,
+        duration: duration,
+        client_timestamp: Date.now()
+    };
+    writeProgressQueue(queue);
+    
+    setVideoProgress(currentVideoPath, position, duration);
+    
+    if (flush) {
+        flushProgressQueue();
+    }
+}
+
+function readProgressQueue() {
+    try {
+        return JSON.parse(localStorage.getItem(PROGRESS_QUEUE_KEY)) || {};
+    } catch (error) {
+        return memoryProgressQueue;
+    }
+}
+
+function writeProgressQueue(queue) {
+    memoryProgressQueue = queue;
+    try {
+        localStorage.setItem(PROGRESS_QUEUE_KEY, JSON.stringify(queue));
+    } catch (error) {
+        // Storage disabled or full; the in-memory queue still works
+    }
+}
+
+async function flushProgressQueue(useBeacon = false) {
+    const updates = Object.values(readProgressQueue());
+    if (updates.length === 0) return;
+    
+    const body = JSON.stringify({ updates: updates, client: clientId });
+    
+    if (useBeacon && navigator.sendBeacon) {
+        // The page is going away. Leave the queue in place; resending is
+        // harmless and the next flush clears whatever arrived.
+        navigator.sendBeacon('/api/progress/batch', new Blob([body], { type: 'application/json' }));
+        return;
+    }
+    
+    if (progressFlushing) {
+        progressFlushAgain = true;
+        return;
+    }
+    progressFlushing = true;
+    
     try {
-        await fetch('/api/progress', {
+        const response = await fetch('/api/progress/batch', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({
-                video_path: currentVideoPath,
-                position: Math.floor(videoPlayer.currentTime * 1000),
-                duration: Math.floor(videoPlayer.duration * 1000)
-            })
+            body: body
         });
+        
+        // Retry server errors later; drop updates the server rejected
+        if (response.ok || (response.status >= 400 && response.status < 500)) {
+            removeSentUpdates(updates);
+        }
     } catch (error) {
+        // Offline or flaky link: keep the queue and retry on the next flush
         console.error('Error saving progress:', error);
+    } finally {
+        progressFlushing = false;
+    }
+    
+    if (progressFlushAgain) {
+        progressFlushAgain = false;
+        flushProgressQueue();
     }
 }
 
+function removeSentUpdates(updates) {
+    // Keep entries that were updated again while the request was in flight
+    const queue = readProgressQueue();
+    updates.forEach((update) => {
+        const queued = queue[update.video_path];
+        if (queued && queued.client_timestamp === update.client_timestamp) {
+            delete queue[update.video_path];
+        }
+    });
+    writeProgressQueue(queue);
+}
+
 function togglePlay() {
     if (videoPlayer.paused) {
         videoPlayer.play();
@@ -525,18 +948,21 @@ function changeVolume() {
     }
 }
 
-async function refreshVideos() {
+async function refreshVideos(rebuild = false) {
     if (!selectedFolder) {
         alert('Please select a folder first');
         return;
     }
     
     try {
-        const response = await fetch('/api/videos');
+        // Shift+click on Refresh forces a full rebuild of the library index
+        const response = await fetch(`/api/videos?limit=${PAGE_SIZE}&format=columns` + (rebuild ? '&rebuild=1' : ''));
         const data = await response.json();
         
-        videos = data.videos;
+        videos = decodeVideos(data.videos);
+        updateVideoCount(data.count);
         renderVideoList();
+        loadRemainingVideos(data.next_cursor);
         
     } catch (error) {
         console.error('Error refreshing videos:', error);
@@ -568,9 +994,20 @@ function formatTime(seconds) {
 }
 
 // Save progress when leaving page
-window.addEventListener('beforeunload', () => {
+function saveProgressOnLeave() {
     if (currentVideoPath && videoPlayer.currentTime > 0) {
         saveProgress();
     }
+    flushProgressQueue(true);
+}
+
+window.addEventListener('pagehide', saveProgressOnLeave);
+document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') {
+        saveProgressOnLeave();
+    }
 });
 
+// Send what was queued while offline as soon as the link is back
+window.addEventListener('online', () => flushProgressQueue());
+
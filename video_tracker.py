@@ -1,12 +1,395 @@
 import sqlite3
 import os
+import queue
+import stat
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple, Optional
+
+from metrics import (DB_BUSY_TIMEOUTS, DB_BUSY_WAITS, DB_COMMITS, DB_FLUSH_RETRIES, DB_LOCK_WAIT,
+                     SCAN_DURATION, SCAN_FILES)
+
+# SQLite tuning, overridable from the environment like DB_PATH
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '5.0'))
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL').upper()
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_STATEMENT_CACHE = 128
+
+# Write-behind buffering of progress saves; an interval of 0 writes through.
+# The buffer is per process, so processes sharing a database (several
+# serve.py workers) must write through for their saves to be seen by the others
+PROGRESS_FLUSH_INTERVAL = float(os.getenv('PROGRESS_FLUSH_INTERVAL', '5.0'))
+PROGRESS_FLUSH_SIZE = int(os.getenv('PROGRESS_FLUSH_SIZE', '256'))
+
+# Largest position or duration accepted, in ms (about 31 years); keeps
+# every buffered value within SQLite's 64-bit integers
+MAX_PROGRESS_MS = 10 ** 12
+
+# Paths per IN (...) query; stays well under SQLITE_MAX_VARIABLE_NUMBER
+BULK_CHUNK_SIZE = 500
+
+# Share of a video that counts as completed (folder stats, clear completed)
+COMPLETED_THRESHOLD = 0.95
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# Taking the write lock normally costs microseconds; longer means SQLite's
+# busy handler had to sleep and retry (its first sleep is 1 ms)
+DB_BUSY_WAIT_SECONDS = 0.001
+
+# Extension points for on-demand profiling (see profiling.py), empty unless
+# it is enabled: called with every new connection, and with
+# (scan, root_folder, seconds, count) after every library walk
+CONNECTION_HOOKS: List[Callable[[sqlite3.Connection], None]] = []
+SCAN_HOOKS: List[Callable[[str, str, float, int], None]] = []
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm')
+
+# Concurrent directory listings while crawling; 1 walks sequentially
+SCAN_WORKERS = int(os.getenv('SCAN_WORKERS', '8'))
+
+# Which directories a library scan descends into. Followed symlinks are
+# indexed once, under the smallest path that reaches them
+SCAN_FOLLOW_SYMLINKS = os.getenv('SCAN_FOLLOW_SYMLINKS', 'off').lower() == 'on'
+SCAN_INCLUDE_HIDDEN = os.getenv('SCAN_INCLUDE_HIDDEN', 'on').lower() == 'on'
+SCAN_MAX_DEPTH = int(os.getenv('SCAN_MAX_DEPTH')) if os.getenv('SCAN_MAX_DEPTH') else None
+
+# Directories modified this recently are re-listed on the next scan, since a
+# file added within the same mtime tick would not change the stored mtime
+MTIME_SETTLE_SECONDS = 2.0
+
+def _prefix_range(folder_path: str) -> Tuple[str, str]:
+    """Bounds of the paths under a folder: prefix <= path < upper"""
+    # Everything under "<folder>/" sorts between "<folder>/" and "<folder>0"
+    prefix = os.path.join(folder_path, '')
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def _split_path(file_path: str) -> Tuple[str, str]:
+    """(folder, file name) of a video path, as stored in folders/video_progress"""
+    return os.path.split(file_path)
+
+def _check_progress_update(file_path, position, duration, updated_at=None):
+    """Raise ValueError unless a progress save can be buffered and written"""
+    if not isinstance(file_path, str) or not file_path:
+        raise ValueError(f"Invalid video path: {file_path!r}")
+    checks = (('position', position, MAX_PROGRESS_MS), ('duration', duration, MAX_PROGRESS_MS),
+              ('updated_at', updated_at, 2 ** 63 - 1))
+    for name, value, limit in checks:
+        if value is None and name != 'position':
+            continue
+        if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= limit:
+            raise ValueError(f"Invalid {name}: {value!r}")
+
+def _spread_to_ancestors(deltas: Dict[str, int]) -> List[Tuple[int, str]]:
+    """(delta, dir_path) updates of library_dirs.video_count for changes in directories' own videos
+    
+    A directory's change counts for it and for every directory above it.
+    """
+    totals = {}
+    for dir_path, delta in deltas.items():
+        while delta:
+            totals[dir_path] = totals.get(dir_path, 0) + delta
+            parent = os.path.dirname(dir_path)
+            if parent == dir_path:
+                break
+            dir_path = parent
+    return [(delta, dir_path) for dir_path, delta in totals.items() if delta]
+
+def _group_by_folder(file_paths: Iterable[str]) -> Dict[str, List[str]]:
+    """File names grouped by their folder"""
+    groups = {}
+    for file_path in file_paths:
+        folder, name = _split_path(file_path)
+        groups.setdefault(folder, []).append(name)
+    return groups
+
+def _completed_sql(row: str = '', threshold: float = COMPLETED_THRESHOLD) -> str:
+    """SQL condition for a progress row that counts as completed
+    
+    The one definition used by the folder totals, clear_completed_videos and
+    the partial index behind it. The threshold is written out as a literal,
+    since SQLite only uses a partial index when the query repeats its
+    condition exactly.
+    """
+    prefix = f'{row}.' if row else ''
+    return f"({prefix}duration IS NOT NULL AND {prefix}last_position >= {prefix}duration * {float(threshold)!r})"
+
+def _folder_stats_terms(row: str) -> Tuple[str, str, str]:
+    """SQL for one progress row's (completed, in progress, watched ms) contribution"""
+    completed = _completed_sql(row)
+    in_progress = f"({row}.last_position > 0 AND NOT {completed})"
+    watched = f"MIN({row}.last_position, COALESCE({row}.duration, {row}.last_position))"
+    return completed, in_progress, watched
+
+def _create_progress_counter_triggers(cursor: sqlite3.Cursor):
+    """Bump the 'progress' change counter on every write to video_progress"""
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS video_progress_{event.lower()}_counter
+            AFTER {event} ON video_progress
+            BEGIN
+                UPDATE change_counters SET value = value + 1 WHERE name = 'progress';
+            END
+        """)
+
+def _migration_1_progress(cursor: sqlite3.Cursor):
+    """Progress keyed by full path, with remarks and last-writer-wins timestamps"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS video_progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT UNIQUE NOT NULL,
+            last_position INTEGER NOT NULL,
+            duration INTEGER,
+            last_watched TEXT DEFAULT CURRENT_TIMESTAMP,
+            watch_count INTEGER DEFAULT 1,
+            remarks TEXT,
+            updated_at INTEGER
+        )
+    """)
+    
+    # Databases from before versioning may lack the later columns
+    columns = [column[1] for column in cursor.execute("PRAGMA table_info(video_progress)")]
+    if 'file_path' in columns:
+        if 'remarks' not in columns:
+            cursor.execute("ALTER TABLE video_progress ADD COLUMN remarks TEXT")
+        if 'updated_at' not in columns:
+            cursor.execute("ALTER TABLE video_progress ADD COLUMN updated_at INTEGER")
+
+def _migration_2_settings(cursor: sqlite3.Cursor):
+    """Last opened folder and folder history"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS folder_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folder_path TEXT UNIQUE NOT NULL,
+            folder_name TEXT NOT NULL,
+            last_accessed TEXT DEFAULT CURRENT_TIMESTAMP,
+            access_count INTEGER DEFAULT 1
+        )
+    """)
+
+def _migration_3_library(cursor: sqlite3.Cursor):
+    """Persistent library index: scanned directories (with mtime) and their videos"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS library_dirs (
+            dir_path TEXT PRIMARY KEY,
+            parent_path TEXT,
+            mtime_ns INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS library_files (
+            file_path TEXT PRIMARY KEY,
+            dir_path TEXT NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_library_dirs_parent ON library_dirs(parent_path)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_library_files_dir ON library_files(dir_path)")
+
+def _migration_4_change_counters(cursor: sqlite3.Cursor):
+    """Change counters for cache validators, shared by every process"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO change_counters (name, value)
+        VALUES ('progress', 0), ('library', 0), ('metadata', 0)
+    """)
+    _create_progress_counter_triggers(cursor)
+
+def _migration_5_media_metadata(cursor: sqlite3.Cursor):
+    """Probed container metadata; size and mtime tell whether the file changed"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS media_metadata (
+            file_path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            duration INTEGER,
+            width INTEGER,
+            height INTEGER,
+            codec TEXT
+        )
+    """)
+
+def _migration_6_event_log(cursor: sqlite3.Cursor):
+    """Recent server-sent events, relayed between worker processes"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS event_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+
+def _migration_7_folders(cursor: sqlite3.Cursor) -> bool:
+    """Split progress paths into a folders table plus file names, with folder totals"""
+    columns = [column[1] for column in cursor.execute("PRAGMA table_info(video_progress)")]
+    legacy = 'file_path' in columns
+    if legacy:
+        # Its triggers are recreated for the new table below
+        triggers = cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'video_progress'"
+        ).fetchall()
+        for (trigger,) in triggers:
+            cursor.execute(f"DROP TRIGGER {trigger}")
+        cursor.execute("DROP TABLE IF EXISTS folder_stats")
+        
+        # A new database gets an empty path-keyed table from migration 1;
+        # there is nothing to copy or compact then
+        legacy = cursor.execute("SELECT EXISTS (SELECT 1 FROM video_progress)").fetchone()[0]
+        if legacy:
+            cursor.execute("ALTER TABLE video_progress RENAME TO video_progress_legacy")
+        else:
+            cursor.execute("DROP TABLE video_progress")
+    
+    # Each directory is stored once; its row also carries the directory's
+    # progress totals, kept current by the triggers below
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS folders (
+            id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            video_count INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0,
+            in_progress_count INTEGER NOT NULL DEFAULT 0,
+            watched_ms INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    
+    # Progress keyed by (folder, file name). Without a rowid the primary
+    # key b-tree is the table, so a folder's rows are one range scan that
+    # needs no lookups.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS video_progress (
+            folder_id INTEGER NOT NULL REFERENCES folders(id),
+            name TEXT NOT NULL,
+            last_position INTEGER NOT NULL,
+            duration INTEGER,
+            last_watched TEXT DEFAULT CURRENT_TIMESTAMP,
+            watch_count INTEGER DEFAULT 1,
+            remarks TEXT,
+            updated_at INTEGER,
+            PRIMARY KEY (folder_id, name)
+        ) WITHOUT ROWID
+    """)
+    # Covering index for recently watched videos (completed ones get a
+    # partial index in migration 8)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_video_progress_watched
+        ON video_progress(last_watched, last_position, duration)
+    """)
+    
+    new_completed, new_in_progress, new_watched = _folder_stats_terms('NEW')
+    old_completed, old_in_progress, old_watched = _folder_stats_terms('OLD')
+    add_new = f"""
+        UPDATE folders SET
+            video_count = video_count + 1,
+            completed_count = completed_count + {new_completed},
+            in_progress_count = in_progress_count + {new_in_progress},
+            watched_ms = watched_ms + {new_watched}
+        WHERE id = NEW.folder_id;
+    """
+    remove_old = f"""
+        UPDATE folders SET
+            video_count = video_count - 1,
+            completed_count = completed_count - {old_completed},
+            in_progress_count = in_progress_count - {old_in_progress},
+            watched_ms = watched_ms - {old_watched}
+        WHERE id = OLD.folder_id;
+    """
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS video_progress_insert_stats
+        AFTER INSERT ON video_progress
+        BEGIN {add_new} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS video_progress_update_stats
+        AFTER UPDATE OF last_position, duration ON video_progress
+        BEGIN {remove_old} {add_new} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS video_progress_delete_stats
+        AFTER DELETE ON video_progress
+        BEGIN {remove_old} END
+    """)
+    _create_progress_counter_triggers(cursor)
+    
+    if not legacy:
+        return False
+    
+    rows = cursor.execute("""
+        SELECT file_path, last_position, duration, last_watched, watch_count, remarks, updated_at
+        FROM video_progress_legacy
+    """).fetchall()
+    split_rows = [_split_path(row[0]) + tuple(row[1:]) for row in rows]
+    cursor.executemany("INSERT OR IGNORE INTO folders (path) VALUES (?)",
+                       {(row[0],) for row in split_rows})
+    cursor.executemany("""
+        INSERT OR IGNORE INTO video_progress
+            (folder_id, name, last_position, duration, last_watched, watch_count, remarks, updated_at)
+        VALUES ((SELECT id FROM folders WHERE path = ?), ?, ?, ?, ?, ?, ?, ?)
+    """, split_rows)
+    cursor.execute("DROP TABLE video_progress_legacy")
+    return True  # Give back the space of the old table and its path index
+
+def _migration_8_completed_index(cursor: sqlite3.Cursor):
+    """Partial index of completed videos, on the same condition as the folder totals"""
+    cursor.execute("DROP INDEX IF EXISTS idx_video_progress_completion")
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_video_progress_completed
+        ON video_progress(folder_id, name)
+        WHERE {_completed_sql()}
+    """)
+
+def _migration_9_library_counts(cursor: sqlite3.Cursor):
+    """Indexed videos under each library directory, kept current by library scans"""
+    columns = [column[1] for column in cursor.execute("PRAGMA table_info(library_dirs)")]
+    if 'video_count' not in columns:
+        cursor.execute("ALTER TABLE library_dirs ADD COLUMN video_count INTEGER NOT NULL DEFAULT 0")
+    
+    dir_paths = [row[0] for row in cursor.execute("SELECT dir_path FROM library_dirs").fetchall()]
+    for dir_path in dir_paths:
+        prefix, upper = _prefix_range(dir_path)
+        cursor.execute("""
+            UPDATE library_dirs SET video_count = (
+                SELECT COUNT(*) FROM library_files WHERE file_path > ? AND file_path < ?
+            ) WHERE dir_path = ?
+        """, (prefix, upper, dir_path))
+
+# Schema migrations, applied in order. PRAGMA user_version records how many
+# have run. Each one must also cope with a database from before versioning
+# (user_version 0), which may already have some of its tables. A migration
+# returns True to have the database compacted once all have run.
+MIGRATIONS = [
+    _migration_1_progress,
+    _migration_2_settings,
+    _migration_3_library,
+    _migration_4_change_counters,
+    _migration_5_media_metadata,
+    _migration_6_event_log,
+    _migration_7_folders,
+    _migration_8_completed_index,
+    _migration_9_library_counts,
+]
 
 class VideoTracker:
     """Handles database operations for tracking video progress"""
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, pool_size: int = None,
+                 flush_interval: float = None, flush_size: int = None):
         # Use environment variable or default path
         if db_path is None:
             db_path = os.getenv('DB_PATH', 'video_progress.db')
@@ -18,216 +401,399 @@ class VideoTracker:
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
         
+        # Idle long-lived connections, shared by the Flask request threads
+        # and the desktop updater thread. A connection is only ever used by
+        # the thread that checked it out.
+        self._pool = queue.LifoQueue(maxsize=pool_size or DB_POOL_SIZE)
+        self._pool_lock = threading.Lock()
+        self._closed = False
+        
+        # Pending progress saves: file_path -> (position, duration, saves).
+        # Only the latest position per file is kept until the next flush.
+        # Reads through this tracker merge them in; other processes can't
+        # see them until then.
+        self.flush_interval = PROGRESS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.flush_size = flush_size or PROGRESS_FLUSH_SIZE
+        self._pending = {}
+        self._pending_seq = 0
+        self._instance_id = os.urandom(4).hex()
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_flushing = threading.Event()
+        self._flush_thread = None
+        
         self.init_database()
+        
+        if self.flush_interval > 0:
+            self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flush_thread.start()
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        """Open a tuned connection (WAL, synchronous level, busy timeout)"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE
+        )
+        
+        synchronous = DB_SYNCHRONOUS if DB_SYNCHRONOUS in SYNCHRONOUS_LEVELS else 'NORMAL'
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+        conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}")
+        
+        for hook in CONNECTION_HOOKS:
+            hook(conn)
+        return conn
+    
+    @contextmanager
+    def _connection(self):
+        """Check a connection out of the pool for the duration of a block"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("VideoTracker has been closed")
+        
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open_connection()
+        
+        try:
+            yield conn
+        finally:
+            with self._pool_lock:
+                if self._closed:
+                    conn.close()
+                else:
+                    try:
+                        self._pool.put_nowait(conn)
+                    except queue.Full:
+                        conn.close()
+    
+    @contextmanager
+    def _transaction(self):
+        """Check out a connection and commit (or roll back) when the block ends
+        
+        The write lock is taken up front (BEGIN IMMEDIATE), so waiting for
+        another writer goes through the busy timeout instead of failing when
+        a read turns into a write, and the wait can be measured.
+        """
+        with self._connection() as conn:
+            start = time.perf_counter()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError as e:
+                if 'locked' in str(e):
+                    DB_BUSY_TIMEOUTS.inc()
+                raise
+            waited = time.perf_counter() - start
+            DB_LOCK_WAIT.observe(waited)
+            if waited > DB_BUSY_WAIT_SECONDS:
+                DB_BUSY_WAITS.inc()
+            
+            with conn:
+                yield conn
+            DB_COMMITS.inc()
+    
+    def close(self):
+        """Flush pending progress and close all pooled connections"""
+        self._stop_flushing.set()
+        if self._flush_thread and self._flush_thread is not threading.current_thread():
+            self._flush_thread.join()
+        if not self._closed:
+            self.flush_progress()
+        
+        # Connections that are checked out close when they are released
+        with self._pool_lock:
+            self._closed = True
+            while True:
+                try:
+                    conn = self._pool.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
     
     def init_database(self):
-        """Initialize the database and create tables if they don't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Bring the database schema up to date (see MIGRATIONS)"""
+        with self._connection() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+                return
+            
+            compact = False
+            with conn:
+                # Take the write lock up front so worker processes starting
+                # together apply each migration exactly once
+                conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.cursor()
+                version = cursor.execute("PRAGMA user_version").fetchone()[0]
+                for migration in MIGRATIONS[version:]:
+                    compact = migration(cursor) or compact
+                cursor.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+            
+            if compact:
+                conn.execute("VACUUM")
+    
+    def save_progress(self, file_path: str, position: int, duration: int = None, flush: bool = False,
+                      updated_at: int = None):
+        """Save or update video progress
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS video_progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_path TEXT UNIQUE NOT NULL,
-                last_position INTEGER NOT NULL,
-                duration INTEGER,
-                last_watched TEXT DEFAULT CURRENT_TIMESTAMP,
-                watch_count INTEGER DEFAULT 1,
-                remarks TEXT
-            )
-        """)
+        Saves are buffered and written in batches by flush_progress(). Pass
+        flush=True on stop/pause so the position is persisted right away.
+        updated_at (ms since epoch, default now) orders conflicting saves:
+        an older save never overwrites a newer one.
+        """
+        self.save_progress_many([(file_path, position, duration, updated_at)], flush=flush)
+    
+    def save_progress_many(self, updates: Iterable[Tuple[str, int, Optional[int], Optional[int]]],
+                           flush: bool = False):
+        """Buffer many (file_path, position, duration, updated_at) saves at once
         
-        # Migrate existing database: add remarks column if it doesn't exist
-        cursor.execute("PRAGMA table_info(video_progress)")
-        columns = [column[1] for column in cursor.fetchall()]
+        Updates are applied last-writer-wins by updated_at and, when flushed,
+        written in a single transaction. Raises ValueError, before buffering
+        anything, if an update isn't a path with in-range integer values.
+        """
+        now = int(time.time() * 1000)
+        updates = list(updates)
+        for update in updates:
+            _check_progress_update(*update)
         
-        if 'remarks' not in columns:
-            cursor.execute("ALTER TABLE video_progress ADD COLUMN remarks TEXT")
+        with self._pending_lock:
+            for file_path, position, duration, updated_at in updates:
+                updated_at = updated_at if updated_at is not None else now
+                pending = self._pending.get(file_path)
+                if pending:
+                    if updated_at < pending[3]:
+                        continue  # Superseded by a newer buffered save
+                    duration = duration if duration is not None else pending[1]
+                    saves = pending[2] + 1
+                else:
+                    saves = 1
+                self._pending[file_path] = (position, duration, saves, updated_at)
+            self._pending_seq += 1
+            pending_count = len(self._pending)
         
-        conn.commit()
-        conn.close()
+        if flush or self.flush_interval <= 0 or pending_count >= self.flush_size:
+            self.flush_progress()
+    
+    def flush_progress(self):
+        """Write all buffered progress saves in a single transaction"""
+        with self._flush_lock:
+            with self._pending_lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+            
+            try:
+                rows = [_split_path(path) + (position, duration, saves, updated_at)
+                        for path, (position, duration, saves, updated_at) in batch.items()]
+                with self._transaction() as conn:
+                    conn.executemany("INSERT OR IGNORE INTO folders (path) VALUES (?)",
+                                     {(row[0],) for row in rows})
+                    # Rows with a newer updated_at (e.g. from another device
+                    # or process) are left alone
+                    conn.executemany("""
+                        INSERT INTO video_progress (folder_id, name, last_position, duration, watch_count, updated_at)
+                        VALUES ((SELECT id FROM folders WHERE path = ?), ?, ?, ?, ?, ?)
+                        ON CONFLICT(folder_id, name) DO UPDATE SET
+                            last_position = excluded.last_position,
+                            duration = COALESCE(excluded.duration, duration),
+                            last_watched = CURRENT_TIMESTAMP,
+                            watch_count = watch_count + excluded.watch_count,
+                            updated_at = excluded.updated_at
+                        WHERE updated_at IS NULL OR excluded.updated_at >= updated_at
+                    """, rows)
+            except Exception:
+                # Put the batch back unless a newer save superseded an entry
+                with self._pending_lock:
+                    for path, entry in batch.items():
+                        self._pending.setdefault(path, entry)
+                raise
     
-    def save_progress(self, file_path: str, position: int, duration: int = None):
-        """Save or update video progress"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _flush_loop(self):
+        """Background thread: flush buffered saves every flush_interval seconds"""
+        while not self._stop_flushing.wait(self.flush_interval):
+            try:
+                self.flush_progress()
+            except Exception:
+                DB_FLUSH_RETRIES.inc()  # Entries were re-queued; retry on the next tick
+    
+    def _merge_pending(self, file_path: str, row):
+        """Overlay a buffered save on a (position, duration, remarks) row"""
+        pending = self._pending.get(file_path)
+        if pending is None:
+            return row
         
-        cursor.execute("""
-            INSERT INTO video_progress (file_path, last_position, duration, watch_count)
-            VALUES (?, ?, ?, 1)
-            ON CONFLICT(file_path) DO UPDATE SET
-                last_position = ?,
-                duration = COALESCE(?, duration),
-                last_watched = CURRENT_TIMESTAMP,
-                watch_count = watch_count + 1
-        """, (file_path, position, duration, position, duration))
-        
-        conn.commit()
-        conn.close()
+        position, duration = pending[:2]
+        if row:
+            return (position, duration if duration is not None else row[1], row[2])
+        return (position, duration, None)
     
     def get_progress(self, file_path: str) -> Optional[Tuple[int, int, str]]:
         """Get saved progress for a video (position, duration, remarks)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT last_position, duration, remarks FROM video_progress
-            WHERE file_path = ?
-        """, (file_path,))
-        
-        result = cursor.fetchone()
-        conn.close()
+        with self._connection() as conn:
+            result = conn.execute("""
+                SELECT last_position, duration, remarks FROM video_progress
+                WHERE folder_id = (SELECT id FROM folders WHERE path = ?) AND name = ?
+            """, _split_path(file_path)).fetchone()
         
+        result = self._merge_pending(file_path, result)
         return result if result else None
     
-    def get_all_videos_with_progress(self) -> List[Tuple[str, int, int, str]]:
-        """Get all videos with their progress"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_progress_many(self, file_paths: Iterable[str]) -> Dict[str, Tuple[int, int, str]]:
+        """Get saved progress for many videos at once, keyed by path"""
+        file_paths = list(file_paths)
+        results = {}
         
-        cursor.execute("""
-            SELECT file_path, last_position, duration, last_watched
-            FROM video_progress
-            ORDER BY last_watched DESC
-        """)
+        # Listings are mostly a few folders: one primary key probe per name
+        with self._connection() as conn:
+            for folder, names in _group_by_folder(file_paths).items():
+                for start in range(0, len(names), BULK_CHUNK_SIZE):
+                    chunk = names[start:start + BULK_CHUNK_SIZE]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = conn.execute(f"""
+                        SELECT name, last_position, duration, remarks FROM video_progress
+                        WHERE folder_id = (SELECT id FROM folders WHERE path = ?) AND name IN ({placeholders})
+                    """, [folder] + chunk)
+                    for row in rows:
+                        results[os.path.join(folder, row[0])] = row[1:]
         
-        results = cursor.fetchall()
-        conn.close()
+        with self._pending_lock:
+            for path in file_paths:
+                if path in self._pending:
+                    results[path] = self._merge_pending(path, results.get(path))
         
         return results
     
-    def clear_completed_videos(self, threshold: float = 0.95):
-        """Remove videos that are 95% or more completed"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_progress_for_folder(self, folder_path: str) -> Dict[str, Tuple[int, int, str]]:
+        """Get saved progress for every tracked video under a folder, keyed by path"""
+        # A range scan on folders, then one on video_progress per folder
+        folder_path = os.path.normpath(folder_path)
+        prefix, upper = _prefix_range(folder_path)
         
-        cursor.execute("""
-            DELETE FROM video_progress
-            WHERE duration IS NOT NULL 
-            AND last_position >= duration * ?
-        """, (threshold,))
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT f.path, p.name, p.last_position, p.duration, p.remarks
+                FROM folders f JOIN video_progress p ON p.folder_id = f.id
+                WHERE f.path = ? OR (f.path >= ? AND f.path < ?)
+            """, (folder_path, prefix, upper))
+            results = {os.path.join(row[0], row[1]): row[2:] for row in rows}
+        
+        with self._pending_lock:
+            for path in self._pending:
+                if prefix <= path < upper:
+                    results[path] = self._merge_pending(path, results.get(path))
+        
+        return results
+    
+    def get_all_videos_with_progress(self) -> List[Tuple[str, int, int, str]]:
+        """Get all videos with their progress"""
+        self.flush_progress()
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT f.path, p.name, p.last_position, p.duration, p.last_watched
+                FROM video_progress p JOIN folders f ON f.id = p.folder_id
+                ORDER BY p.last_watched DESC
+            """).fetchall()
+        return [(os.path.join(row[0], row[1]),) + row[2:] for row in rows]
+    
+    def clear_completed_videos(self, threshold: float = COMPLETED_THRESHOLD):
+        """Remove videos that are 95% or more completed (as counted by the folder totals)"""
+        self.flush_progress()
+        with self._transaction() as conn:
+            # With the default threshold this matches idx_video_progress_completed
+            conn.execute(f"DELETE FROM video_progress WHERE {_completed_sql(threshold=threshold)}")
+    
+    def get_folder_stats(self, folder_path: str) -> Dict[str, int]:
+        """Progress totals for a folder and its subfolders (as of the last flush)
         
-        conn.commit()
-        conn.close()
+        Returns video_count (tracked videos), completed_count,
+        in_progress_count and watched_ms.
+        """
+        return self.get_folder_stats_many([folder_path])[folder_path]
+    
+    def get_folder_stats_many(self, folder_paths: Iterable[str]) -> Dict[str, Dict[str, int]]:
+        """Progress totals for several folders, keyed by folder"""
+        results = {}
+        with self._connection() as conn:
+            for folder_path in folder_paths:
+                prefix, upper = _prefix_range(os.path.normpath(folder_path))
+                row = conn.execute("""
+                    SELECT COALESCE(SUM(video_count), 0), COALESCE(SUM(completed_count), 0),
+                           COALESCE(SUM(in_progress_count), 0), COALESCE(SUM(watched_ms), 0)
+                    FROM folders
+                    WHERE path = ? OR (path >= ? AND path < ?)
+                """, (os.path.normpath(folder_path), prefix, upper)).fetchone()
+                results[folder_path] = dict(zip(
+                    ('video_count', 'completed_count', 'in_progress_count', 'watched_ms'), row
+                ))
+        return results
     
     def delete_progress(self, file_path: str):
         """Delete progress for a specific video"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM video_progress WHERE file_path = ?", (file_path,))
-        
-        conn.commit()
-        conn.close()
+        # Hold the flush lock so an in-flight batch can't re-insert the row
+        with self._flush_lock:
+            with self._pending_lock:
+                self._pending.pop(file_path, None)
+            with self._transaction() as conn:
+                conn.execute("""
+                    DELETE FROM video_progress
+                    WHERE folder_id = (SELECT id FROM folders WHERE path = ?) AND name = ?
+                """, _split_path(file_path))
     
     def save_last_folder(self, folder_path: str):
         """Save the last opened folder"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create settings table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT NOT NULL,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            INSERT INTO settings (key, value)
-            VALUES ('last_folder', ?)
-            ON CONFLICT(key) DO UPDATE SET
-                value = ?,
-                updated_at = CURRENT_TIMESTAMP
-        """, (folder_path, folder_path))
-        
-        conn.commit()
-        conn.close()
-    
-    def get_last_folder(self) -> Optional[str]:
-        """Get the last opened folder"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create settings table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT NOT NULL,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("SELECT value FROM settings WHERE key = 'last_folder'")
-        result = cursor.fetchone()
+        with self._transaction() as conn:
+            conn.execute("""
+                INSERT INTO settings (key, value)
+                VALUES ('last_folder', ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = ?,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (folder_path, folder_path))
+    
+    def get_last_folder(self, check_exists: bool = True) -> Optional[str]:
+        """Get the last opened folder
         
-        conn.close()
+        With check_exists=False the folder is returned without touching the
+        filesystem, for callers that check it themselves.
+        """
+        with self._connection() as conn:
+            result = conn.execute("SELECT value FROM settings WHERE key = 'last_folder'").fetchone()
         
-        if result and os.path.exists(result[0]):
+        if result and (not check_exists or os.path.exists(result[0])):
             return result[0]
         return None
     
     def add_folder_to_history(self, folder_path: str):
         """Add folder to history"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create folder_history table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS folder_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                folder_path TEXT UNIQUE NOT NULL,
-                folder_name TEXT NOT NULL,
-                last_accessed TEXT DEFAULT CURRENT_TIMESTAMP,
-                access_count INTEGER DEFAULT 1
-            )
-        """)
-        
         folder_name = os.path.basename(folder_path)
         
-        cursor.execute("""
-            INSERT INTO folder_history (folder_path, folder_name)
-            VALUES (?, ?)
-            ON CONFLICT(folder_path) DO UPDATE SET
-                last_accessed = CURRENT_TIMESTAMP,
-                access_count = access_count + 1
-        """, (folder_path, folder_name))
-        
-        conn.commit()
-        conn.close()
-    
-    def get_folder_history(self, limit: int = 20):
-        """Get folder history, ordered by last accessed"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS folder_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                folder_path TEXT UNIQUE NOT NULL,
-                folder_name TEXT NOT NULL,
-                last_accessed TEXT DEFAULT CURRENT_TIMESTAMP,
-                access_count INTEGER DEFAULT 1
-            )
-        """)
-        
-        cursor.execute("""
-            SELECT folder_path, folder_name, last_accessed, access_count
-            FROM folder_history
-            WHERE folder_path IS NOT NULL
-            ORDER BY last_accessed DESC
-            LIMIT ?
-        """, (limit,))
+        with self._transaction() as conn:
+            conn.execute("""
+                INSERT INTO folder_history (folder_path, folder_name)
+                VALUES (?, ?)
+                ON CONFLICT(folder_path) DO UPDATE SET
+                    last_accessed = CURRENT_TIMESTAMP,
+                    access_count = access_count + 1
+            """, (folder_path, folder_name))
+    
+    def get_folder_history(self, limit: int = 20, check_exists: bool = True):
+        """Get folder history, ordered by last accessed
         
-        results = cursor.fetchall()
-        conn.close()
+        Folders that no longer exist are left out unless check_exists=False.
+        """
+        with self._connection() as conn:
+            results = conn.execute("""
+                SELECT folder_path, folder_name, last_accessed, access_count
+                FROM folder_history
+                WHERE folder_path IS NOT NULL
+                ORDER BY last_accessed DESC
+                LIMIT ?
+            """, (limit,)).fetchall()
         
         # Filter out folders that no longer exist
         valid_results = []
         for result in results:
-            if os.path.exists(result[0]):
+            if not check_exists or os.path.exists(result[0]):
                 valid_results.append({
                     'path': result[0],
                     'name': result[1],
@@ -239,49 +805,557 @@ class VideoTracker:
     
     def remove_folder_from_history(self, folder_path: str):
         """Remove folder from history"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM folder_history WHERE folder_path = ?", (folder_path,))
-        
-        conn.commit()
-        conn.close()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM folder_history WHERE folder_path = ?", (folder_path,))
     
     def save_remark(self, file_path: str, remark: str):
         """Save or update a remark for a video"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO video_progress (file_path, last_position, remarks)
-            VALUES (?, 0, ?)
-            ON CONFLICT(file_path) DO UPDATE SET
-                remarks = ?
-        """, (file_path, remark, remark))
-        
-        conn.commit()
-        conn.close()
+        folder, name = _split_path(file_path)
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO folders (path) VALUES (?)", (folder,))
+            conn.execute("""
+                INSERT INTO video_progress (folder_id, name, last_position, remarks)
+                VALUES ((SELECT id FROM folders WHERE path = ?), ?, 0, ?)
+                ON CONFLICT(folder_id, name) DO UPDATE SET
+                    remarks = ?
+            """, (folder, name, remark, remark))
     
     def get_remark(self, file_path: str) -> Optional[str]:
         """Get remark for a video"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._connection() as conn:
+            result = conn.execute("""
+                SELECT remarks FROM video_progress
+                WHERE folder_id = (SELECT id FROM folders WHERE path = ?) AND name = ?
+            """, _split_path(file_path)).fetchone()
         
-        cursor.execute("SELECT remarks FROM video_progress WHERE file_path = ?", (file_path,))
-        result = cursor.fetchone()
+        return result[0] if result and result[0] else None
+    
+    def scan_library(self, root_folder: str, rebuild: bool = False,
+                     extensions: tuple = VIDEO_EXTENSIONS) -> List[str]:
+        """Bring the library index for a folder up to date and return its videos"""
+        self.refresh_library(root_folder, rebuild, extensions)
+        return self.get_indexed_videos(root_folder)
+    
+    def refresh_library(self, root_folder: str, rebuild: bool = False,
+                        extensions: tuple = VIDEO_EXTENSIONS,
+                        shallow: bool = False, follow_symlinks: bool = None,
+                        include_hidden: bool = None, max_depth: int = None,
+                        depth_root: str = None) -> Tuple[List[str], List[str]]:
+        """Bring the library index for a folder up to date
         
-        conn.close()
+        Every directory is stat'ed, but only directories whose mtime changed
+        since the last scan are listed again. rebuild=True re-lists them all.
+        shallow=True re-lists just root_folder itself and indexes only its
+        new subdirectories, for callers that know exactly what changed.
         
-        return result[0] if result and result[0] else None
+        follow_symlinks, include_hidden and max_depth default to the SCAN_*
+        settings and work as in crawl_videos(). max_depth counts levels
+        below depth_root (default root_folder), so refreshing a subdirectory
+        of a library keeps the library's limit.
+        
+        Returns the (added, removed) video paths.
+        """
+        started = time.perf_counter()
+        root_folder = os.path.normpath(root_folder)
+        follow_symlinks = SCAN_FOLLOW_SYMLINKS if follow_symlinks is None else follow_symlinks
+        include_hidden = SCAN_INCLUDE_HIDDEN if include_hidden is None else include_hidden
+        max_depth = SCAN_MAX_DEPTH if max_depth is None else max_depth
+        depth_root = root_folder if depth_root is None else os.path.normpath(depth_root)
+        prefix, upper = _prefix_range(root_folder)
+        
+        # Load what we know about this tree, then crawl without holding a
+        # write transaction (the crawl can be slow on network mounts)
+        with self._connection() as conn:
+            known = {}
+            children = {}
+            rows = conn.execute("""
+                SELECT dir_path, parent_path, mtime_ns FROM library_dirs
+                WHERE dir_path = ? OR (dir_path >= ? AND dir_path < ?)
+            """, (root_folder, prefix, upper))
+            for dir_path, parent_path, mtime_ns in rows:
+                known[dir_path] = mtime_ns
+                children.setdefault(parent_path, []).append(dir_path)
+        
+        seen = set()
+        skipped = set()  # Existing subdirectories left alone by a shallow refresh
+        changed = []  # (dir_path, parent_path, mtime_ns, files)
+        inodes = {}  # dir_path -> (st_dev, st_ino), when following symlinks
+        settle_cutoff = time.time_ns() - int(MTIME_SETTLE_SECONDS * 1e9)
+        
+        def visit(dir_path, parent_path, depth, ancestors):
+            if shallow and dir_path != root_folder and dir_path in known:
+                skipped.add(dir_path)
+                return None, ()
+            
+            try:
+                # lstat, so a known subdirectory that became a symlink is
+                # dropped without listing its parent again
+                st = os.stat(dir_path) if follow_symlinks or dir_path == root_folder else os.lstat(dir_path)
+            except OSError:
+                return None, ()
+            if stat.S_ISLNK(st.st_mode):
+                return None, ()
+            if follow_symlinks:
+                key = (st.st_dev, st.st_ino)
+                if key in ancestors:
+                    return None, ()  # A symlink cycle
+                ancestors = ancestors | {key}
+                inodes[dir_path] = key
+            seen.add(dir_path)
+            mtime_ns = st.st_mtime_ns
+            
+            forced = rebuild or (shallow and dir_path == root_folder)
+            if not forced and known.get(dir_path) == mtime_ns:
+                subdirs = children.get(dir_path, ())
+                if not include_hidden:
+                    subdirs = [d for d in subdirs if not os.path.basename(d).startswith('.')]
+                files = None
+            else:
+                listing = _list_directory(dir_path, extensions, follow_symlinks, include_hidden)
+                if listing is None:
+                    return None, ()
+                files, subdirs = listing
+            
+            if max_depth is not None and depth >= max_depth:
+                subdirs = ()
+            child_items = [(subdir, dir_path, depth + 1, ancestors) for subdir in subdirs]
+            if files is None:
+                return None, child_items
+            if mtime_ns > settle_cutoff:
+                mtime_ns = -1  # Too fresh to trust; list it again next time
+            return (dir_path, parent_path, mtime_ns, files), child_items
+        
+        # Stats and listings fan out over the pool; slow mounts overlap
+        walk_started = time.perf_counter()
+        start = (root_folder, os.path.dirname(root_folder), _depth_below(depth_root, root_folder), frozenset())
+        for change in _walk_parallel(start, visit, SCAN_WORKERS):
+            if change:
+                changed.append(change)
+        for hook in SCAN_HOOKS:
+            hook('refresh_library', root_folder, time.perf_counter() - walk_started, len(seen))
+        
+        # A directory reached through several symlinks is indexed under one
+        # path; the rest drop out like deleted directories
+        duplicates = _linked_duplicates(inodes)
+        if duplicates:
+            seen -= duplicates
+            changed = [change for change in changed if change[0] not in duplicates]
+        
+        def is_skipped(dir_path):
+            # Is dir_path a skipped subdirectory, or inside one?
+            while dir_path not in skipped:
+                parent = os.path.dirname(dir_path)
+                if dir_path == root_folder or parent == dir_path:
+                    return False
+                dir_path = parent
+            return True
+        
+        removed_dirs = [d for d in known if d not in seen and not (skipped and is_skipped(d))]
+        added = []
+        removed = []
+        
+        if changed or removed_dirs:
+            own_deltas = {}  # dir_path -> change in its own (not subdirectories') videos
+            with self._transaction() as conn:
+                for dir_path in removed_dirs:
+                    old_files = conn.execute(
+                        "SELECT file_path FROM library_files WHERE dir_path = ?", (dir_path,)
+                    ).fetchall()
+                    removed.extend(row[0] for row in old_files)
+                    own_deltas[dir_path] = -len(old_files)
+                    conn.execute("DELETE FROM library_dirs WHERE dir_path = ?", (dir_path,))
+                    conn.execute("DELETE FROM library_files WHERE dir_path = ?", (dir_path,))
+                
+                for dir_path, parent_path, mtime_ns, files in changed:
+                    conn.execute("""
+                        INSERT INTO library_dirs (dir_path, parent_path, mtime_ns)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT(dir_path) DO UPDATE SET
+                            parent_path = excluded.parent_path,
+                            mtime_ns = excluded.mtime_ns
+                    """, (dir_path, parent_path, mtime_ns))
+                    
+                    old_files = {row[0] for row in conn.execute(
+                        "SELECT file_path FROM library_files WHERE dir_path = ?", (dir_path,)
+                    )}
+                    new_files = set(files)
+                    if old_files == new_files:
+                        continue
+                    
+                    added.extend(new_files - old_files)
+                    removed.extend(old_files - new_files)
+                    own_deltas[dir_path] = len(new_files) - len(old_files)
+                    conn.execute("DELETE FROM library_files WHERE dir_path = ?", (dir_path,))
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO library_files (file_path, dir_path) VALUES (?, ?)",
+                        [(file_path, dir_path) for file_path in files]
+                    )
+                
+                # Every directory row exists by now, so new subdirectories
+                # count towards new parents
+                conn.executemany("UPDATE library_dirs SET video_count = video_count + ? WHERE dir_path = ?",
+                                 _spread_to_ancestors(own_deltas))
+                
+                if added or removed:
+                    conn.execute("UPDATE change_counters SET value = value + 1 WHERE name = 'library'")
+        
+        SCAN_DURATION.labels('refresh_library').observe(time.perf_counter() - started)
+        SCAN_FILES.labels('refresh_library').inc(sum(len(change[3]) for change in changed))
+        return sorted(added), sorted(removed)
+    
+    def remove_library_tree(self, dir_path: str) -> List[str]:
+        """Drop a directory and everything under it from the index
+        
+        Returns the removed video paths.
+        """
+        dir_path = os.path.normpath(dir_path)
+        prefix, upper = _prefix_range(dir_path)
+        
+        with self._transaction() as conn:
+            removed = [row[0] for row in conn.execute("""
+                SELECT file_path FROM library_files
+                WHERE file_path > ? AND file_path < ?
+                ORDER BY file_path
+            """, (prefix, upper))]
+            conn.execute("""
+                DELETE FROM library_dirs
+                WHERE dir_path = ? OR (dir_path > ? AND dir_path < ?)
+            """, (dir_path, prefix, upper))
+            conn.execute("DELETE FROM library_files WHERE file_path > ? AND file_path < ?", (prefix, upper))
+            conn.executemany("UPDATE library_dirs SET video_count = video_count + ? WHERE dir_path = ?",
+                             _spread_to_ancestors({dir_path: -len(removed)}))
+            
+            if removed:
+                conn.execute("UPDATE change_counters SET value = value + 1 WHERE name = 'library'")
+        
+        return removed
+    
+    def get_indexed_dirs(self, root_folder: str) -> List[str]:
+        """Get the indexed directories under a folder, including the folder itself"""
+        root_folder = os.path.normpath(root_folder)
+        prefix, upper = _prefix_range(root_folder)
+        
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT dir_path FROM library_dirs
+                WHERE dir_path = ? OR (dir_path > ? AND dir_path < ?)
+            """, (root_folder, prefix, upper))
+            return [row[0] for row in rows]
+    
+    def explain_query_plan(self, sql: str, params: Iterable = ()) -> List[str]:
+        """SQLite's EXPLAIN QUERY PLAN for a statement, one line per step (indented by depth)"""
+        with self._connection() as conn:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql, tuple(params)).fetchall()
+        
+        depth = {0: -1}
+        lines = []
+        for step_id, parent_id, _, detail in rows:
+            depth[step_id] = depth.get(parent_id, -1) + 1
+            lines.append('  ' * depth[step_id] + detail)
+        return lines
+    
+    def get_change_token(self) -> str:
+        """Token that changes whenever progress, remarks, metadata or the library index change"""
+        with self._connection() as conn:
+            counters = conn.execute("SELECT value FROM change_counters ORDER BY name").fetchall()
+        
+        # Buffered saves aren't in the database yet; they make the token
+        # unique to this process until they are flushed
+        with self._pending_lock:
+            pending = f"{self._instance_id}.{self._pending_seq}" if self._pending else ''
+        
+        return '.'.join(str(row[0]) for row in counters) + f".{pending}"
+    
+    def get_unprobed_videos(self, root_folder: str = None, limit: int = 100) -> List[str]:
+        """Indexed videos (under a folder, or anywhere) that have no media metadata yet"""
+        if root_folder:
+            prefix, upper = _prefix_range(os.path.normpath(root_folder))
+        else:
+            prefix, upper = '', '\U0010ffff'
+        
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT f.file_path FROM library_files f
+                LEFT JOIN media_metadata m ON m.file_path = f.file_path
+                WHERE f.file_path > ? AND f.file_path < ? AND m.file_path IS NULL
+                ORDER BY f.file_path
+                LIMIT ?
+            """, (prefix, upper, limit))
+            return [row[0] for row in rows]
+    
+    def save_media_metadata(self, rows: Iterable[Tuple[str, int, int, Optional[int], Optional[int], Optional[int], Optional[str]]]):
+        """Store probed (file_path, size, mtime_ns, duration, width, height, codec) rows"""
+        with self._transaction() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO media_metadata (file_path, size, mtime_ns, duration, width, height, codec)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.execute("UPDATE change_counters SET value = value + 1 WHERE name = 'metadata'")
+    
+    def delete_media_metadata(self, file_paths: Iterable[str]):
+        """Forget the metadata of files so they are probed again"""
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM media_metadata WHERE file_path = ?", [(path,) for path in file_paths])
+            conn.execute("UPDATE change_counters SET value = value + 1 WHERE name = 'metadata'")
+    
+    def get_media_metadata_many(self, file_paths: Iterable[str]) -> Dict[str, Tuple]:
+        """Get (size, mtime_ns, duration, width, height, codec) for many videos, keyed by path"""
+        file_paths = list(file_paths)
+        results = {}
+        
+        with self._connection() as conn:
+            for start in range(0, len(file_paths), BULK_CHUNK_SIZE):
+                chunk = file_paths[start:start + BULK_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(f"""
+                    SELECT file_path, size, mtime_ns, duration, width, height, codec FROM media_metadata
+                    WHERE file_path IN ({placeholders})
+                """, chunk)
+                for row in rows:
+                    results[row[0]] = row[1:]
+        
+        return results
+    
+    def get_media_metadata_for_folder(self, folder_path: str) -> Dict[str, Tuple]:
+        """Get (size, mtime_ns, duration, width, height, codec) for every probed video under a folder"""
+        prefix, upper = _prefix_range(folder_path)
+        
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT file_path, size, mtime_ns, duration, width, height, codec FROM media_metadata
+                WHERE file_path >= ? AND file_path < ?
+            """, (prefix, upper))
+            return {row[0]: row[1:] for row in rows}
+    
+    def append_event(self, origin: str, event_type: str, data: str):
+        """Record an event (JSON data) for the other processes to relay"""
+        self.append_events(origin, [(event_type, data)])
+    
+    def append_events(self, origin: str, events: Iterable[Tuple[str, str]]):
+        """Record many (event_type, JSON data) events in one transaction"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany("""
+                INSERT INTO event_log (origin, event_type, data, created_at)
+                VALUES (?, ?, ?, ?)
+            """, [(origin, event_type, data, now) for event_type, data in events])
+    
+    def get_events_after(self, last_id: int, limit: int = 1000) -> List[Tuple[int, str, str, str]]:
+        """Get logged events newer than last_id as (id, origin, event_type, data)"""
+        with self._connection() as conn:
+            return conn.execute("""
+                SELECT id, origin, event_type, data FROM event_log
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (last_id, limit)).fetchall()
+    
+    def get_last_event_id(self) -> int:
+        """Id of the newest logged event (0 if there are none)"""
+        with self._connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM event_log").fetchone()[0]
+    
+    def prune_events(self, max_age: float):
+        """Delete logged events older than max_age seconds"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM event_log WHERE created_at < ?", (time.time() - max_age,))
+    
+    def get_indexed_videos(self, root_folder: str, after: str = None, limit: int = None) -> List[str]:
+        """Get the indexed videos under a folder, sorted by path
+        
+        Doesn't touch the filesystem. Pass the last path of the previous
+        page as `after` to page through large folders (keyset pagination).
+        """
+        prefix, upper = _prefix_range(os.path.normpath(root_folder))
+        lower = max(prefix, after) if after else prefix
+        
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT file_path FROM library_files
+                WHERE file_path > ? AND file_path < ?
+                ORDER BY file_path
+                LIMIT ?
+            """, (lower, upper, limit if limit else -1))
+            return [row[0] for row in rows]
+    
+    def count_indexed_videos(self, root_folder: str) -> int:
+        """Count the indexed videos under a folder"""
+        prefix, upper = _prefix_range(os.path.normpath(root_folder))
+        
+        with self._connection() as conn:
+            return conn.execute("""
+                SELECT COUNT(*) FROM library_files
+                WHERE file_path > ? AND file_path < ?
+            """, (prefix, upper)).fetchone()[0]
+    
+    def get_indexed_video_counts(self, dir_paths: Iterable[str]) -> Dict[str, int]:
+        """Indexed videos under each of some directories (those that are indexed)
+        
+        The counts are kept in library_dirs by refresh_library and
+        remove_library_tree, so this is one primary key lookup per directory.
+        """
+        dir_paths = [os.path.normpath(dir_path) for dir_path in dir_paths]
+        counts = {}
+        
+        with self._connection() as conn:
+            for i in range(0, len(dir_paths), BULK_CHUNK_SIZE):
+                chunk = dir_paths[i:i + BULK_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                counts.update(conn.execute(
+                    f"SELECT dir_path, video_count FROM library_dirs WHERE dir_path IN ({placeholders})", chunk
+                ).fetchall())
+        
+        return counts
+
+def _list_directory(dir_path: str, extensions: tuple, follow_symlinks: bool = False,
+                    include_hidden: bool = True) -> Optional[Tuple[List[str], List[str]]]:
+    """List one directory: (video files, subdirectories to descend into)
+    
+    Uses the DirEntry type information, so no extra stat is needed per
+    entry. With the defaults this mirrors os.walk(followlinks=False).
+    Returns None if the directory can't be read.
+    """
+    files = []
+    subdirs = []
+    
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                # Like os.walk, an entry whose type can't be read (e.g. a
+                # broken symlink) is listed as a file
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                
+                if is_dir:
+                    if not include_hidden and entry.name.startswith('.'):
+                        continue
+                    try:
+                        is_symlink = entry.is_symlink()
+                    except OSError:
+                        is_symlink = False
+                    if follow_symlinks or not is_symlink:
+                        subdirs.append(entry.path)
+                elif entry.name.lower().endswith(extensions):
+                    files.append(entry.path)
+    except OSError:
+        return None
+    
+    return files, subdirs
+
+def _depth_below(root_folder: str, dir_path: str) -> int:
+    """How many levels below root_folder a directory is (0 for the root itself)"""
+    if dir_path == root_folder:
+        return 0
+    return os.path.relpath(dir_path, root_folder).count(os.sep) + 1
 
-def find_videos(root_folder: str, extensions: tuple = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm')) -> List[str]:
-    """Recursively find all video files in a folder"""
-    video_files = []
+def _linked_duplicates(inodes: Dict[str, Tuple[int, int]]) -> Set[str]:
+    """Paths to drop so each directory is kept once, under its smallest path
     
-    for root, dirs, files in os.walk(root_folder):
-        for file in files:
-            if file.lower().endswith(extensions):
-                video_files.append(os.path.join(root, file))
+    inodes maps every visited path to its (st_dev, st_ino). Sorting puts a
+    directory before everything under it, so a dropped directory takes its
+    subtree with it and the subtree's real directories are kept elsewhere.
+    """
+    kept = set()
+    dropped = set()
+    for path in sorted(inodes):
+        if os.path.dirname(path) in dropped or inodes[path] in kept:
+            dropped.add(path)
+        else:
+            kept.add(inodes[path])
+    return dropped
+
+def _walk_parallel(start: tuple, visit: Callable, workers: int) -> Iterator:
+    """Walk a tree with visit(*item) -> (result, child_items), yielding results
+    
+    Directories are visited concurrently on a bounded thread pool and
+    results are yielded as soon as each one completes, in no fixed order.
+    """
+    if workers <= 1:
+        stack = [start]
+        while stack:
+            result, child_items = visit(*stack.pop())
+            stack.extend(child_items)
+            yield result
+        return
     
-    return sorted(video_files)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+    try:
+        pending = {pool.submit(visit, *start)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result, child_items = future.result()
+                pending.update(pool.submit(visit, *item) for item in child_items)
+                yield result
+    finally:
+        # Also reached when the caller stops iterating early
+        pool.shutdown(wait=False, cancel_futures=True)
 
+def crawl_videos(root_folder: str, extensions: tuple = VIDEO_EXTENSIONS, workers: int = None,
+                 follow_symlinks: bool = None, include_hidden: bool = None,
+                 max_depth: int = None) -> Iterator[str]:
+    """Stream video files under a folder as they are found (unsorted)
+    
+    workers: concurrent directory listings (default SCAN_WORKERS, 1 = sequential)
+    follow_symlinks: descend into symlinked directories (default SCAN_FOLLOW_SYMLINKS);
+        cycles are skipped and a directory reached through several links is
+        listed once, under its smallest path, so results come after the walk
+    include_hidden: descend into directories whose name starts with '.' (default SCAN_INCLUDE_HIDDEN)
+    max_depth: how many levels below root_folder to descend (default SCAN_MAX_DEPTH, None = unlimited)
+    """
+    workers = SCAN_WORKERS if workers is None else workers
+    follow_symlinks = SCAN_FOLLOW_SYMLINKS if follow_symlinks is None else follow_symlinks
+    include_hidden = SCAN_INCLUDE_HIDDEN if include_hidden is None else include_hidden
+    max_depth = SCAN_MAX_DEPTH if max_depth is None else max_depth
+    
+    def visit(dir_path, depth, ancestors):
+        key = None
+        if follow_symlinks:
+            # Symlinks can form cycles; stop at a directory already on the path
+            try:
+                st = os.stat(dir_path)
+            except OSError:
+                return None, ()
+            key = (st.st_dev, st.st_ino)
+            if key in ancestors:
+                return None, ()
+            ancestors = ancestors | {key}
+        
+        listing = _list_directory(dir_path, extensions, follow_symlinks, include_hidden)
+        if listing is None:
+            return None, ()
+        files, subdirs = listing
+        
+        if max_depth is not None and depth >= max_depth:
+            subdirs = []
+        return (dir_path, key, files), [(subdir, depth + 1, ancestors) for subdir in subdirs]
+    
+    results = _walk_parallel((root_folder, 0, frozenset()), visit, workers)
+    if not follow_symlinks:
+        for result in results:
+            if result:
+                yield from result[2]
+        return
+    
+    listed = {result[0]: result for result in results if result}
+    duplicates = _linked_duplicates({dir_path: result[1] for dir_path, result in listed.items()})
+    for dir_path, result in listed.items():
+        if dir_path not in duplicates:
+            yield from result[2]
+
+def find_videos(root_folder: str, extensions: tuple = VIDEO_EXTENSIONS, **crawl_options) -> List[str]:
+    """Recursively find all video files in a folder
+    
+    Accepts the crawl_videos() options (workers, follow_symlinks,
+    include_hidden, max_depth); the result is always sorted by path.
+    """
+    started = time.perf_counter()
+    videos = sorted(crawl_videos(root_folder, extensions, **crawl_options))
+    elapsed = time.perf_counter() - started
+    SCAN_DURATION.labels('find_videos').observe(elapsed)
+    SCAN_FILES.labels('find_videos').inc(len(videos))
+    for hook in SCAN_HOOKS:
+        hook('find_videos', root_folder, elapsed, len(videos))
+    return videos